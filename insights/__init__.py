@@ -36,7 +36,8 @@ from .core.archives import COMPRESSION_TYPES, extract, InvalidArchive, InvalidCo
 from .core import dr  # noqa: F401
 from .core.context import ClusterArchiveContext, HostContext, HostArchiveContext, SerializedArchiveContext, ExecutionContext  # noqa: F401
 from .core.dr import SkipComponent  # noqa: F401
-from .core.hydration import create_context, initialize_broker  # noqa: F401
+from .core.hydration import (create_archive_context, create_context, get_archive_context,  # noqa: F401
+                              get_include_patterns, initialize_broker)
 from .core.plugins import combiner, fact, metadata, parser, rule  # noqa: F401
 from .core.plugins import datasource, condition, incident  # noqa: F401
 from .core.plugins import make_response, make_metadata, make_fingerprint  # noqa: F401
@@ -45,6 +46,7 @@ from .core.filters import add_filter, apply_filters, get_filters  # noqa: F401
 from .formats import get_formatter
 from .parsers import get_active_lines  # noqa: F401
 from .util import defaults  # noqa: F401
+from .util import mmaplines
 from .formats import Formatter as FormatterClass
 
 from .core.spec_factory import RawFileProvider, TextFileProvider
@@ -71,16 +73,23 @@ def get_nvr():
 def get_pool(parallel, prefix, kwargs):
     """
     Yields:
-        a ThreadPoolExecutor if parallel is True and `concurrent.futures` exists.
-        `None` otherwise.
+        a ProcessPoolExecutor if parallel is "process", a ThreadPoolExecutor
+        if parallel is any other true value, and `None` if parallel is false
+        or `concurrent.futures` doesn't exist.
     """
     if parallel:
         try:
-            from concurrent.futures import ThreadPoolExecutor
-            with ThreadPoolExecutor(thread_name_prefix=prefix, **kwargs) as pool:
-                yield pool
+            from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
         except ImportError:
             yield None
+            return
+
+        if parallel == "process":
+            with ProcessPoolExecutor(**kwargs) as pool:
+                yield pool
+        else:
+            with ThreadPoolExecutor(thread_name_prefix=prefix, **kwargs) as pool:
+                yield pool
     else:
         yield None
 
@@ -105,25 +114,21 @@ def add_status(name, nvr, commit=None):
 add_status(package_info["NAME"], get_nvr(), package_info["COMMIT"])
 
 
-def process_dir(broker, root, graph, context, inventory=None, parallel=False):
-    ctx, broker = initialize_broker(root, context=context, broker=broker)
-    log.debug("Processing %s with %s" % (root, ctx))
+def process_dir(broker, root, graph, context, inventory=None, parallel=False, targets=None):
+    single = dict((k, v) for k, v in graph.items() if k in dr.COMPONENTS[dr.GROUPS.single])
+    with get_pool(parallel, "insights-run-pool", {"max_workers": None}) as pool:
+        ctx, broker = initialize_broker(root, context=context, broker=broker, components=single, pool=pool)
+        log.debug("Processing %s with %s" % (root, ctx))
 
-    if isinstance(ctx, ClusterArchiveContext):
-        from .core.cluster import process_cluster
-        archives = [f for f in ctx.all_files if f.endswith(COMPRESSION_TYPES)]
-        return process_cluster(graph, archives, broker=broker, inventory=inventory)
+        if isinstance(ctx, ClusterArchiveContext):
+            from .core.cluster import process_cluster
+            archives = [f for f in ctx.all_files if f.endswith(COMPRESSION_TYPES)]
+            return process_cluster(graph, archives, broker=broker, inventory=inventory)
 
-    graph = dict((k, v) for k, v in graph.items() if k in dr.COMPONENTS[dr.GROUPS.single])
-    if parallel:
-        with get_pool(parallel, "insights-run-pool", {"max_workers": None}) as pool:
-            broker = dr.run_all(graph, broker, pool)
-    else:
-        broker = dr.run(graph, broker=broker)
-    return broker
+        return dr.run(single, broker=broker, pool=pool, targets=targets)
 
 
-def _run(broker, graph=None, root=None, context=None, inventory=None, parallel=False):
+def _run(broker, graph=None, root=None, context=None, inventory=None, parallel=False, targets=None):
     """
     run is a general interface that is meant for stand-alone scripts to use
     when executing insights components.
@@ -143,6 +148,8 @@ def _run(broker, graph=None, root=None, context=None, inventory=None, parallel=F
         context (obj): The execution context that's set.
         inventory (str): Path to inventory file.
         parallel (bool): Boolean as to weather to use parallel execution or not.
+        targets (list): Components whose results are wanted. If given, only
+            the parts of the graph that can affect them are evaluated.
 
     Returns:
         broker: object containing the result of the evaluation.
@@ -153,15 +160,21 @@ def _run(broker, graph=None, root=None, context=None, inventory=None, parallel=F
         graph = dict((k, v) for k, v in graph.items() if k in dr.COMPONENTS[dr.GROUPS.single])
         if parallel:
             with get_pool(parallel, "insights-run-pool", {"max_workers": None}) as pool:
-                dr.run_all(graph, broker, pool)
+                return dr.run(graph, broker=broker, pool=pool, targets=targets)
         else:
-            return dr.run(graph, broker=broker)
+            return dr.run(graph, broker=broker, targets=targets)
 
     if os.path.isdir(root):
-        return process_dir(broker, root, graph, context, inventory=inventory, parallel=parallel)
+        return process_dir(broker, root, graph, context, inventory=inventory, parallel=parallel, targets=targets)
+
+    ctx, whole = get_archive_context(root, context=context)
+    if ctx is not None:
+        with ctx.archive:
+            return process_dir(broker, root, graph, ctx, inventory=inventory, parallel=parallel, targets=targets)
     else:
-        with extract(root) as ex:
-            return process_dir(broker, ex.tmp_dir, graph, context, inventory=inventory, parallel=parallel)
+        include = None if whole else get_include_patterns(root, graph, context=context)
+        with extract(root, include=include) as ex:
+            return process_dir(broker, ex.tmp_dir, graph, context, inventory=inventory, parallel=parallel, targets=targets)
 
 
 def load_default_plugins():
@@ -173,6 +186,27 @@ def load_default_plugins():
     dr.load_components("insights.specs.must_gather_archive")
 
 
+def load_manifest(path):
+    """
+    Loads the component manifest at path for :func:`insights.core.dr.load_from_manifest`.
+
+    Returns:
+        bool: True if the manifest was loaded and was made for this version
+        of insights-core.
+    """
+    try:
+        manifest = dr.load_manifest(path)
+    except Exception as ex:
+        log.warning("Couldn't load component manifest %s: %r" % (path, ex))
+        return False
+
+    if manifest.get("nvr") != get_nvr():
+        log.warning("Ignoring component manifest %s made for %s." % (path, manifest.get("nvr")))
+        dr.MANIFEST.clear()
+        return False
+    return True
+
+
 def load_packages(packages):
     plugins = []
     for name in packages:
@@ -219,9 +253,13 @@ def apply_configs(config):
                 whether components are enable if not specifically declared in
                 the config section. Defaults to True.
 
+            budgets (dict, optional): component type names like
+                ``insights.core.plugins.parser`` to the number of seconds any
+                component of that type may take to evaluate.
+
             configs (list): list of dictionaries with the following keys:
-                name, enabled, metadata, and timeout. All keys are optional
-                except name.
+                name, enabled, metadata, timeout, budget, priority, and cache.
+                All keys are optional except name.
 
                 name is the prefix or exact name of any loaded component. Any
                 component starting with name will have the associated
@@ -233,11 +271,31 @@ def apply_configs(config):
                 timeout sets the class level timeout attribute of any component
                 so long as the attribute already exists.
 
+                budget is the number of seconds the matching components may
+                take to evaluate. Those declared with ``isolated=True`` are
+                interrupted and recorded as timed out once they've used it.
+                See :func:`insights.core.dr.set_budget`.
+
+                priority sets the priority attribute of command datasources.
+                Commands with higher priorities start first when they run in
+                a :class:`insights.core.command_pool.CommandPool`.
+
+                cache sets the cache policy of command datasources, which says
+                when their output may be reused from an earlier collection.
+                See :mod:`insights.core.command_cache`.
+
                 metadata is any dictionary that you want to attach to the
                 component. The dictionary can be retrieved by the component at
                 runtime.
     """
     default_enabled = config.get("default_component_enabled", True)
+    for name, seconds in config.get("budgets", {}).items():
+        _type = dr.get_component(name)
+        if _type is None:
+            log.warning("Can't set budget of unknown component type %s." % name)
+            continue
+        dr.set_budget(_type, seconds)
+
     delegate_keys = sorted(dr.DELEGATES, key=dr.get_name)
     for comp_cfg in config.get("configs", []):
         name = comp_cfg.get("name")
@@ -256,6 +314,15 @@ def apply_configs(config):
                 if hasattr(c, "timeout"):
                     c.timeout = comp_cfg.get("timeout", c.timeout)
 
+                if hasattr(c, "priority"):
+                    c.priority = comp_cfg.get("priority", c.priority)
+
+                if hasattr(c, "cache"):
+                    c.cache = comp_cfg.get("cache", c.cache)
+
+                if "budget" in comp_cfg:
+                    dr.set_budget(c, comp_cfg["budget"])
+
                 if hasattr(delegate, "links"):
                     delegate.links = comp_cfg.get("links", delegate.links)
             if cname == name:
@@ -276,6 +343,7 @@ def run(component=None, root=None, print_summary=False,
 
     args = None
     formatters = None
+    lazy = False
 
     if print_summary:
         import argparse
@@ -296,8 +364,20 @@ def run(component=None, root=None, print_summary=False,
         p.add_argument("--color", default="auto", choices=["always", "auto", "never"], metavar="[=WHEN]",
                        help="Choose if and how the color encoding is outputted. When is 'always', 'auto', or 'never'.")
         p.add_argument("--context", help="Execution Context. Defaults to HostContext if an archive isn't passed.")
+        p.add_argument("--demand", action="store_true",
+                       help="Only evaluate components that can affect the selected rules.")
+        p.add_argument("--manifest", default=os.environ.get("INSIGHTS_MANIFEST"),
+                       help="Component manifest from insights-manifest. Only the modules the selected plugins need are loaded.")
+        p.add_argument("--mmap-threshold", type=int, metavar="BYTES",
+                       help="Load text files of at least BYTES as mmap backed sequences of lines to save memory.")
         p.add_argument("--no-load-default", help="Don't load the default plugins.", action="store_true")
         p.add_argument("--parallel", help="Execute rules in parallel.", action="store_true")
+        p.add_argument("--parallel-backend", default="thread", choices=["thread", "process"],
+                       help="Run --parallel with threads or, to use every core for parsing, processes. Defaults to thread.")
+        p.add_argument("--profile", help="Write the time, memory, and sizes of each component's evaluation to a file.")
+        p.add_argument("--profile-format", default="json", choices=["json", "chrome"],
+                       help="Write the profile as JSON or as a Chrome trace for flame charts. Defaults to json.")
+        p.add_argument("--profile-memory", action="store_true", help="Include peak memory in the profile. Slow.")
         p.add_argument("--tags", help="Expression to select rules by tag.")
 
         class Args(object):
@@ -308,7 +388,8 @@ def run(component=None, root=None, print_summary=False,
         p.parse_known_args(namespace=args)
         p = argparse.ArgumentParser(parents=[p])
 
-        if not args.no_load_default:
+        lazy = not args.no_load_default and bool(args.manifest) and load_manifest(args.manifest)
+        if not args.no_load_default and not lazy:
             load_default_plugins()
 
         global _COLOR
@@ -339,6 +420,8 @@ def run(component=None, root=None, print_summary=False,
             formatters.append(formatter)
 
         logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO if args.verbose else logging.ERROR)
+        if args.mmap_threshold is not None:
+            mmaplines.THRESHOLD = args.mmap_threshold
         context = _load_context(args.context) or context
         inventory = args.inventory
 
@@ -383,12 +466,25 @@ def run(component=None, root=None, print_summary=False,
                 msg = "No components for tag expression: %s" % args.tags
                 raise Exception(msg)
 
+        if lazy:
+            dr.load_from_manifest(*component)
+
         graph = {}
         for c in component:
             graph.update(dr.get_dependency_graph(c))
     else:
+        if lazy:
+            load_default_plugins()
         graph = dr.COMPONENTS[dr.GROUPS.single]
 
+    targets = None
+    if args and args.demand:
+        targets = component or True
+
+    parallel = False
+    if args and args.parallel:
+        parallel = args.parallel_backend
+
     broker = dr.Broker()
 
     if args and args.bare:
@@ -400,6 +496,12 @@ def run(component=None, root=None, print_summary=False,
         broker[ExecutionContext] = ctx
         for spec, content in specs.items():
             broker[spec] = content if dr.DELEGATES[spec].multi_output else content[-1]
+
+    profiler = None
+    if args and args.profile:
+        from .core.profiler import Profiler
+        profiler = broker.profiler = Profiler(memory=args.profile_memory)
+
     try:
         if formatters:
             for formatter in formatters:
@@ -407,9 +509,10 @@ def run(component=None, root=None, print_summary=False,
 
             if args:
                 if args.bare:
-                    broker = dr.run(graph, broker=broker)
+                    broker = dr.run(graph, broker=broker, targets=targets)
                 else:
-                    broker = _run(broker, graph, root, context=context, inventory=inventory, parallel=args.parallel)
+                    broker = _run(broker, graph, root, context=context, inventory=inventory, parallel=parallel,
+                                  targets=targets)
             else:
                 broker = _run(broker, graph, root, context=context, inventory=inventory)
 
@@ -418,9 +521,10 @@ def run(component=None, root=None, print_summary=False,
         elif print_component:
             if args:
                 if args.bare:
-                    broker = dr.run(graph, broker=broker)
+                    broker = dr.run(graph, broker=broker, targets=targets)
                 else:
-                    broker = _run(broker, graph, root, context=context, inventory=inventory, parallel=args.parallel)
+                    broker = _run(broker, graph, root, context=context, inventory=inventory, parallel=parallel,
+                                  targets=targets)
             else:
                 broker = _run(broker, graph, root, context=context, inventory=inventory)
 
@@ -428,9 +532,10 @@ def run(component=None, root=None, print_summary=False,
         else:
             if args:
                 if args.bare:
-                    broker = dr.run(graph, broker=broker)
+                    broker = dr.run(graph, broker=broker, targets=targets)
                 else:
-                    broker = _run(broker, graph, root, context=context, inventory=inventory, parallel=args.parallel)
+                    broker = _run(broker, graph, root, context=context, inventory=inventory, parallel=parallel,
+                                  targets=targets)
             else:
                 broker = _run(broker, graph, root, context=context, inventory=inventory)
 
@@ -442,6 +547,28 @@ def run(component=None, root=None, print_summary=False,
             log.error(msg.format(p=path))
         else:
             raise
+    finally:
+        if profiler is not None:
+            save_profile(profiler, broker, args.profile, args.profile_format)
+
+
+def save_profile(profiler, broker, path, fmt="json"):
+    """
+    Writes the profile of an evaluation to path as JSON or, if fmt is
+    "chrome", as a Chrome trace. The name of the execution context is added to
+    the profile's labels.
+    """
+    profiler.close()
+    for value in broker.instances.values():
+        if isinstance(value, ExecutionContext):
+            profiler.labels.setdefault("context", dr.get_name(type(value)))
+            break
+
+    with open(path, "w") as f:
+        if fmt == "chrome":
+            profiler.dump_chrome_trace(f)
+        else:
+            profiler.dump_json(f)
 
 
 def parse_specs(specs):
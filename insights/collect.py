@@ -18,6 +18,8 @@ from datetime import datetime
 
 from insights import apply_configs, apply_default_enabled, dr, get_pool
 from insights.core import blacklist, filters
+from insights.core.command_cache import get_command_cache
+from insights.core.command_pool import get_command_pool
 from insights.core.serde import Hydration
 from insights.util import fs
 from insights.util.subproc import call, CalledProcessError
@@ -64,11 +66,34 @@ client:
         - name: insights.specs.Specs
           enabled: true
 
+    # put the metadata of persisted components in one meta_data.pack file
+    # instead of a file per component in the meta_data directory. Tools that
+    # read the meta_data directory of an archive directly won't find them.
+    packed_meta_data: false
+
+    # write the metadata of persisted components as json or msgpack. msgpack
+    # is faster to load but needs the msgpack package. json is written if it
+    # isn't installed.
+    meta_data_encoding: json
+
     run_strategy:
         name: serial
         args:
             max_workers: null
 
+    # run commands in the background as soon as their datasources are
+    # evaluated, at most max_workers at a time. Commands with a higher
+    # priority start first. Uncomment to enable.
+    # command_pool:
+    #     max_workers: 8
+
+    # reuse the output of commands with a cache policy from earlier
+    # collections on this host. Output that hasn't been used for max_age
+    # seconds is removed. Uncomment to enable.
+    # command_cache:
+    #     path: /var/cache/insights-core/commands
+    #     max_age: 604800
+
 plugins:
     # disable everything by default
     # defaults to false if not specified.
@@ -403,12 +428,28 @@ def collect(manifest=default_manifest, tmp_path=None, compress=False, rm_conf=No
     ctx = create_context(client.get("context", {}))
     broker[ctx.__class__] = ctx
 
+    command_pool = client.get("command_pool")
+    if command_pool is not None:
+        ctx.command_pool = get_command_pool(command_pool or {})
+
+    command_cache = client.get("command_cache")
+    if command_cache:
+        ctx.command_cache = get_command_cache(command_cache)
+
     parallel = run_strategy.get("name") == "parallel"
     pool_args = run_strategy.get("args", {})
-    with get_pool(parallel, "insights-collector-pool", pool_args) as pool:
-        h = Hydration(output_path, pool=pool)
-        broker.add_observer(h.make_persister(to_persist))
-        dr.run_all(broker=broker, pool=pool)
+    try:
+        with get_pool(parallel, "insights-collector-pool", pool_args) as pool:
+            h = Hydration(output_path, pool=pool, packed=client.get("packed_meta_data", False),
+                          encoding=client.get("meta_data_encoding", "json"))
+            broker.add_observer(h.make_persister(to_persist))
+            dr.run(broker=broker, pool=pool)
+            h.close()
+    finally:
+        if ctx.command_pool is not None:
+            ctx.command_pool.shutdown()
+        if ctx.command_cache is not None:
+            ctx.command_cache.prune()
 
     if compress:
         return create_archive(output_path)
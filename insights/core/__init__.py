@@ -112,12 +112,12 @@ class StreamParser(Parser):
 
 
 @serializer(Parser)
-def default_parser_serializer(obj):
+def default_parser_serializer(obj, root=None):
     return vars(obj)
 
 
 @deserializer(Parser)
-def default_parser_deserializer(_type, data):
+def default_parser_deserializer(_type, data, root=None):
     obj = _type.__new__(_type)
     obj.file_path = None
     obj.file_name = None
@@ -0,0 +1,301 @@
+"""
+Reads the members of a tar or zip archive in place instead of extracting it.
+An :class:`ArchiveFS` indexes the members once and then answers the
+questions providers and globs ask about paths, so it's used as both the
+``path_cache`` and the ``dir_cache`` of the context it reads for. Providers
+read a member's content from the ``archive`` of their context when it has
+one.
+
+A member's path is the path of the archive joined with the member's name, so
+``/tmp/host.tar/host/etc/hosts`` is ``host/etc/hosts`` in ``/tmp/host.tar``.
+Symlinks are resolved in the archive. Like in an extracted archive, links
+that leave it resolve outside the context's root.
+
+Zip files and uncompressed tar files are read where they are. A compressed
+tar file can only be read from its start, so it's decompressed once into a
+temporary file that's kept in memory while it's smaller than
+:data:`SPOOL_SIZE`. Nothing else is written, unless the :class:`ArchiveFS`
+is pickled to be sent to another process: then the decompressed tar file is
+written to disk once, and the copies read it instead of decompressing the
+archive again.
+"""
+import bz2
+import gzip
+import io
+import os
+import posixpath
+import shutil
+import stat
+import tarfile
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+
+from insights.core.archives import InvalidArchive
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+ENABLED = True
+""" bool: read archives in place when possible. Set to ``False`` to always extract them. """
+
+CACHE_SIZE = 16 * 1024 * 1024
+""" int: default number of bytes of member content an :class:`ArchiveFS` keeps. """
+
+SPOOL_SIZE = 64 * 1024 * 1024
+""" int: compressed tar files that decompress to more bytes are spooled to disk. """
+
+_MAX_LINKS = 40
+
+
+def _decompressor(path):
+    with open(path, "rb") as f:
+        magic = f.read(6)
+    if magic.startswith(b"\x1f\x8b"):
+        return gzip.GzipFile
+    if magic.startswith(b"BZh"):
+        return bz2.BZ2File
+    if magic.startswith(b"\xfd7zXZ\x00"):
+        if lzma is None:
+            raise InvalidArchive("Can't read %s in place without lzma." % path)
+        return lzma.LZMAFile
+    return None
+
+
+def _normalize(name):
+    """ Returns a member name relative to the archive or ``None`` if it's outside. """
+    name = posixpath.normpath(name.lstrip("/"))
+    if name == "." or name == ".." or name.startswith("../"):
+        return None
+    return name
+
+
+class ArchiveFS(object):
+    """
+    Args:
+        path (str): the tar or zip file.
+        cache_size (int): bytes of member content to keep for reading again.
+            Members larger than this aren't kept. ``0`` keeps none.
+        source (str): a file to read the archive's members from instead of
+            ``path``, like the decompressed copy of a compressed tar file.
+
+    Raises:
+        InvalidArchive: if ``path`` isn't an archive this can read.
+    """
+    def __init__(self, path, cache_size=CACHE_SIZE, source=None):
+        self.path = path
+        self.source = source or path
+        self.root = os.path.abspath(path)
+        self.cache_size = cache_size
+        self._files = {}
+        self._links = {}
+        self._dirs = {self.root: {}}
+        self._real = {}
+        self._cache = OrderedDict()
+        self._cached = 0
+        self._lock = threading.Lock()
+        self._zip = None
+        self._tar = None
+        self._tmp = None
+        self._shared = None
+        try:
+            if zipfile.is_zipfile(self.source):
+                self._index_zip()
+            else:
+                self._index_tar()
+        except Exception as ex:
+            self.close()
+            if isinstance(ex, InvalidArchive):
+                raise
+            raise InvalidArchive("Can't read %s in place: %s" % (path, ex))
+
+    def _add(self, name, kind, member=None):
+        name = _normalize(name)
+        if name is None:
+            return
+        path = self.root + "/" + name
+        if kind == "file":
+            self._files[path] = member
+        elif kind == "link":
+            self._links[path] = member
+        else:
+            self._dirs.setdefault(path, {})
+        while path != self.root:
+            parent, base = path.rsplit("/", 1)
+            entries = self._dirs.setdefault(parent, {})
+            if base in entries and kind == "dir":
+                break
+            entries[base] = kind
+            path, kind = parent, "dir"
+
+    def _index_zip(self):
+        self._zip = zipfile.ZipFile(self.source)
+        for info in self._zip.infolist():
+            mode = info.external_attr >> 16
+            if info.filename.endswith("/") or stat.S_ISDIR(mode):
+                self._add(info.filename, "dir")
+            elif stat.S_ISLNK(mode):
+                self._add(info.filename, "link", self._zip.read(info).decode("utf-8"))
+            else:
+                self._add(info.filename, "file", info)
+
+    def _index_tar(self):
+        opener = _decompressor(self.source)
+        if opener is None:
+            self._tar = tarfile.open(self.source, "r:")
+        else:
+            self._tmp = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+            src = opener(self.source)
+            try:
+                shutil.copyfileobj(src, self._tmp, 1024 * 1024)
+            finally:
+                src.close()
+            self._tmp.seek(0)
+            self._tar = tarfile.open(fileobj=self._tmp, mode="r:")
+        for member in self._tar.getmembers():
+            if member.isdir():
+                self._add(member.name, "dir")
+            elif member.issym():
+                self._add(member.name, "link", member.linkname)
+            elif member.isfile() or member.islnk():
+                self._add(member.name, "file", member)
+
+    def files(self):
+        """ Returns the paths of the regular files, like ``all_files``. """
+        return sorted(self._files)
+
+    def _resolve(self, path, depth=0):
+        path = posixpath.normpath(path)
+        if path != self.root and not path.startswith(self.root + "/"):
+            return path
+        parts = path[len(self.root) + 1:].split("/") if path != self.root else []
+        current = self.root
+        for i, part in enumerate(parts):
+            current = current + "/" + part
+            target = self._links.get(current)
+            if target is None:
+                continue
+            if depth >= _MAX_LINKS:
+                return path
+            rest = parts[i + 1:]
+            if posixpath.isabs(target):
+                return posixpath.normpath(posixpath.join(target, *rest))
+            target = posixpath.join(posixpath.dirname(current), target, *rest)
+            return self._resolve(target, depth + 1)
+        return current
+
+    def realpath(self, path):
+        """ Returns ``path`` with the symlinks in the archive resolved. """
+        result = self._real.get(path)
+        if result is None:
+            result = self._real[path] = self._resolve(path)
+        return result
+
+    def exists(self, path):
+        real = self.realpath(path)
+        return real in self._files or real in self._dirs
+
+    def lexists(self, path):
+        parent, base = posixpath.split(posixpath.normpath(path))
+        entries = self._dirs.get(self.realpath(parent))
+        return entries is not None and base in entries
+
+    def isdir(self, path):
+        return self.realpath(path) in self._dirs
+
+    def access(self, path, mode=os.R_OK):
+        """ Members can be read and nothing else. """
+        return not mode & os.W_OK and self.exists(path)
+
+    def listdir(self, path):
+        """ Returns the ``(name, is_dir)`` entries of ``path`` like a :class:`insights.util.dirglob.DirCache`. """
+        parent = self.realpath(path)
+        entries = self._dirs.get(parent, {})
+        return [(name, kind == "dir" or (kind == "link" and self.isdir(parent + "/" + name)))
+                for name, kind in entries.items()]
+
+    def _member(self, path):
+        real = self.realpath(path)
+        member = self._files.get(real)
+        if member is None:
+            raise IOError("No such file in %s: %s" % (self.path, path))
+        return real, member
+
+    def getsize(self, path):
+        _, member = self._member(path)
+        return member.file_size if self._zip is not None else member.size
+
+    def read(self, path):
+        """ Returns the content of the member at ``path`` as bytes. """
+        real, member = self._member(path)
+        with self._lock:
+            data = self._cache.get(real)
+            if data is not None:
+                self._cache.pop(real)
+                self._cache[real] = data
+                return data
+            if self._zip is not None:
+                data = self._zip.read(member)
+            else:
+                data = self._tar.extractfile(member).read()
+            if len(data) <= self.cache_size:
+                self._cache[real] = data
+                self._cached += len(data)
+                while self._cached > self.cache_size:
+                    _, old = self._cache.popitem(last=False)
+                    self._cached -= len(old)
+        return data
+
+    def open(self, path):
+        """ Returns a binary file object of the content of the member at ``path``. """
+        return io.BytesIO(self.read(path))
+
+    def clear(self):
+        """ Forgets the member content it kept. """
+        with self._lock:
+            self._cache.clear()
+            self._cached = 0
+
+    def close(self):
+        for f in (self._zip, self._tar, self._tmp):
+            if f is not None:
+                f.close()
+        if self._shared is not None:
+            try:
+                os.remove(self._shared)
+            except OSError:
+                pass
+            self._shared = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _get_shared(self):
+        """
+        Returns a file other processes can read the members from without
+        decompressing the archive. It's removed by :meth:`close`.
+        """
+        if self._tmp is None:
+            return self.source
+        with self._lock:
+            if self._shared is None:
+                fd, path = tempfile.mkstemp(suffix=".tar")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        self._tmp.seek(0)
+                        shutil.copyfileobj(self._tmp, f, 1024 * 1024)
+                except Exception:
+                    os.remove(path)
+                    raise
+                self._shared = path
+        return self._shared
+
+    def __reduce__(self):
+        return (ArchiveFS, (self.path, self.cache_size, self._get_shared()))
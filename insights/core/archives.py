@@ -2,7 +2,9 @@
 
 import logging
 import os
+import stat
 import tempfile
+import zipfile
 from contextlib import contextmanager
 from insights.util import fs, subproc, which
 from insights.util.content_type import from_file as content_type_from_file
@@ -26,18 +28,72 @@ class InvalidContentType(InvalidArchive):
         self.content_type = content_type
 
 
+def list_members(path, content_type=None, timeout=None):
+    """
+    Returns a dictionary of the names of the files and symlinks in the tar or
+    zip file at ``path`` to the targets of the symlinks, or to ``None`` for
+    files. Returns ``None`` if the archive can't be listed.
+    """
+    members = {}
+    try:
+        content_type = content_type or content_type_from_file(path)
+        if content_type == "application/zip":
+            with zipfile.ZipFile(path) as zf:
+                for info in zf.infolist():
+                    mode = info.external_attr >> 16
+                    if info.filename.endswith("/") or stat.S_ISDIR(mode):
+                        continue
+                    link = zf.read(info).decode("utf-8") if stat.S_ISLNK(mode) else None
+                    members[info.filename] = link
+            return members
+
+        tar_flag = TarExtractor.TAR_FLAGS.get(content_type)
+        if tar_flag is None:
+            return None
+        command = "tar %s -t -v --quoting-style=literal -f %s" % (tar_flag, path)
+        env = dict(os.environ, LC_ALL="C")
+        for line in subproc.call(command, timeout=timeout, env=env).splitlines():
+            fields = line.split(None, 5)
+            if len(fields) < 6:
+                continue
+            kind, name = fields[0][0], fields[5]
+            if kind == "l" and " -> " in name:
+                name, target = name.split(" -> ", 1)
+                members[name] = target
+            elif kind == "h" and " link to " in name:
+                members[name.split(" link to ", 1)[0]] = None
+            elif kind == "-":
+                members[name] = None
+    except Exception as ex:
+        logger.debug("Can't list the members of %s: %s", path, ex)
+        return None
+    return members
+
+
 class ZipExtractor(object):
+    BATCH_SIZE = 500
+
     def __init__(self, timeout=None):
         self.content_type = "application/zip"
         self.timeout = timeout
         self.tmp_dir = None
         self.created_tmp_dir = False
 
-    def from_path(self, path, extract_dir=None, content_type=None):
+    def from_path(self, path, extract_dir=None, content_type=None, include=None):
         self.tmp_dir = tempfile.mkdtemp(prefix="insights-", dir=extract_dir)
         self.created_tmp_dir = True
-        command = "unzip -n -q -d %s %s" % (self.tmp_dir, path)
-        subproc.call(command, timeout=self.timeout)
+        if include is None:
+            command = "unzip -n -q -d %s %s" % (self.tmp_dir, path)
+            subproc.call(command, timeout=self.timeout)
+            return self
+
+        include = list(include)
+        for i in range(0, len(include), self.BATCH_SIZE):
+            command = ["unzip", "-n", "-q", "-d", self.tmp_dir, path] + include[i:i + self.BATCH_SIZE]
+            # unzip exits with 11 when none of the patterns matched
+            rc, out = subproc.call([command], timeout=self.timeout, keep_rc=True)
+            if rc not in (0, 11):
+                raise subproc.CalledProcessError(rc, " ".join(command), out)
         return self
 
 
@@ -62,7 +118,7 @@ class TarExtractor(object):
             raise InvalidContentType(content_type)
         return flag
 
-    def from_path(self, path, extract_dir=None, content_type=None):
+    def from_path(self, path, extract_dir=None, content_type=None, include=None):
         if os.path.isdir(path):
             self.tmp_dir = path
         else:
@@ -72,7 +128,20 @@ class TarExtractor(object):
             self.created_tmp_dir = True
             command = "tar --delay-directory-restore %s -x --exclude=*/dev/null -f %s -C %s" % (tar_flag, path, self.tmp_dir)
             logging.debug("Extracting files in '%s'", self.tmp_dir)
-            subproc.call(command, timeout=self.timeout)
+            if include is None:
+                subproc.call(command, timeout=self.timeout)
+                return self
+
+            with tempfile.NamedTemporaryFile("w", prefix="insights-include-", dir=extract_dir) as patterns:
+                patterns.write("\n".join(include) + "\n")
+                patterns.flush()
+                command += " --wildcards --no-unquote -T %s" % patterns.name
+                # the message checked below is only in english
+                env = dict(os.environ, LC_ALL="C")
+                rc, out = subproc.call(command, timeout=self.timeout, keep_rc=True, env=env)
+            # tar exits with 2 when some patterns didn't match
+            if rc not in (0, 2) or (rc == 2 and "Not found in archive" not in out):
+                raise subproc.CalledProcessError(rc, command, out)
         return self
 
 
@@ -83,7 +152,7 @@ class Extraction(object):
 
 
 @contextmanager
-def extract(path, timeout=None, extract_dir=None, content_type=None):
+def extract(path, timeout=None, extract_dir=None, content_type=None, include=None):
     """
     Extract path into a temporary directory in `extract_dir`.
 
@@ -92,6 +161,10 @@ def extract(path, timeout=None, extract_dir=None, content_type=None):
 
     If the extraction takes longer than `timeout` seconds, the temporary path
     is removed, and an exception is raised.
+
+    If `include` is given, only the members whose names match one of its glob
+    patterns are extracted. A `*` in a pattern also matches `/`. See
+    :func:`insights.core.hydration.get_include_patterns`.
     """
     content_type = content_type or content_type_from_file(path)
     if content_type == "application/zip":
@@ -100,7 +173,7 @@ def extract(path, timeout=None, extract_dir=None, content_type=None):
         extractor = TarExtractor(timeout=timeout)
 
     try:
-        ctx = extractor.from_path(path, extract_dir=extract_dir, content_type=content_type)
+        ctx = extractor.from_path(path, extract_dir=extract_dir, content_type=content_type, include=include)
         content_type = extractor.content_type
         yield Extraction(ctx.tmp_dir, content_type)
     finally:
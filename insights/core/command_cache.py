@@ -0,0 +1,138 @@
+"""
+The command_cache module keeps the output of commands between collections
+on the same host. A :class:`insights.core.spec_factory.CommandOutputProvider`
+created by a datasource with a ``cache`` policy reuses the output an earlier
+collection stored in the :class:`CommandCache` of its execution context
+instead of running its command again.
+
+A policy is a dictionary with any of these keys:
+
+    ttl (int): the number of seconds stored output may be reused.
+    paths (list): files or directories the output depends on. Output is
+        reused only while their sizes and modification times are the same as
+        when it was stored.
+    kernel (bool): the output depends on the running kernel. It's reused
+        only while the kernel release is the same as when it was stored.
+
+Policies with neither key are ignored. Output is stored only when the command
+pipeline succeeds, and it's stored after filtering, so it never holds more
+than an archive would. Changing the command, its filters, the blacklist, or
+its environment means the stored output doesn't apply.
+
+Policies can be set in the ``configs`` section of a manifest like any other
+attribute. See :func:`insights.apply_configs`.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from insights.util import fs
+
+log = logging.getLogger(__name__)
+
+
+def _get_state(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_ino, st.st_size, st.st_mtime]
+
+
+class CommandCache(object):
+    """
+    Command output stored in a directory.
+
+    Args:
+        path (str): the directory. It's created if it doesn't exist.
+        max_age (int): :meth:`prune` removes output that hasn't been used for
+            this many seconds.
+    """
+    def __init__(self, path, max_age=7 * 24 * 60 * 60):
+        self.path = path
+        self.max_age = max_age
+        fs.ensure_path(path, mode=0o700)
+
+    def get_key(self, args, env, policy):
+        """
+        Returns the key of the output of the command pipeline ``args`` run with
+        ``env`` under ``policy`` or ``None`` if the policy doesn't allow
+        caching.
+        """
+        if not policy or not (policy.get("ttl") or policy.get("paths")):
+            return None
+        paths = sorted(policy.get("paths") or [])
+        key = [args, sorted(env.items()), [(p, _get_state(p)) for p in paths]]
+        if policy.get("kernel"):
+            key.append(os.uname()[2])
+        return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key, ttl=None):
+        """
+        Returns the path to the output stored for ``key`` or ``None`` if there
+        isn't any or it's older than ``ttl`` seconds.
+        """
+        path = self._entry(key)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if ttl and time.time() - st.st_mtime > ttl:
+            return None
+        try:
+            os.utime(path, (time.time(), st.st_mtime))
+        except OSError:
+            pass
+        return path
+
+    def put(self, key, f):
+        """ Stores the rest of the file object ``f`` as the output for ``key``. """
+        path = self._entry(key)
+        tmp = None
+        try:
+            fs.ensure_path(os.path.dirname(path), mode=0o700)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as out:
+                shutil.copyfileobj(f, out)
+            os.rename(tmp, path)
+        except (IOError, OSError) as ex:
+            log.debug("Couldn't store command output in %s: %s", path, ex)
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+
+    def prune(self):
+        """
+        Removes output that hasn't been stored or used for :attr:`max_age`
+        seconds.
+        """
+        if not self.max_age:
+            return
+        oldest = time.time() - self.max_age
+        for root, _, names in os.walk(self.path):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                    if max(st.st_atime, st.st_mtime) < oldest:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+
+def get_command_cache(kwargs):
+    """
+    Returns a :class:`CommandCache` created with ``kwargs`` or ``None`` if
+    its directory can't be created.
+    """
+    try:
+        return CommandCache(**kwargs)
+    except (IOError, OSError) as ex:
+        log.warning("Can't use the command cache: %s", ex)
+        return None
@@ -0,0 +1,110 @@
+"""
+The command_pool module runs the commands of
+:class:`insights.core.spec_factory.CommandOutputProvider` instances in
+background threads. A provider created with an execution context that has a
+:class:`CommandPool` in its ``command_pool`` attribute submits its command as
+soon as it's created, and reading or writing its content waits for only that
+command. Collection then takes about as long as its slowest commands instead
+of the sum of all of them.
+
+Commands with a higher priority start first. The priority comes from the
+``priority`` argument of the command datasource, which can be set in the
+``configs`` section of a manifest like any other attribute. See
+:func:`insights.apply_configs`.
+"""
+import heapq
+import itertools
+import logging
+import threading
+
+try:
+    from concurrent.futures import Future
+except ImportError:
+    Future = None
+
+log = logging.getLogger(__name__)
+
+
+class CommandPool(object):
+    """
+    A pool of threads that run submitted functions in priority order.
+
+    Args:
+        max_workers (int): the most functions that run at once.
+    """
+    def __init__(self, max_workers=4):
+        if Future is None:
+            raise RuntimeError("CommandPool requires concurrent.futures.")
+        self.max_workers = max(int(max_workers or 1), 1)
+        self._queue = []
+        self._count = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._idle = 0
+        self._shutdown = False
+
+    def submit(self, func, priority=0):
+        """
+        Schedules ``func()`` to run. Returns a ``concurrent.futures.Future``
+        for its result.
+        """
+        future = Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("Can't submit to a CommandPool after shutdown.")
+            heapq.heappush(self._queue, (-(priority or 0), next(self._count), func, future))
+            if not self._idle and len(self._threads) < self.max_workers:
+                t = threading.Thread(target=self._work, name="insights-command-%d" % len(self._threads))
+                t.daemon = True
+                self._threads.append(t)
+                t.start()
+            self._cond.notify()
+        return future
+
+    def _work(self):
+        while True:
+            with self._cond:
+                self._idle += 1
+                while not self._queue and not self._shutdown:
+                    self._cond.wait()
+                self._idle -= 1
+                if not self._queue:
+                    return
+                _, _, func, future = heapq.heappop(self._queue)
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func())
+            except BaseException as ex:
+                future.set_exception(ex)
+
+    def shutdown(self, wait=True):
+        """
+        Stops the threads once the queued functions have run. If ``wait`` is
+        ``True``, returns only after they have.
+        """
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
+
+
+def get_command_pool(kwargs):
+    """
+    Returns a :class:`CommandPool` created with ``kwargs`` or ``None`` if
+    ``concurrent.futures`` doesn't exist.
+    """
+    if Future is None:
+        log.warning("concurrent.futures isn't available. Commands will run one at a time.")
+        return None
+    return CommandPool(**kwargs)
@@ -3,6 +3,8 @@ import os
 import six
 from contextlib import contextmanager
 from insights.util import streams, subproc
+from insights.util.dirglob import DirCache
+from insights.util.pathcache import PathCache
 
 log = logging.getLogger(__name__)
 GLOBAL_PRODUCTS = []
@@ -150,11 +152,35 @@ class ExecutionContextMeta(type):
 
 class ExecutionContext(six.with_metaclass(ExecutionContextMeta)):
     marker = None
+    command_pool = None
+    """
+    :class:`insights.core.command_pool.CommandPool` that runs the commands of
+    providers created with this context. ``None`` runs them when their
+    content is needed.
+    """
+    command_cache = None
+    """
+    :class:`insights.core.command_cache.CommandCache` with output from earlier
+    collections that providers of datasources with a ``cache`` policy reuse.
+    """
+    archive = None
+    """
+    :class:`insights.core.archivefs.ArchiveFS` the files of the context are
+    read from without extracting them. ``None`` reads them from disk.
+    """
+    fingerprints = False
+    """
+    Whether file providers created with this context record fingerprints of
+    their files, so a later :func:`insights.core.dr.run` can tell which of
+    them changed. See its ``previous`` and ``fingerprints`` arguments.
+    """
 
     def __init__(self, root="/", timeout=None, all_files=None):
         self.root = root
         self.timeout = timeout
         self.all_files = all_files or []
+        self.dir_cache = DirCache()
+        self.path_cache = PathCache(root, self.all_files)
 
     @classmethod
     def handles(cls, files):
@@ -181,12 +207,12 @@ class ExecutionContext(six.with_metaclass(ExecutionContextMeta)):
             return (closest_root, cls)
         return (None, None)
 
-    def check_output(self, cmd, timeout=None, keep_rc=False, env=None, signum=None):
+    def check_output(self, cmd, timeout=None, keep_rc=False, env=None, signum=None, encoding="utf-8"):
         """ Subclasses can override to provide special
             environment setup, command prefixes, etc.
         """
         return subproc.call(cmd, timeout=timeout or self.timeout, signum=signum,
-                keep_rc=keep_rc, env=env)
+                keep_rc=keep_rc, env=env, encoding=encoding)
 
     def shell_out(self, cmd, split=True, timeout=None, keep_rc=False, env=None, signum=None):
         env = env or os.environ
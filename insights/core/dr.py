@@ -48,18 +48,27 @@ instead of at the end.
 """
 from __future__ import print_function
 
+import heapq
 import inspect
 import logging
 import json
 import os
+import pickle
 import pkgutil
 import re
+import select
+import signal
 import six
 import sys
+import threading
 import time
 import traceback
 
 from collections import defaultdict
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
 from functools import reduce as _reduce
 
 from insights.contrib import importlib
@@ -81,6 +90,8 @@ DEPENDENTS = defaultdict(set)
 COMPONENTS = defaultdict(lambda: defaultdict(set))
 
 DELEGATES = {}
+COMPONENT_IDS = {}
+COMPONENTS_BY_ID = []
 HIDDEN = set()
 IGNORE = defaultdict(set)
 ENABLED = defaultdict(lambda: True)
@@ -124,6 +135,55 @@ def is_enabled(component):
     return ENABLED[component]
 
 
+BUDGETS = {}
+"""
+dict: component or component type to the number of seconds it may take to
+evaluate. See :func:`set_budget`.
+"""
+
+
+def set_budget(component, seconds):
+    """
+    Sets how long a component may take to evaluate. A component that takes
+    longer gets a :class:`ComponentTimeout` recorded in ``broker.exceptions``,
+    and evaluation continues with the rest of the graph.
+
+    Only components declared with ``isolated=True`` are interrupted during
+    serial evaluation. See :attr:`ComponentType.isolated`. Others run to
+    completion, and a warning is logged if they took too long. With a thread
+    pool, the dependents of any component that blows its budget are released
+    without it, and its thread is left to finish in the background.
+
+    Args:
+        component (str, callable, or ComponentType subclass): the component,
+            its fully qualified name, or a component type. A type's budget
+            applies to every component of that type or its subtypes that
+            doesn't have its own.
+        seconds (float): the budget. ``None`` removes it.
+    """
+    if isinstance(component, six.string_types):
+        component = get_component(component)
+
+    if seconds is None:
+        BUDGETS.pop(component, None)
+    elif component:
+        BUDGETS[component] = seconds
+
+
+def get_budget(component):
+    """
+    Returns the number of seconds the component may take to evaluate or
+    ``None`` if it has no budget.
+    """
+    if component in BUDGETS:
+        return BUDGETS[component]
+    delegate = DELEGATES.get(component)
+    if delegate is not None:
+        for t in type(delegate).__mro__:
+            if t in BUDGETS:
+                return BUDGETS[t]
+
+
 def get_delegate(component):
     return DELEGATES.get(component)
 
@@ -238,6 +298,26 @@ class SkipComponent(Exception):
     pass
 
 
+class ComponentTimeout(Exception):
+    """
+    Recorded in ``broker.exceptions`` for a component that took longer than
+    its budget. See :func:`set_budget`.
+    """
+    def __init__(self, component, budget):
+        self.component = component
+        self.budget = budget
+        super(ComponentTimeout, self).__init__("%s took longer than %ss" % (get_name(component), budget))
+
+
+class IsolationError(Exception):
+    """
+    Recorded in ``broker.exceptions`` for a component evaluated in its own
+    process when it failed and its exception couldn't be sent back, or when
+    the process exited without sending anything.
+    """
+    pass
+
+
 def get_name(component):
     """
     Attempt to get the string name of component, including module and class if
@@ -456,6 +536,106 @@ def load_components(*paths, **kwargs):
     return num_loaded
 
 
+MANIFEST = {}
+"""
+dict: component name to its manifest entry. Populated by
+:func:`load_manifest` and used by :func:`load_from_manifest`.
+"""
+
+
+def generate_manifest(components=None):
+    """
+    Generates a manifest of the registered components that can be saved as
+    JSON and later passed to :func:`load_manifest`.
+
+    Args:
+        components (iterable): the components to include. Defaults to every
+            registered component.
+
+    Returns:
+        dict: ``{"components": {name: entry}}`` where each entry has the
+        component's ``type``, ``module``, ``group``, and the names of its
+        ``dependencies``.
+    """
+    components = DELEGATES if components is None else components
+    entries = {}
+    for c in components:
+        delegate = get_delegate(c)
+        entries[get_name(c)] = {
+            "type": get_name(delegate.type) if delegate.type else None,
+            "module": get_module_name(c),
+            "group": "cluster" if delegate.group == GROUPS.cluster else "single",
+            "dependencies": sorted(get_name(d) for d in delegate.get_dependencies()),
+        }
+    return {"components": entries}
+
+
+def load_manifest(path):
+    """
+    Loads a manifest created with :func:`generate_manifest` into
+    :data:`MANIFEST`, replacing any that was loaded before.
+
+    Returns:
+        dict: the whole manifest so callers can check any extra keys.
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    MANIFEST.clear()
+    MANIFEST.update(manifest["components"])
+    return manifest
+
+
+def get_manifest_modules(components):
+    """
+    Returns the names of the modules that must be imported for the dependency
+    graphs of ``components`` to be complete according to :data:`MANIFEST`.
+    That includes the modules providing implementations of registry points,
+    which nothing imports directly.
+
+    Args:
+        components (iterable): components or fully qualified component names.
+            Components missing from the manifest are walked with their live
+            dependencies.
+    """
+    modules = set()
+    seen = set()
+    stack = list(components)
+    while stack:
+        c = stack.pop()
+        name = c if isinstance(c, six.string_types) else get_name(c)
+        if name in seen:
+            continue
+        seen.add(name)
+
+        entry = MANIFEST.get(name)
+        if entry is not None:
+            if entry["module"]:
+                modules.add(entry["module"])
+            stack.extend(entry["dependencies"])
+        elif not isinstance(c, six.string_types):
+            stack.extend(get_dependencies(c))
+        else:
+            log.debug("%s isn't in the manifest." % name)
+    return modules
+
+
+def load_from_manifest(*components):
+    """
+    Imports only the modules needed to evaluate ``components`` instead of
+    every module under the default plugin packages. See
+    :func:`get_manifest_modules`.
+
+    Returns:
+        int: The number of modules imported.
+    """
+    num_loaded = 0
+    for name in sorted(get_manifest_modules(components)):
+        if name not in sys.modules:
+            _import(name, True)
+            num_loaded += 1
+    return num_loaded
+
+
 def first_of(dependencies, broker):
     for d in dependencies:
         if d in broker:
@@ -496,6 +676,10 @@ def _register_component(delegate):
         if issubclass(delegate.type, k) and delegate.type is not k:
             v.add(component)
     DELEGATES[component] = delegate
+    if component not in COMPONENT_IDS:
+        COMPONENT_IDS[component] = len(COMPONENTS_BY_ID)
+        COMPONENTS_BY_ID.append(component)
+    _registry_changed()
 
     MODULE_NAMES[component] = get_module_name(component)
     BASE_MODULE_NAMES[component] = get_base_module_name(component)
@@ -593,6 +777,19 @@ class ComponentType(object):
     group: ``GROUPS.single`` or ``GROUPS.cluster``. Used to organize components
     into "groups" that run together with :func:`insights.core.dr.run`.
     """
+    isolated = False
+    """
+    if ``True``, a component with a budget is interrupted once it has used it.
+    Pass ``isolated=True`` to the decorator to opt a component in. It's
+    evaluated in a forked process when possible, so it can be killed even
+    while it's stuck in C code like a regular expression match. Forking isn't
+    safe while other threads are running, and a result that can't be
+    serialized with :mod:`insights.core.serde` can't be sent back, so then
+    it's evaluated in this process and interrupted by a :class:`ComponentTimeout`
+    raised from a ``SIGALRM`` handler. That can happen anywhere in the
+    component, so it must not leave child processes or open files behind when
+    an exception interrupts it.
+    """
 
     def __init__(self, *deps, **kwargs):
         """
@@ -665,10 +862,44 @@ class ComponentType(object):
         args = [results.get(d) for d in self.deps]
         return self.component(*args)
 
+    def _get_masks(self):
+        """
+        Returns the requirements split into a bitset of component ids and a
+        list of keys that aren't registered components. The first element is
+        for the required dependencies and the second is a list of the same
+        for each "at least one" group.
+        """
+        masks = getattr(self, "_masks", None)
+        if masks is None or masks[0] != _GENERATION[0]:
+            def split(deps):
+                mask, extra = 0, []
+                for d in deps:
+                    i = COMPONENT_IDS.get(d) if hashable(d) else None
+                    if i is None:
+                        extra.append(d)
+                    else:
+                        mask |= 1 << i
+                return mask, extra
+            masks = (_GENERATION[0], split(self.requires), [split(g) for g in self.at_least_one])
+            self._masks = masks
+        return masks[1], masks[2]
+
+    def _has_dependencies(self, broker):
+        (mask, extra), groups = self._get_masks()
+        present = broker.present
+        if present & mask != mask or not all(e in broker for e in extra):
+            return False
+        for mask, extra in groups:
+            if not (present & mask or any(e in broker for e in extra)):
+                return False
+        return True
+
     def get_missing_dependencies(self, broker):
         """
         Gets required and at-least-one dependencies not provided by the broker.
         """
+        if isinstance(broker, CompactBroker) and self._has_dependencies(broker):
+            return
         missing_required = [r for r in self.requires if r not in broker]
         missing_at_least_one = [d for d in self.at_least_one if not set(d).intersection(broker)]
         if missing_required or missing_at_least_one:
@@ -680,6 +911,8 @@ class ComponentType(object):
         """
         if any(i in broker for i in IGNORE.get(self.component, [])):
             raise SkipComponent()
+        if isinstance(broker, Broker):
+            broker.resolve(self.dependencies)
         missing = self.get_missing_dependencies(broker)
         if missing:
             raise MissingRequirements(missing)
@@ -697,6 +930,34 @@ class ComponentType(object):
 
         DEPENDENCIES[self.component].add(dep)
         COMPONENTS[group][self.component].add(dep)
+        self._masks = None
+        _registry_changed()
+
+
+class Lazy(object):
+    """
+    A placeholder for a value in a :class:`Broker` that's created by calling
+    ``load`` the first time it's read. If ``load`` raises an exception, the
+    component is removed from the broker as if it never had a value. See
+    :meth:`Broker.set_lazy`.
+    """
+    def __init__(self, load):
+        self._load = load
+        self._lock = threading.Lock()
+        self._result = None
+
+    def get(self):
+        with self._lock:
+            if self._result is None:
+                try:
+                    self._result = (self._load(), None)
+                except Exception as ex:
+                    self._result = (None, ex)
+                self._load = None
+        value, ex = self._result
+        if ex is not None:
+            raise ex
+        return value
 
 
 class Broker(object):
@@ -729,13 +990,21 @@ class Broker(object):
             :func:`time.time`. For components that produce multiple instances,
             the execution time here is the sum of their individual execution
             times.
+        profiler (Profiler): an optional
+            :class:`insights.core.profiler.Profiler` that records detailed
+            measurements of each component's evaluation.
+        plan (ExecutionPlan): the plan :func:`run` last evaluated with the
+            broker, or ``None``.
     """
     def __init__(self, seed_broker=None):
         self.instances = dict(seed_broker.instances) if seed_broker else {}
+        self._lazy = seed_broker._lazy if seed_broker is not None else False
         self.missing_requirements = {}
         self.exceptions = defaultdict(list)
         self.tracebacks = {}
         self.exec_times = {}
+        self.profiler = seed_broker.profiler if seed_broker is not None else None
+        self.plan = None
 
         self.observers = defaultdict(set)
         if seed_broker is not None:
@@ -806,21 +1075,61 @@ class Broker(object):
         return self.instances.keys()
 
     def items(self):
+        self.resolve(list(self.instances))
         return self.instances.items()
 
     def values(self):
+        self.resolve(list(self.instances))
         return self.instances.values()
 
     def get_by_type(self, _type):
         """
         Return all of the instances of :class:`ComponentType` ``_type``.
         """
+        keys = [k for k in list(self.instances) if get_component_type(k) is _type]
+        self.resolve(keys)
         r = {}
-        for k, v in self.items():
-            if get_component_type(k) is _type:
-                r[k] = v
+        for k in keys:
+            if k in self.instances:
+                r[k] = self.instances[k]
         return r
 
+    def set_lazy(self, component, load):
+        """
+        Gives ``component`` a value that's created by calling ``load`` the
+        first time it's read. Until then, the component is in the broker
+        without its value being loaded.
+        """
+        self[component] = Lazy(load)
+        self._lazy = True
+
+    def _load(self, component, value):
+        try:
+            loaded = value.get()
+        except Exception as ex:
+            log.debug("Couldn't load %s: %r", get_name(component), ex)
+            if self.instances.get(component) is value:
+                del self.instances[component]
+            raise KeyError("Unknown component: %s" % get_name(component))
+        if self.instances.get(component) is value:
+            self.instances[component] = loaded
+        return loaded
+
+    def resolve(self, components):
+        """
+        Loads the lazy values of ``components``. The ones that fail to load
+        are removed.
+        """
+        if not self._lazy:
+            return
+        for c in components:
+            value = self.instances.get(c) if hashable(c) else None
+            if isinstance(value, Lazy):
+                try:
+                    self._load(c, value)
+                except KeyError:
+                    pass
+
     def __contains__(self, component):
         return component in self.instances
 
@@ -838,7 +1147,10 @@ class Broker(object):
 
     def __getitem__(self, component):
         if component in self.instances:
-            return self.instances[component]
+            value = self.instances[component]
+            if isinstance(value, Lazy):
+                return self._load(component, value)
+            return value
 
         raise KeyError("Unknown component: %s" % get_name(component))
 
@@ -854,6 +1166,109 @@ class Broker(object):
                  for c in sorted(self.get_by_type(component_type), key=get_name))))
 
 
+class _SlotMap(MutableMapping):
+    """
+    A mapping keyed by components. Values for registered components are kept
+    in a list indexed by the dense ids assigned in ``_register_component``,
+    and anything else is kept in a dictionary. A bitset of the ids with values
+    is maintained for fast dependency checks.
+    """
+    _EMPTY = object()
+
+    def __init__(self, factory=None):
+        self._slots = []
+        self._extra = {}
+        self._len = 0
+        self.present = 0
+        self.factory = factory
+
+    def _get_id(self, key):
+        return COMPONENT_IDS.get(key) if hashable(key) else None
+
+    def __getitem__(self, key):
+        i = self._get_id(key)
+        if i is None:
+            if key in self._extra or self.factory is None:
+                return self._extra[key]
+        else:
+            if i < len(self._slots) and self._slots[i] is not self._EMPTY:
+                return self._slots[i]
+            if self.factory is None:
+                raise KeyError(key)
+        value = self[key] = self.factory()
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        i = self._get_id(key)
+        if i is None:
+            if key not in self._extra:
+                self._len += 1
+            self._extra[key] = value
+            return
+        slots = self._slots
+        if i >= len(slots):
+            slots.extend([self._EMPTY] * (i + 1 - len(slots)))
+        if slots[i] is self._EMPTY:
+            self._len += 1
+            self.present |= 1 << i
+        slots[i] = value
+
+    def __delitem__(self, key):
+        i = self._get_id(key)
+        if i is None:
+            del self._extra[key]
+        else:
+            if i >= len(self._slots) or self._slots[i] is self._EMPTY:
+                raise KeyError(key)
+            self._slots[i] = self._EMPTY
+            self.present &= ~(1 << i)
+        self._len -= 1
+
+    def __contains__(self, key):
+        i = self._get_id(key)
+        if i is None:
+            return key in self._extra
+        return i < len(self._slots) and self._slots[i] is not self._EMPTY
+
+    def __iter__(self):
+        for i, v in enumerate(self._slots):
+            if v is not self._EMPTY:
+                yield COMPONENTS_BY_ID[i]
+        for k in list(self._extra):
+            yield k
+
+    def __len__(self):
+        return self._len
+
+
+class CompactBroker(Broker):
+    """
+    A :class:`Broker` that keeps its state in arrays indexed by the dense
+    integer ids components get when they're registered instead of in
+    dictionaries keyed by the components themselves. ``instances``,
+    ``exec_times``, ``exceptions``, and ``missing_requirements`` are still
+    mappings keyed by component, so code written against :class:`Broker`
+    works unchanged. Dependency checks for registered components are done
+    with bitsets.
+    """
+    def __init__(self, seed_broker=None):
+        super(CompactBroker, self).__init__(seed_broker)
+        instances = _SlotMap()
+        instances.update(self.instances)
+        self.instances = instances
+        self.missing_requirements = _SlotMap()
+        self.exceptions = _SlotMap(list)
+        self.exec_times = _SlotMap()
+
+    @property
+    def present(self):
+        """ The bitset of ids of the registered components with values. """
+        return self.instances.present
+
+
 def get_missing_requirements(func, requires, d):
     """
     .. deprecated:: 1.x
@@ -914,11 +1329,13 @@ def run_order(graph):
     Returns components in an order that satisfies their dependency
     relationships.
     """
+    if isinstance(graph, ExecutionPlan):
+        return list(graph.order)
     return toposort_flatten(graph, sort=False)
 
 
 def _determine_components(components):
-    if isinstance(components, dict):
+    if isinstance(components, (dict, ExecutionPlan)):
         return components
 
     if hashable(components) and components in COMPONENTS_BY_TYPE:
@@ -937,59 +1354,746 @@ def _determine_components(components):
         return COMPONENTS[components]
 
 
-def run(components=None, broker=None):
+class ExecutionPlan(object):
     """
-    Executes components in an order that satisfies their dependency
-    relationships.
+    An immutable, precomputed execution plan for a dependency graph. Building
+    the graph and sorting it are done once when the plan is compiled, and the
+    plan can then be passed to :func:`run`, :func:`run_incremental`, or
+    :func:`run_all` any number of times and with any number of brokers.
+
+    A plan is also a read only mapping of components to their dependencies,
+    so it can be used anywhere a dependency graph is expected.
+
+    Create plans with :func:`compile_plan`.
+
+    Attributes:
+        order (tuple): the components in an order that satisfies their
+            dependency relationships.
+        ids (dict): component -> integer id, which is its index in ``order``.
+        dependencies (tuple): for each id, a bitset of the ids of the
+            component's dependencies.
+        dependents (tuple): for each id, a tuple of the ids of the component's
+            dependents.
+        delegates (tuple): for each id, the component's delegate or ``None``
+            if the component isn't registered. Only components that are keys of
+            the original graph have delegates here, since only they are
+            evaluated.
+    """
+    __slots__ = ("order", "ids", "dependencies", "dependents", "delegates", "_graph", "_subplans")
+
+    def __init__(self, graph):
+        graph = dict((k, set(v)) for k, v in graph.items())
+        order = tuple(toposort_flatten(dict((k, set(v)) for k, v in graph.items()), sort=False))
+        ids = dict((c, i) for i, c in enumerate(order))
+
+        dependencies = []
+        dependents = [[] for _ in order]
+        for i, c in enumerate(order):
+            mask = 0
+            for d in graph.get(c, ()):
+                if d is not c:
+                    mask |= 1 << ids[d]
+                    dependents[ids[d]].append(i)
+            dependencies.append(mask)
+
+        _set = object.__setattr__
+        _set(self, "order", order)
+        _set(self, "ids", ids)
+        _set(self, "dependencies", tuple(dependencies))
+        _set(self, "dependents", tuple(tuple(d) for d in dependents))
+        _set(self, "delegates", tuple(DELEGATES.get(c) if c in graph else None for c in order))
+        _set(self, "_graph", dict((k, frozenset(v)) for k, v in graph.items()))
+        _set(self, "_subplans", None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ExecutionPlan is immutable.")
+
+    def __contains__(self, component):
+        return component in self._graph
+
+    def __getitem__(self, component):
+        return self._graph[component]
+
+    def __iter__(self):
+        return iter(self._graph)
+
+    def __len__(self):
+        return len(self._graph)
+
+    def get(self, component, default=None):
+        return self._graph.get(component, default)
+
+    def keys(self):
+        return self._graph.keys()
+
+    def values(self):
+        return self._graph.values()
+
+    def items(self):
+        return self._graph.items()
+
+    def get_subplans(self):
+        """
+        Returns plans for the disjoint subgraphs of this plan. They're
+        computed the first time they're requested.
+        """
+        if self._subplans is None:
+            graph = dict((k, set(v)) for k, v in self._graph.items())
+            plans = tuple(ExecutionPlan(g) for g in get_subgraphs(graph))
+            object.__setattr__(self, "_subplans", plans)
+        return self._subplans
+
+
+_PLAN_CACHE = {}
+_GENERATION = [0]
+
+
+def _registry_changed():
+    _PLAN_CACHE.clear()
+    _GENERATION[0] += 1
+
+
+def compile_plan(components=None):
+    """
+    Compiles an :class:`ExecutionPlan` that can be reused across runs and
+    brokers.
 
     Keyword Args:
         components: Can be one of a dependency graph, a single component, a
-            component group, or a component type. If it's anything other than a
-            dependency graph, the appropriate graph is built for you and before
-            evaluation.
-        broker (Broker): Optionally pass a broker to use for evaluation. One is
-            created by default, but it's often useful to seed a broker with an
-            initial dependency.
+            component group, or a component type, just like the parameter to
+            :func:`run`. Plans for everything except dependency graphs are
+            cached until another component is registered.
+
     Returns:
-        Broker: The broker after evaluation.
+        ExecutionPlan: the compiled plan.
     """
-    components = components or COMPONENTS[GROUPS.single]
-    components = _determine_components(components)
-    broker = broker or Broker()
+    if isinstance(components, ExecutionPlan):
+        return components
 
-    for component in run_order(components):
-        start = time.time()
+    components = components or GROUPS.single
+    key = components if hashable(components) else None
+    if key is not None and key in _PLAN_CACHE:
+        return _PLAN_CACHE[key]
+
+    plan = ExecutionPlan(_determine_components(components) or {})
+    if key is not None:
+        _PLAN_CACHE[key] = plan
+    return plan
+
+
+class _Demand(object):
+    """
+    Tracks which components of a plan can still affect one of the targets.
+
+    A component is dead if it can't produce a value: it isn't in the broker
+    and it isn't registered or enabled, it finished without a value, or one
+    of its required dependencies or all of one of its "at least one" groups is
+    dead. A component is wanted if it's a target or an alive, wanted component
+    depends on it. When a component dies, it stops wanting its dependencies,
+    so whole subtrees that only it needed are never evaluated.
+    """
+    def __init__(self, plan, broker, targets):
+        self.plan = plan
+        n = len(plan.order)
+        self.target = [False] * n
+        for t in targets:
+            if t in plan.ids:
+                self.target[plan.ids[t]] = True
+
+        self.broker = broker
+        self.dead = [False] * n
+        self.count = [0] * n
+        self.demands = [()] * n
+
+        for i, c in enumerate(plan.order):
+            if c not in broker and (plan.delegates[i] is None or not is_enabled(c)):
+                self.kill(i)
+
+        for i in range(n - 1, -1, -1):
+            c = plan.order[i]
+            if self.dead[i] or c in broker or not self.wanted(i):
+                continue
+            demands = []
+            for d in plan.get(c, ()):
+                j = plan.ids[d]
+                if not self.dead[j]:
+                    self.count[j] += 1
+                    demands.append(j)
+            self.demands[i] = demands
+
+    def wanted(self, i):
+        return self.target[i] or self.count[i] > 0
+
+    def withdraw(self, i):
+        demands, self.demands[i] = self.demands[i], ()
+        for j in demands:
+            self.count[j] -= 1
+            if not self.wanted(j):
+                self.withdraw(j)
+
+    def _is_broken(self, i, dep):
+        delegate = self.plan.delegates[i]
+        if delegate is None:
+            return False
+        if dep in delegate.requires:
+            return True
+        for group in delegate.at_least_one:
+            if dep in group and all(self.is_dead(d) for d in group):
+                return True
+        return False
+
+    def is_dead(self, component):
+        i = self.plan.ids.get(component)
+        if i is None:
+            return component not in self.broker
+        return self.dead[i]
+
+    def kill(self, i):
+        if self.dead[i]:
+            return
+        self.dead[i] = True
+        self.withdraw(i)
+        dep = self.plan.order[i]
+        for j in self.plan.dependents[i]:
+            if not self.dead[j] and self._is_broken(j, dep):
+                self.kill(j)
+
+    def finished(self, i, broker):
+        if self.plan.order[i] not in broker:
+            self.kill(i)
+
+
+def _get_targets(plan, broker, targets=True):
+    """
+    The targets of a demand driven run are the components passed in or, if
+    ``targets`` is ``True``, the components nothing else in the plan depends
+    on. Observers don't make components targets: formatters observe whole
+    types like parsers, and everything of those types would be evaluated.
+    """
+    if targets is not True:
+        return set(targets)
+    return set(c for i, c in enumerate(plan.order) if not plan.dependents[i] and c in plan)
+
+
+def get_demand(plan, broker, targets=True):
+    """
+    Returns the set of components in plan that can affect one of the targets
+    given the contents of broker. Components outside it don't need to be
+    evaluated.
+
+    Args:
+        plan (ExecutionPlan): a compiled plan.
+        broker (Broker): the broker the plan will be evaluated with.
+        targets: the components whose values are wanted. ``True`` selects the
+            components nothing else depends on.
+    """
+    plan = compile_plan(plan)
+    demand = _Demand(plan, broker, _get_targets(plan, broker, targets))
+    return set(c for i, c in enumerate(plan.order) if demand.wanted(i) and not demand.dead[i])
+
+
+class _Reuse(object):
+    """
+    Copies components from a previous evaluation into the broker instead of
+    evaluating them again.
+
+    A component is refreshed if it's in ``changed`` or if it was evaluated
+    again and either produced a value or had one before. A component is
+    copied from the previous broker if it had a value there and nothing it
+    depends on was refreshed. Components already in the broker when the run
+    starts, like the execution context, are never refreshed unless they're in
+    ``changed``.
+    """
+    def __init__(self, plan, broker, previous, changed):
+        self.plan = plan
+        self.previous = previous
+        self.refreshed = 0
+        self.reused = 0
+        self.seeded = 0
+        for c in changed:
+            if c in plan.ids:
+                self.refreshed |= 1 << plan.ids[c]
+        for i, c in enumerate(plan.order):
+            if c in broker:
+                self.seeded |= 1 << i
+
+    def seed(self, i, broker):
+        component = self.plan.order[i]
+        bit = 1 << i
+        if ((self.seeded | self.refreshed) & bit or component in broker or
+                component not in self.previous or self.refreshed & self.plan.dependencies[i]):
+            return
+        broker[component] = self.previous[component]
+        self.reused |= bit
+
+    def finished(self, i, broker):
+        bit = 1 << i
+        if (self.seeded | self.reused) & bit:
+            return
+        component = self.plan.order[i]
+        if component in broker or component in self.previous:
+            self.refreshed |= bit
+
+
+def _get_pins(broker):
+    """
+    Returns the types with type specific observers and the components that
+    observers want kept through a ``pins`` attribute, like the ones created
+    by :meth:`insights.core.serde.Hydration.make_persister`.
+    """
+    types = set()
+    pins = set()
+    for _type, observers in broker.observers.items():
+        if observers and _type is not ComponentType:
+            types.add(_type)
+        for o in observers:
+            pins |= set(getattr(o, "pins", ()))
+    return tuple(types), pins
+
+
+class _Refcounts(object):
+    """
+    Releases the values of components once every component in the plan that
+    depends on them has finished or been skipped. File backed content
+    providers are unloaded so their content can be read again if anything
+    asks for it, and other values are removed from the broker.
+
+    Values are never released for components nothing in the plan depends on,
+    rules, targets, components that were in the broker when the run started,
+    components of types with type specific observers, and components
+    observers pin.
+    """
+    def __init__(self, plan, broker, demand=None):
+        from insights.core.plugins import is_rule
+
+        self.plan = plan
+        self.broker = broker
+        self.remaining = [len(d) for d in plan.dependents]
+        types, pins = _get_pins(broker)
+        self.keep = [False] * len(plan.order)
+        for i, c in enumerate(plan.order):
+            delegate = plan.delegates[i]
+            self.keep[i] = (c in broker or c in pins or is_rule(c) or
+                            (demand is not None and demand.target[i]) or
+                            (delegate is not None and issubclass(delegate.type, types)))
+
+    def finished(self, i):
+        deps = self.plan.dependencies[i]
+        while deps:
+            low = deps & -deps
+            deps ^= low
+            j = low.bit_length() - 1
+            self.remaining[j] -= 1
+            if not self.remaining[j] and not self.keep[j]:
+                self.release(j)
+
+    def release(self, i):
+        from insights.core.spec_factory import ContentProvider
+
+        component = self.plan.order[i]
+        value = self.broker.instances.get(component)
+        if value is None or isinstance(value, Lazy):
+            return
+        values = value if isinstance(value, list) else [value]
+        if all(isinstance(v, ContentProvider) for v in values):
+            if all([v.unload() for v in values]):
+                return
+        del self.broker.instances[component]
+
+
+def _get_previous(previous):
+    # a Hydration snapshot of the previous evaluation
+    if hasattr(previous, "hydrate"):
+        return previous.hydrate()
+    return previous
+
+
+def _should_run(i, plan, broker):
+    component = plan.order[i]
+    return (plan.delegates[i] is not None and component not in broker and
+            is_enabled(component))
+
+
+def _in_main_thread():
+    main = getattr(threading, "main_thread", None)
+    if main is not None:
+        return threading.current_thread() is main()
+    return isinstance(threading.current_thread(), threading._MainThread)
+
+
+def _call_with_alarm(component, delegate, broker, budget):
+    """
+    Invokes the delegate with a SIGALRM timer that raises
+    :class:`ComponentTimeout` if it's still running after ``budget`` seconds.
+    Signals are only delivered to the main thread, so anywhere else the
+    delegate is simply invoked.
+    """
+    if not hasattr(signal, "setitimer") or not _in_main_thread():
+        return delegate.process(broker)
+
+    def expired(signum, frame):
+        raise ComponentTimeout(component, budget)
+
+    old = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, budget)
+    try:
+        return delegate.process(broker)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, old)
+
+
+def _isolated_child(delegate, broker, w):
+    from insights.core.serde import marshal
+    try:
         try:
-            if (component not in broker and component in components and
-               component in DELEGATES and
-               is_enabled(component)):
-                log.info("Trying %s" % get_name(component))
-                result = DELEGATES[component].process(broker)
-                broker[component] = result
-        except MissingRequirements as mr:
+            data, errors = marshal(delegate.process(broker), inherit=True)
+            msg = ("value", data) if not errors else ("unsendable",)
+        except SkipComponent:
+            msg = ("skip",)
+        except Exception as ex:
+            msg = ("error", ex, traceback.format_exc())
+        try:
+            payload = pickle.dumps(msg, 2)
+        except Exception:
+            msg = ("unsendable",) if msg[0] == "value" else ("error", None, msg[2])
+            payload = pickle.dumps(msg, 2)
+        with os.fdopen(w, "wb") as f:
+            f.write(payload)
+    finally:
+        os._exit(0)
+
+
+def _process_isolated(component, delegate, broker, budget):
+    """
+    Invokes the delegate in a forked process that's killed if it doesn't
+    finish within ``budget`` seconds. Returns a (result, exception,
+    traceback) tuple, or ``None`` if the result couldn't be sent back.
+    Exceptions that can't be sent back are reported as an
+    :class:`IsolationError`.
+    """
+    from insights.core.serde import unmarshal
+
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        _isolated_child(delegate, broker, w)
+    os.close(w)
+
+    deadline = time.time() + budget
+    chunks = []
+    try:
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0 or not select.select([r], [], [], remaining)[0]:
+                os.kill(pid, signal.SIGKILL)
+                ex = ComponentTimeout(component, budget)
+                return None, ex, "".join(traceback.format_exception_only(type(ex), ex))
+            chunk = os.read(r, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(r)
+        os.waitpid(pid, 0)
+
+    try:
+        msg = pickle.loads(b"".join(chunks)) if chunks else ("error", None, None)
+        if msg[0] == "value":
+            return unmarshal(msg[1], inherit=True), None, None
+    except Exception as ex:
+        log.debug("Couldn't use the result of %s from its process: %r" % (get_name(component), ex))
+        return None
+
+    if msg[0] == "unsendable":
+        return None
+    if msg[0] == "skip":
+        return None, SkipComponent(), None
+    ex = msg[1]
+    if ex is None:
+        ex = IsolationError("Couldn't send the outcome of %s from its process." % get_name(component))
+    return None, ex, msg[2]
+
+
+def _process(component, delegate, broker):
+    """
+    Invokes the component's delegate and captures the outcome instead of
+    raising it. Returns a (result, exception, traceback) tuple. Components
+    with a budget are interrupted once they've used it. See
+    :func:`set_budget`. The broker's profiler, if it has one, is told when
+    the component starts and stops.
+    """
+    log.info("Trying %s" % get_name(component))
+    profiler = broker.profiler
+    if profiler is None:
+        return _evaluate(component, delegate, broker)
+
+    token = profiler.start(component)
+    outcome = _evaluate(component, delegate, broker)
+    profiler.stop(component, token, broker, outcome)
+    return outcome
+
+
+def _evaluate(component, delegate, broker):
+    budget = get_budget(component)
+    isolated = budget and delegate.isolated
+    if (isolated and hasattr(os, "fork") and threading.active_count() == 1 and
+            not delegate.get_missing_dependencies(broker)):
+        outcome = _process_isolated(component, delegate, broker, budget)
+        if outcome is not None:
+            return outcome
+        log.debug("Evaluating %s in this process." % get_name(component))
+
+    try:
+        if isolated:
+            return _call_with_alarm(component, delegate, broker, budget), None, None
+        if not budget:
+            return delegate.process(broker), None, None
+        start = time.time()
+        result = delegate.process(broker)
+        if time.time() - start > budget:
+            log.warning("%s took longer than its budget of %ss." % (get_name(component), budget))
+        return result, None, None
+    except SkipComponent as sc:
+        return None, sc, None
+    except MissingRequirements as mr:
+        return None, mr, None
+    except Exception as ex:
+        return None, ex, traceback.format_exc()
+
+
+def _timed_process(component, delegate, broker):
+    start = time.time()
+    return start, _process(component, delegate, broker)
+
+
+def _finish(component, broker, start, outcome=None):
+    """
+    Records the outcome of a component's evaluation in the broker and fires
+    its observers. ``outcome`` is ``None`` if the component wasn't tried.
+    """
+    if outcome is not None:
+        result, ex, tb = outcome
+        if ex is None:
+            broker[component] = result
+        elif isinstance(ex, MissingRequirements):
             if log.isEnabledFor(logging.DEBUG):
                 name = get_name(component)
-                reqs = stringify_requirements(mr.requirements)
+                reqs = stringify_requirements(ex.requirements)
                 log.debug("%s missing requirements %s" % (name, reqs))
-            broker.add_exception(component, mr)
-        except SkipComponent:
-            pass
-        except Exception as ex:
-            tb = traceback.format_exc()
+            broker.add_exception(component, ex)
+        elif not isinstance(ex, SkipComponent):
             log.warning(tb)
             broker.add_exception(component, ex, tb)
-        finally:
-            broker.exec_times[component] = time.time() - start
-            broker.fire_observers(component)
+    broker.exec_times[component] = time.time() - start
+    broker.fire_observers(component)
+
+
+def _run_serial(plan, broker, demand=None, reuse=None, refs=None):
+    for i, component in enumerate(plan.order):
+        if demand is not None and not demand.wanted(i):
+            if refs is not None:
+                refs.finished(i)
+            continue
+        if reuse is not None:
+            reuse.seed(i, broker)
+        start = time.time()
+        outcome = None
+        if _should_run(i, plan, broker):
+            outcome = _process(component, plan.delegates[i], broker)
+        _finish(component, broker, start, outcome)
+        if reuse is not None:
+            reuse.finished(i, broker)
+        if demand is not None:
+            demand.finished(i, broker)
+        if refs is not None:
+            refs.finished(i)
+    return broker
 
+
+def _run_scheduled(plan, broker, pool, demand=None, reuse=None, refs=None):
+    """
+    Evaluates the plan with ``pool``. Each component is submitted as soon as
+    all of its dependencies have finished, so independent components run
+    concurrently. Results are recorded and observers are fired on the calling
+    thread.
+
+    Worker threads can't be interrupted, so a component that blows its budget
+    is recorded as timed out and its dependents are released while its thread
+    is left to finish in the background.
+    """
+    from concurrent.futures import wait, FIRST_COMPLETED
+
+    order = plan.order
+    waiting = [bin(m).count("1") for m in plan.dependencies]
+    ready = [i for i, w in enumerate(waiting) if not w]
+    heapq.heapify(ready)
+
+    def release(i):
+        if reuse is not None:
+            reuse.finished(i, broker)
+        if demand is not None:
+            demand.finished(i, broker)
+        if refs is not None:
+            refs.finished(i)
+        for d in plan.dependents[i]:
+            waiting[d] -= 1
+            if not waiting[d]:
+                heapq.heappush(ready, d)
+
+    started = {}
+    budgets = {}
+
+    def timed_process(i):
+        started[i] = time.time()
+        return _timed_process(order[i], plan.delegates[i], broker)
+
+    def get_timeout():
+        now = time.time()
+        timeouts = [budget if i not in started else started[i] + budget - now
+                    for i, budget in budgets.values()]
+        return max(min(timeouts), 0) if timeouts else None
+
+    running = {}
+    while ready or running:
+        while ready:
+            i = heapq.heappop(ready)
+            if demand is not None and not demand.wanted(i):
+                release(i)
+                continue
+            if reuse is not None:
+                reuse.seed(i, broker)
+            if _should_run(i, plan, broker):
+                f = pool.submit(timed_process, i)
+                running[f] = i
+                budget = get_budget(order[i])
+                if budget:
+                    budgets[f] = (i, budget)
+            else:
+                _finish(order[i], broker, time.time())
+                release(i)
+
+        if running:
+            done, _ = wait(running, timeout=get_timeout(), return_when=FIRST_COMPLETED)
+            for f in sorted(done, key=running.get):
+                i = running.pop(f)
+                budgets.pop(f, None)
+                start, outcome = f.result()
+                _finish(order[i], broker, start, outcome)
+                release(i)
+
+            now = time.time()
+            expired = [f for f, (i, budget) in budgets.items() if i in started and started[i] + budget <= now]
+            for f in sorted(expired, key=running.get):
+                i = running.pop(f)
+                _, budget = budgets.pop(f)
+                ex = ComponentTimeout(order[i], budget)
+                tb = "".join(traceback.format_exception_only(type(ex), ex))
+                _finish(order[i], broker, started[i], (None, ex, tb))
+                release(i)
     return broker
 
 
+def _record_fingerprints(broker):
+    from insights.core.context import ExecutionContext
+    for value in list(broker.instances.values()):
+        if isinstance(value, ExecutionContext):
+            value.fingerprints = True
+
+
+def run(components=None, broker=None, pool=None, targets=None, previous=None, changed=None, profiler=None,
+        release=False, fingerprints=False):
+    """
+    Executes components in an order that satisfies their dependency
+    relationships.
+
+    Keyword Args:
+        components: Can be one of a dependency graph, a single component, a
+            component group, a component type, or an :class:`ExecutionPlan`
+            from :func:`compile_plan`. If it's anything other than a plan, one
+            is compiled for you before evaluation.
+        broker (Broker): Optionally pass a broker to use for evaluation. One is
+            created by default, but it's often useful to seed a broker with an
+            initial dependency.
+        pool (Executor): Optionally pass a ``concurrent.futures`` thread pool.
+            Components are dispatched to it as soon as their dependencies have
+            finished instead of one at a time. Results, exceptions, timings,
+            and observers are still handled on the calling thread. If it's a
+            process pool, parsers are evaluated by worker processes with
+            :func:`insights.core.shards.run_sharded`.
+        targets: Optionally evaluate on demand. Only components that can
+            affect one of the targets are evaluated, and the dependencies of a
+            component are abandoned as soon as one of its requirements is known
+            to be missing. Skipped components aren't tried at all, so they have
+            no timings and their observers aren't fired. Can be a list of
+            components or ``True`` to use the components nothing else in the
+            graph depends on.
+        previous: Optionally reuse the results of an earlier evaluation of the
+            same components. Can be its :class:`Broker` or a
+            :class:`insights.core.serde.Hydration` it was saved with. Only the
+            components in ``changed`` and the ones that depend on them are
+            evaluated again. Everything else is copied from ``previous``. A
+            process pool is ignored when reusing results. Implies
+            ``fingerprints``, so this evaluation can be reused in turn.
+        changed: The components whose values may be different now. Defaults
+            to :func:`insights.core.spec_factory.get_changed` of ``previous``,
+            which uses the fingerprints of the files behind the datasources.
+        fingerprints (bool): Optionally record fingerprints of the files read
+            through the execution contexts in the broker, so this evaluation
+            can be passed as ``previous`` to a later one. Files are hashed when
+            they're first read, so it's off by default.
+        profiler (Profiler): Optionally record the wall time, CPU time,
+            memory, and input and output sizes of every component evaluated.
+            See :mod:`insights.core.profiler`. It's kept as the broker's
+            ``profiler``. Components evaluated by worker processes aren't
+            recorded.
+        release (bool): Optionally free memory during evaluation. Once
+            everything in the graph that depends on a component has finished,
+            its value is removed from the broker, or if it's a file backed
+            content provider, its content is unloaded. Rules, targets,
+            components nothing depends on, components seeded in the broker,
+            components of types with type specific observers, and components
+            pinned by observers, like those of
+            :meth:`insights.core.serde.Hydration.make_persister`, are kept.
+    Returns:
+        Broker: The broker after evaluation.
+    """
+    plan = compile_plan(components)
+    broker = broker or Broker()
+    broker.plan = plan
+    if fingerprints or previous is not None:
+        _record_fingerprints(broker)
+    if profiler is not None:
+        broker.profiler = profiler
+
+    demand = None
+    if targets:
+        demand = _Demand(plan, broker, _get_targets(plan, broker, targets))
+
+    reuse = None
+    if previous is not None:
+        previous = _get_previous(previous)
+        if changed is None:
+            from insights.core.spec_factory import get_changed
+            changed = get_changed(previous)
+        reuse = _Reuse(plan, broker, previous, changed)
+
+    refs = _Refcounts(plan, broker, demand) if release else None
+
+    if pool:
+        from insights.core import shards
+        if not shards.is_process_pool(pool):
+            return _run_scheduled(plan, broker, pool, demand=demand, reuse=reuse, refs=refs)
+        if reuse is None:
+            return shards.run_sharded(plan, broker, pool, demand=demand, refs=refs)
+
+    return _run_serial(plan, broker, demand=demand, reuse=reuse, refs=refs)
+
+
 def generate_incremental(components=None, broker=None):
-    components = components or COMPONENTS[GROUPS.single]
-    components = _determine_components(components)
-    for graph in get_subgraphs(components):
-        yield graph, broker or Broker()
+    for plan in compile_plan(components).get_subplans():
+        yield plan, broker or Broker()
 
 
 def run_incremental(components=None, broker=None):
@@ -1002,8 +2106,8 @@ def run_incremental(components=None, broker=None):
 
     Keyword Args:
         components: Can be one of a dependency graph, a single component, a
-            component group, or a component type. If it's anything other than a
-            dependency graph, the appropriate graph is built for you and before
+            component group, a component type, or an :class:`ExecutionPlan`.
+            If it's anything other than a plan, one is compiled for you before
             evaluation.
         broker (Broker): Optionally pass a broker to use for evaluation. One is
             created by default, but it's often useful to seed a broker with an
@@ -1017,6 +2121,9 @@ def run_incremental(components=None, broker=None):
 
 def run_all(components=None, broker=None, pool=None):
     if pool:
+        from insights.core import shards
+        if shards.is_process_pool(pool):
+            return [run(components, broker=broker, pool=pool)]
         futures = []
         for graph, _broker in generate_incremental(components, broker):
             futures.append(pool.submit(run, graph, _broker))
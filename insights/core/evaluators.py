@@ -75,6 +75,11 @@ class Evaluator(Formatter):
         return result
 
     def process(self, graph=None, parallel=False):
+        """
+        Evaluates graph, which can be anything :func:`insights.core.dr.run`
+        accepts, including an :class:`insights.core.dr.ExecutionPlan` that's
+        reused across evaluators.
+        """
         with self:
             if self.incremental:
                 self.run_incremental(graph, parallel)
@@ -1,15 +1,23 @@
+import fnmatch
 import logging
 import os
+import posixpath
+import re
+from collections import defaultdict
 
-from insights.core import archives, dr
+from insights.core import archivefs, archives, dr
 from insights.core.serde import Hydration
+from insights.core.spec_factory import get_archive_paths
 from insights.core.context import (ClusterArchiveContext,
+                                   ExecutionContext,
                                    ExecutionContextMeta,
                                    HostArchiveContext,
                                    SerializedArchiveContext)
 
 log = logging.getLogger(__name__)
 
+_MAGIC = re.compile(r"[\[*?]")
+
 if hasattr(os, "scandir"):
     def get_all_files(path):
         with os.scandir(path) as it:
@@ -62,14 +70,180 @@ def create_context(path, context=None):
     return context(common_path, all_files=all_files)
 
 
-def initialize_broker(path, context=None, broker=None):
-    ctx = create_context(path, context=context)
+def get_archive_context(path, context=None):
+    """
+    Returns a context that reads the archive at ``path`` in place from its
+    :class:`insights.core.archivefs.ArchiveFS`, or ``None`` if it has to be
+    extracted, and whether it has to be extracted completely. Cluster
+    archives, serialized archives, and archives the ``archivefs`` module
+    can't read are extracted, and only the archives it can't read may be
+    extracted selectively. The caller closes the context's ``archive``.
+    """
+    if not archivefs.ENABLED:
+        return None, False
+    try:
+        archive = archivefs.ArchiveFS(path)
+    except archives.InvalidArchive as ex:
+        log.debug(ex)
+        return None, False
+
+    all_files = archive.files()
+    top = archive.listdir(archive.root)
+    if not all_files or any(n.endswith(archives.COMPRESSION_TYPES) and not d for n, d in top):
+        archive.close()
+        return None, True
+
+    common_path, ctx = identify(all_files)
+    context = context or ctx
+    if issubclass(context, SerializedArchiveContext):
+        archive.close()
+        return None, True
+
+    ctx = context(common_path, all_files=all_files)
+    ctx.archive = ctx.path_cache = ctx.dir_cache = archive
+    return ctx, False
+
+
+def create_archive_context(path, context=None):
+    """
+    Returns a context that reads the archive at ``path`` in place, or
+    ``None`` if it has to be extracted. See :func:`get_archive_context`.
+    """
+    return get_archive_context(path, context=context)[0]
+
+
+def _escape(name):
+    """ Returns a glob pattern that matches only ``name``. """
+    return re.sub(r"([\[*?])", r"[\1]", name)
+
+
+def _union(patterns):
+    parts = []
+    for p in patterns:
+        p = fnmatch.translate(p)
+        if p.endswith("(?ms)"):
+            p = p[:-5]
+        parts.append("(?:%s)" % p)
+    return re.compile("(?s)" + "|".join(parts)).match
+
+
+def _compile(patterns):
+    """
+    Returns a function that tells whether a path matches one of the glob
+    ``patterns``. Patterns are grouped by the directory their literal start
+    is in, so a path is only matched against the groups of its ancestors.
+    """
+    groups = defaultdict(list)
+    for p in patterns:
+        m = _MAGIC.search(p)
+        literal = p if m is None else p[:m.start()]
+        groups[literal.rsplit("/", 1)[0]].append(p)
+    matchers = dict((d, _union(ps)) for d, ps in groups.items())
+
+    def match(path):
+        d = path
+        while "/" in d:
+            d = d.rsplit("/", 1)[0]
+            f = matchers.get(d)
+            if f is not None and f(path):
+                return True
+        return False
+    return match
+
+
+def _through_links(patterns, links):
+    """
+    Adds the patterns that result from replacing symlinks at their starts
+    with what the symlinks point to.
+    """
+    result = set(patterns)
+    pending = list(patterns)
+    for _ in range(8):
+        found = []
+        for p in pending:
+            for link, target in links.items():
+                if p == link or p.startswith(link + "/"):
+                    q = target + p[len(link):]
+                    if q not in result:
+                        result.add(q)
+                        found.append(q)
+        if not found:
+            break
+        pending = found
+    return result
+
+
+def get_include_patterns(path, components, context=None):
+    """
+    Returns glob patterns for :func:`insights.core.archives.extract` that
+    select the members of the archive at ``path`` that the datasources in
+    ``components`` may read, or ``None`` if everything should be extracted.
+
+    The archive is listed and identified like its extracted files would be.
+    The paths of the datasources that run in its context are then matched
+    under its root. Symlinks are always kept, and what the matched symlinks
+    point to is matched too. One file of the context's marker is also kept.
+    Cluster and serialized archives, archives that can't be listed, and
+    selections that wouldn't be identified the same way as the whole
+    archive are extracted completely.
+    """
+    members = archives.list_members(path)
+    if not members:
+        return None
+
+    names = dict(("/" + posixpath.normpath(n.lstrip("/")), n) for n in members)
+    files = sorted(n for n in names if members[names[n]] is None)
+    if any(n.count("/") == 1 and n.endswith(archives.COMPRESSION_TYPES) for n in files):
+        return None
+    try:
+        identified = identify(files)
+    except archives.InvalidArchive:
+        return None
+    root, ctx = identified
+    context = context or ctx
+    if issubclass(context, SerializedArchiveContext):
+        return None
+    paths = get_archive_paths(context, components)
+    if paths is None:
+        return None
+
+    links = {}
+    for name, original in names.items():
+        target = members[original]
+        if target is not None and not target.startswith("/"):
+            links[name] = posixpath.normpath(posixpath.join(posixpath.dirname(name), target))
+    match = _compile(_through_links([_escape(root) + "/" + p for p in paths], links))
+    selected = [n for n in files if match(n)]
+    if ctx.marker:
+        marker = root + "/" + ctx.marker.strip("/")
+        under = [n for n in files if n == marker or n.startswith(marker + "/")]
+        if under and not set(under) & set(selected):
+            selected.append(under[0])
+    try:
+        if identify(selected) != identified:
+            return None
+    except archives.InvalidArchive:
+        return None
+    selected.extend(n for n in names if members[names[n]] is not None)
+    return sorted(set(_escape(names[n]) for n in selected))
+
+
+def initialize_broker(path, context=None, broker=None, components=None, pool=None):
+    """
+    Returns a context for the directory at ``path`` and a broker seeded with
+    it. ``context`` is the class of the context or a context that was
+    already created.
+    """
+    if isinstance(context, ExecutionContext):
+        ctx = context
+    else:
+        ctx = create_context(path, context=context)
     broker = broker or dr.Broker()
     if isinstance(ctx, ClusterArchiveContext):
         return ctx, broker
 
     broker[ctx.__class__] = ctx
     if isinstance(ctx, SerializedArchiveContext):
-        h = Hydration(ctx.root)
-        broker = h.hydrate(broker=broker)
+        h = Hydration(ctx.root, pool=pool)
+        broker = h.hydrate(broker=broker, components=components, lazy=True)
     return ctx, broker
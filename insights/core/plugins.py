@@ -119,7 +119,7 @@ class parser(PluginType):
     def __init__(self, *args, **kwargs):
         group = kwargs.get('group', dr.GROUPS.single)
         self.continue_on_error = kwargs.get('continue_on_error', True)
-        super(parser, self).__init__(*args, group=group)
+        super(parser, self).__init__(*args, group=group, isolated=kwargs.get('isolated', False))
 
     def invoke(self, broker):
         dep_value = broker[self.requires[0]]
@@ -0,0 +1,233 @@
+"""
+The profiler module records where the time and memory of an evaluation go.
+Pass a :class:`Profiler` to :func:`insights.core.dr.run` and it records the
+wall time, CPU time, peak memory growth, and input and output sizes of every
+component that's evaluated. The records can be saved as JSON or as a Chrome
+trace that ``chrome://tracing``, Perfetto, or speedscope can display as a
+flame chart.
+
+.. code-block:: python
+
+    >>> from insights.core import dr
+    >>> from insights.core.profiler import Profiler
+    >>> profiler = Profiler(labels={"context": "HostArchiveContext"})
+    >>> broker = dr.run(graph, broker=broker, profiler=profiler)
+    >>> profiler.top(5)
+    >>> with open("trace.json", "w") as f:
+    ...     profiler.dump_chrome_trace(f)
+"""
+import json
+import os
+import six
+import sys
+import threading
+import time
+
+from insights.core import dr
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+if hasattr(time, "thread_time"):
+    _cpu_time = time.thread_time
+else:
+    _cpu_time = time.clock if hasattr(time, "clock") else time.process_time
+
+MAX_OBJECTS = 10000
+""" int: most objects visited when estimating the size of a result. """
+
+
+def _get_provider_size(provider):
+    content = provider._content
+    if isinstance(content, list):
+        return len(content), sum(len(l) + 1 for l in content)
+    if isinstance(content, six.binary_type):
+        return content.count(b"\n"), len(content)
+    if isinstance(content, six.text_type):
+        return content.count(u"\n"), len(content)
+    try:
+        return None, os.path.getsize(provider.path)
+    except Exception:
+        return None, None
+
+
+def get_input_size(component, broker):
+    """
+    Returns the ``(lines, bytes)`` of the content providers the component
+    depends on. Lines are ``None`` if none of the providers were loaded, and
+    both are ``None`` if the component doesn't depend on any providers.
+    """
+    from insights.core.spec_factory import ContentProvider
+
+    lines = size = None
+    for dep in dr.get_dependencies(component):
+        value = broker.get(dep)
+        for v in (value if isinstance(value, list) else [value]):
+            if not isinstance(v, ContentProvider):
+                continue
+            n, b = _get_provider_size(v)
+            if n is not None:
+                lines = (lines or 0) + n
+            if b is not None:
+                size = (size or 0) + b
+    return lines, size
+
+
+def get_output_size(value):
+    """
+    Estimates the number of bytes of memory used by ``value`` and everything
+    it refers to through containers and instance attributes. At most
+    :data:`MAX_OBJECTS` objects are visited.
+    """
+    seen = set()
+    stack = [value]
+    size = 0
+    while stack and len(seen) < MAX_OBJECTS:
+        obj = stack.pop()
+        if id(obj) in seen or obj is None:
+            continue
+        seen.add(id(obj))
+        try:
+            size += sys.getsizeof(obj)
+        except TypeError:
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+            stack.append(obj.__dict__)
+    return size
+
+
+class Profiler(object):
+    """
+    Records a dictionary for each component evaluated by a run it's passed
+    to. The keys are ``name``, ``type``, ``start`` (seconds since the epoch),
+    ``wall`` and ``cpu`` (seconds), ``memory`` (peak bytes allocated while it
+    ran or ``None``), ``input_lines`` and ``input_bytes`` of the providers it
+    depended on, ``output_bytes`` (an estimate), ``thread``, and ``outcome``
+    (``"value"``, ``"skipped"``, ``"missing"``, or ``"error"``).
+
+    CPU time is the time of the thread that evaluated the component, so it
+    doesn't include work done by child processes.
+
+    Args:
+        memory (bool): track allocations with :mod:`tracemalloc`. It slows
+            evaluation down noticeably. Peaks are only meaningful when
+            components are evaluated one at a time.
+        sizes (bool): record input and output sizes.
+        labels (dict): included in the exported profile, like the archive
+            type so profiles from many systems can be grouped.
+    """
+    def __init__(self, memory=False, sizes=True, labels=None):
+        self.memory = memory and tracemalloc is not None
+        self.sizes = sizes
+        self.labels = dict(labels or {})
+        self.records = []
+        self._lock = threading.Lock()
+        self._tracing = False
+
+    def start(self, component):
+        """ Called before the component is evaluated. Returns a token for :meth:`stop`. """
+        before = None
+        if self.memory:
+            with self._lock:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._tracing = True
+                if hasattr(tracemalloc, "reset_peak"):
+                    tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+        return (time.time(), _cpu_time(), before)
+
+    def stop(self, component, token, broker, outcome):
+        """
+        Called after the component is evaluated with the token from
+        :meth:`start` and the ``(result, exception, traceback)`` outcome.
+        """
+        start, cpu_start, before = token
+        wall = time.time() - start
+        cpu = _cpu_time() - cpu_start
+
+        memory = None
+        if before is not None:
+            memory = max(tracemalloc.get_traced_memory()[1] - before, 0)
+
+        result, ex, _ = outcome
+        if ex is None:
+            status = "value"
+        elif isinstance(ex, dr.SkipComponent):
+            status = "skipped"
+        elif isinstance(ex, dr.MissingRequirements):
+            status = "missing"
+        else:
+            status = "error"
+
+        lines = size = out = None
+        if self.sizes:
+            lines, size = get_input_size(component, broker)
+            if ex is None:
+                out = get_output_size(result)
+
+        delegate = dr.get_delegate(component)
+        record = {
+            "name": dr.get_name(component),
+            "type": dr.get_name(delegate.type) if delegate and delegate.type else None,
+            "start": start,
+            "wall": wall,
+            "cpu": cpu,
+            "memory": memory,
+            "input_lines": lines,
+            "input_bytes": size,
+            "output_bytes": out,
+            "thread": threading.current_thread().ident,
+            "outcome": status,
+        }
+        with self._lock:
+            self.records.append(record)
+
+    def close(self):
+        """ Stops :mod:`tracemalloc` if this profiler started it. """
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def top(self, n=10, key="cpu"):
+        """ Returns the ``n`` records with the largest ``key``. """
+        return sorted(self.records, key=lambda r: r[key] or 0, reverse=True)[:n]
+
+    def to_dict(self):
+        return {"labels": self.labels, "components": list(self.records)}
+
+    def dump_json(self, stream):
+        """ Writes the labels and records to ``stream`` as JSON. """
+        json.dump(self.to_dict(), stream)
+
+    def to_chrome_trace(self):
+        """
+        Returns the records as a Chrome trace event dictionary. Each component
+        is a complete ("X") event on the thread that evaluated it.
+        """
+        pid = os.getpid()
+        events = []
+        for r in self.records:
+            args = dict((k, v) for k, v in r.items() if k not in ("name", "start", "wall", "thread"))
+            events.append({
+                "name": r["name"],
+                "cat": r["type"] or "component",
+                "ph": "X",
+                "ts": r["start"] * 1e6,
+                "dur": r["wall"] * 1e6,
+                "pid": pid,
+                "tid": r["thread"],
+                "args": args,
+            })
+        return {"traceEvents": events, "otherData": self.labels}
+
+    def dump_chrome_trace(self, stream):
+        """ Writes the records to ``stream`` in the Chrome trace event format. """
+        json.dump(self.to_chrome_trace(), stream)
@@ -16,12 +16,21 @@ from functools import partial
 
 from insights.core import dr
 from insights.util import fs
+from insights.util.packfile import PackReader, PackWriter
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 log = logging.getLogger(__name__)
 
 SERIALIZERS = {}
 DESERIALIZERS = {}
 
+ENCODINGS = ("json", "msgpack")
+""" The encodings :class:`Hydration` can write metadata in. """
+
 
 def serializer(_type):
     """
@@ -64,12 +73,21 @@ def deserializer(_type):
     return inner
 
 
-def get_serializer(obj):
+def _find_in_mro(_type, registry):
+    for t in getattr(_type, "__mro__", [_type]):
+        name = dr.get_name(t)
+        if name in registry:
+            return registry[name]
+
+
+def get_serializer(obj, inherit=False):
     """ Get a registered serializer for the given object.
 
-        This function walks the mro of obj looking for serializers.
-        Returns None if no valid serializer is found.
+        If inherit is True, this function walks the mro of obj looking for
+        serializers. Returns None if no valid serializer is found.
     """
+    if inherit:
+        return _find_in_mro(type(obj), SERIALIZERS)
     return SERIALIZERS.get(dr.get_name(type(obj)))
 
 
@@ -78,23 +96,30 @@ def get_deserializer(obj):
     return DESERIALIZERS.get(dr.get_name(type(obj)))
 
 
-def serialize(obj, root=None):
-    to_dict = get_serializer(obj)
+def serialize(obj, root=None, inherit=False):
+    to_dict = get_serializer(obj, inherit=inherit)
     return {
         "type": dr.get_name(type(obj)),
         "object": to_dict(obj, root=root),
     }
 
 
-def deserialize(data, root=None):
+def deserialize(data, root=None, inherit=False):
     type_data = DESERIALIZERS.get(data["type"])
+    if type_data is None and inherit:
+        # subclasses of a type with a registered deserializer are rebuilt
+        # by it as instances of the subclass.
+        _type = dr.get_component(data["type"])
+        from_dict = _find_in_mro(_type, DESERIALIZERS) if isinstance(_type, type) else None
+        if from_dict is not None:
+            type_data = (_type, from_dict[1])
     if type_data is None:
         raise Exception("Unrecognized type: %s" % data["type"])
     (_type, from_dict) = type_data
     return from_dict(_type, data["object"], root=root)
 
 
-def marshal(v, root=None, pool=None):
+def marshal(v, root=None, pool=None, inherit=False):
     def call_serializer(func, value):
         try:
             return func(value), None
@@ -103,7 +128,7 @@ def marshal(v, root=None, pool=None):
 
     if v is None:
         return None, None
-    f = partial(serialize, root=root)
+    f = partial(serialize, root=root, inherit=inherit)
     if isinstance(v, list):
         if pool:
             data = list(pool.map(call_serializer, [f] * len(v), v))
@@ -115,12 +140,54 @@ def marshal(v, root=None, pool=None):
     return call_serializer(f, v)
 
 
-def unmarshal(data, root=None):
+def unmarshal(data, root=None, inherit=False):
     if data is None:
         return
     if isinstance(data, list):
-        return [deserialize(d, root=root) for d in data]
-    return deserialize(data, root=root)
+        return [deserialize(d, root=root, inherit=inherit) for d in data]
+    return deserialize(data, root=root, inherit=inherit)
+
+
+def _encode(doc, encoding):
+    if encoding == "msgpack":
+        return msgpack.packb(doc, use_bin_type=True)
+    return ser.dumps(doc).encode("utf-8")
+
+
+def _decode(data, encoding=None):
+    """
+    Decodes a metadata document. If ``encoding`` isn't given, it's json when
+    ``data`` looks like a json object and msgpack otherwise.
+    """
+    if encoding not in ENCODINGS:
+        encoding = "json" if data[:1] == b"{" else "msgpack"
+    if encoding == "msgpack":
+        if msgpack is None:
+            raise ValueError("msgpack is required to load msgpack metadata.")
+        return msgpack.unpackb(data, raw=False)
+    return ser.loads(data.decode("utf-8"))
+
+
+def _load_doc(source):
+    """
+    Returns the metadata document in ``source`` and ``None``, or ``None`` and
+    the error that kept it from loading. ``source`` is ``("path", path)`` or
+    ``("data", bytes)``. It's a module level function so process pools can
+    run it.
+    """
+    kind, value = source
+    try:
+        if kind == "path":
+            with open(value, "rb") as f:
+                return _decode(f.read(), os.path.splitext(value)[1][1:]), None
+        return _decode(value), None
+    except Exception as ex:
+        return None, ex
+
+
+def _is_pending(value):
+    values = value if isinstance(value, list) else [value]
+    return any(getattr(v, "pending", False) for v in values)
 
 
 class Hydration(object):
@@ -129,14 +196,33 @@ class Hydration(object):
     components. It puts metadata about a component's evaluation in a metadata
     file for the component and allows the serializer for a component to put raw
     data beneath a working directory.
+
+    If ``packed`` is ``True``, the metadata of all components is put in one
+    :mod:`insights.util.packfile` instead, next to the metadata directory and
+    named after it with a ``.pack`` extension. Call :meth:`close` once all
+    components are saved to write its index. Loading reads either layout.
+
+    Metadata is written as json unless ``encoding`` is ``"msgpack"``, which
+    is smaller and faster to load but needs the optional msgpack package.
+    Json is written if it isn't installed. Loading reads either encoding, and
+    documents are decoded with ``pool`` if one is given.
     """
-    def __init__(self, root=None, meta_data="meta_data", data="data", pool=None):
+    def __init__(self, root=None, meta_data="meta_data", data="data", pool=None, packed=False, encoding="json"):
+        if encoding not in ENCODINGS:
+            raise ValueError("Unknown metadata encoding: %s" % encoding)
+        if encoding == "msgpack" and msgpack is None:
+            log.warning("msgpack isn't installed. Writing metadata as json.")
+            encoding = "json"
         self.root = root
         self.meta_data = os.path.join(root, meta_data) if root else None
         self.data = os.path.join(root, data) if root else None
-        self.ser_name = dr.get_base_module_name(ser)
+        self.pack = self.meta_data + ".pack" if root else None
+        self.ser_name = encoding
         self.created = False
         self.pool = pool
+        self.packed = packed
+        self.deferred = []
+        self._writer = None
 
     def _hydrate_one(self, doc):
         """ Returns (component, results, errors, duration) """
@@ -150,23 +236,82 @@ class Hydration(object):
         results = unmarshal(doc["results"], root=self.data)
         return (key, results, exec_time, ser_time)
 
-    def hydrate(self, broker=None):
+    def _get_sources(self, names, reader):
+        """
+        Returns the sources for :func:`_load_doc` of the metadata of the saved
+        components named in ``names``, or of all of them if it's ``None``.
+        Records in the pack file are read here so the sources can be decoded
+        anywhere.
+        """
+        sources = []
+        for path in glob(os.path.join(self.meta_data, "*")):
+            if names is None or os.path.basename(path).rsplit(".", 1)[0] in names:
+                sources.append(("path", path))
+        if reader is not None:
+            for name in reader.names():
+                if names is None or name in names:
+                    sources.append(("data", reader.read(name)))
+        return sources
+
+    def _unmarshal(self, results):
+        from insights.core.spec_factory import ContentException
+
+        try:
+            value = unmarshal(results, root=self.data)
+        except ContentException as ex:
+            log.debug(ex)
+            raise
+        except Exception as ex:
+            log.warning(ex)
+            raise
+        if not value:
+            raise dr.SkipComponent()
+        return value
+
+    def hydrate(self, broker=None, components=None, lazy=False):
         """
         Loads a Broker from a previously saved one. A Broker is created if one
-        isn't provided.
+        isn't provided. If ``components`` is given, only the saved components
+        in it are deserialized.
+
+        If ``lazy`` is ``True``, components are deserialized the first time
+        their values are read from the broker instead. See
+        :meth:`insights.core.dr.Broker.set_lazy`.
         """
         from insights.core.spec_factory import ContentException
 
         broker = broker or dr.Broker()
-        for path in glob(os.path.join(self.meta_data, "*")):
+        names = set(dr.get_name(c) for c in components) if components is not None else None
+        reader = PackReader(self.pack) if self.pack and os.path.exists(self.pack) else None
+        try:
+            sources = self._get_sources(names, reader)
+        finally:
+            if reader is not None:
+                reader.close()
+
+        if self.pool is not None and len(sources) > 1:
+            docs = self.pool.map(_load_doc, sources)
+        else:
+            docs = map(_load_doc, sources)
+
+        for doc, error in docs:
             try:
-                with open(path) as f:
-                    doc = ser.load(f)
-                    res = self._hydrate_one(doc)
-                    comp, results, exec_time, ser_time = res
-                    if results:
-                        broker[comp] = results
-                        broker.exec_times[comp] = exec_time + ser_time
+                if error is not None:
+                    raise error
+                if lazy:
+                    comp = dr.get_component_by_name(doc["name"])
+                    if comp is None:
+                        raise ValueError("{} is not a loaded component.".format(doc["name"]))
+                    if doc["results"]:
+                        exec_time = doc["exec_time"] + doc["ser_time"]
+                        broker.set_lazy(comp, partial(self._unmarshal, doc["results"]))
+                        broker.exec_times[comp] = exec_time
+                    continue
+                res = self._hydrate_one(doc)
+                comp, results, exec_time, ser_time = res
+                if results:
+                    broker[comp] = results
+                    broker.exec_times[comp] = exec_time + ser_time
             except ContentException as ex:
                 log.debug(ex)
             except Exception as ex:
@@ -181,7 +326,11 @@ class Hydration(object):
             raise Exception("Hydration meta_path not set. Can't dehydrate.")
 
         if not self.created:
-            fs.ensure_path(self.meta_data, mode=0o770)
+            if self.packed:
+                fs.ensure_path(self.root, mode=0o770)
+                self._writer = PackWriter(self.pack)
+            else:
+                fs.ensure_path(self.meta_data, mode=0o770)
             if self.data:
                 fs.ensure_path(self.data, mode=0o770)
             self.created = True
@@ -206,11 +355,17 @@ class Hydration(object):
         except Exception as ex:
             log.exception(ex)
         else:
-            if doc is not None and (doc["results"] or doc["errors"]):
+            if doc is not None and (doc["results"] or doc["errors"]) and self._writer is not None:
+                try:
+                    self._writer.add(name, _encode(doc, self.ser_name))
+                except Exception as boom:
+                    log.error("Could not serialize %s to %s: %r" % (name, self.ser_name, boom))
+            elif doc is not None and (doc["results"] or doc["errors"]):
                 try:
                     path = os.path.join(self.meta_data, name + "." + self.ser_name)
-                    with open(path, "w") as f:
-                        ser.dump(doc, f)
+                    data = _encode(doc, self.ser_name)
+                    with open(path, "wb") as f:
+                        f.write(data)
                 except Exception as boom:
                     log.error("Could not serialize %s to %s: %r" % (name, self.ser_name, boom))
                     if path:
@@ -232,5 +387,33 @@ class Hydration(object):
 
         def persister(c, broker):
             if c in to_persist:
-                self.dehydrate(c, broker)
+                if _is_pending(broker.get(c)):
+                    self.deferred.append((c, broker))
+                else:
+                    self.dehydrate(c, broker)
+            if self.deferred:
+                self.flush(wait=False)
+        persister.pins = to_persist
         return persister
+
+    def flush(self, wait=True):
+        """
+        Saves the components the persister deferred because their commands
+        were still running in a command pool. If ``wait`` is ``False``, only
+        the ones whose commands have finished are saved.
+        """
+        deferred, self.deferred = self.deferred, []
+        for c, broker in deferred:
+            if wait or not _is_pending(broker.get(c)):
+                self.dehydrate(c, broker)
+            else:
+                self.deferred.append((c, broker))
+
+    def close(self):
+        """
+        Saves any deferred components and finishes the pack file if the
+        metadata is packed.
+        """
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
@@ -0,0 +1,260 @@
+"""
+The shards module evaluates a dependency graph with a
+``concurrent.futures.ProcessPoolExecutor``. Parsers are CPU bound and
+serialized by the GIL when run on threads, so the parsers in the graph are
+split into shards that worker processes evaluate with their own brokers.
+Each worker rebuilds the parsers' datasources from the execution context in
+the seed broker, so the archive or directory on disk is read directly by the
+worker.
+
+Parsers that share a datasource are put in the same shard, so the
+datasource is evaluated once. Results are sent back as the dictionaries
+produced by the serializers registered with :mod:`insights.core.serde`, or
+by the one of the nearest base class, and are deserialized into the parent
+broker. The parent then evaluates the rest of the graph, skipping the
+datasources that only the parsers the workers evaluated needed. The
+exceptions a parser raised in a worker are recorded in the parent broker with
+the worker's tracebacks, and the parser isn't evaluated again. Parsers a
+worker skipped, and results or exceptions it couldn't send back, are
+evaluated again by the parent, so the rules and parsers in the final broker
+are the same as in one from :func:`insights.core.dr.run`.
+"""
+import heapq
+import importlib
+import logging
+import pickle
+import time
+
+from insights.core import dr, plugins
+from insights.core.serde import marshal, unmarshal
+
+log = logging.getLogger(__name__)
+
+SHARDS_PER_WORKER = 4
+""" int: number of shards created for each worker process in the pool. """
+
+
+def is_process_pool(pool):
+    try:
+        from concurrent.futures import ProcessPoolExecutor
+    except ImportError:
+        return False
+    return isinstance(pool, ProcessPoolExecutor)
+
+
+def _get_subgraph(component, graph):
+    sub = {}
+    stack = [component]
+    while stack:
+        c = stack.pop()
+        if c in sub:
+            continue
+        sub[c] = set(d for d in graph.get(c, ()) if d in graph)
+        stack.extend(sub[c])
+    return sub
+
+
+def _get_shards(plan, broker, num_shards, demand=None):
+    """
+    Splits the parsers the workers should evaluate into at most num_shards
+    lists. Parsers that depend on the same component that isn't in the
+    broker yet are kept together.
+    """
+    parsers = [c for i, c in enumerate(plan.order)
+               if c in plan and plugins.is_parser(c) and
+               c not in broker and dr.is_enabled(c) and
+               (demand is None or (demand.wanted(i) and not demand.dead[i]))]
+
+    group_of = dict((p, p) for p in parsers)
+
+    def find(p):
+        while group_of[p] is not p:
+            group_of[p] = group_of[group_of[p]]
+            p = group_of[p]
+        return p
+
+    owner = {}
+    for p in parsers:
+        for c in _get_subgraph(p, plan):
+            if c is p or c in broker:
+                continue
+            if c in owner:
+                group_of[find(p)] = find(owner[c])
+            else:
+                owner[c] = p
+
+    groups = {}
+    for p in parsers:
+        groups.setdefault(find(p), []).append(p)
+
+    shards = [(0, i, []) for i in range(min(num_shards, len(groups)))]
+    for group in sorted(groups.values(), key=len, reverse=True):
+        size, i, shard = heapq.heappop(shards)
+        shard.extend(group)
+        heapq.heappush(shards, (size + len(group), i, shard))
+    return [shard for _, _, shard in sorted(shards, key=lambda s: s[1])]
+
+
+class _Remaining(object):
+    """
+    Decides what the parent evaluates after the workers are done. Components
+    are skipped if every component that depends on them was evaluated by a
+    worker, so datasources that only those parsers needed aren't evaluated
+    again. Parsers that failed in a worker aren't evaluated either. It also
+    defers to the demand of the run if there is one.
+    """
+    def __init__(self, plan, done, demand=None, failed=()):
+        self.demand = demand
+        self.failed = failed
+        done = set(done) | set(failed)
+        self.needed = [False] * len(plan.order)
+        for i in range(len(plan.order) - 1, -1, -1):
+            dependents = plan.dependents[i]
+            self.needed[i] = (i in done or not dependents or
+                              (demand is not None and demand.target[i]) or
+                              any(self.needed[j] and j not in done for j in dependents))
+
+    def wanted(self, i):
+        return (self.needed[i] and i not in self.failed and
+                (self.demand is None or self.demand.wanted(i)))
+
+    def finished(self, i, broker):
+        if self.demand is not None:
+            self.demand.finished(i, broker)
+
+
+def _get_seed(graph, broker):
+    # only the values in the shard's graph are loaded, not every lazy one
+    keys = [k for k in list(broker.instances) if k in graph]
+    broker.resolve(keys)
+    seed = []
+    for k in keys:
+        if k not in broker.instances:
+            continue
+        v = broker.instances[k]
+        try:
+            pickle.dumps(v)
+        except Exception:
+            log.debug("Can't send %s to workers." % dr.get_name(k))
+            continue
+        seed.append((dr.get_name(k), v))
+    return seed
+
+
+def _get_names():
+    return dict((dr.get_name(c), c) for c in dr.DELEGATES)
+
+
+def _run_shard(modules, names, seed):
+    """
+    Evaluates a shard of parsers in a worker process. Returns a dictionary of
+    parser name to a (serialized results, exec time) tuple for every parser
+    that produced a value without errors, and one of parser name to a (list of
+    (exception, traceback) tuples, exec time) tuple for every parser that
+    raised exceptions that can be sent back.
+    """
+    for m in modules:
+        try:
+            importlib.import_module(m)
+        except Exception as ex:
+            log.warning("Couldn't import %s: %r" % (m, ex))
+
+    by_name = _get_names()
+    broker = dr.Broker()
+    broker.observers.clear()
+    for name, value in seed:
+        broker[by_name.get(name) or dr.get_component(name)] = value
+
+    parsers = [by_name[n] for n in names]
+    graph = {}
+    for p in parsers:
+        graph.update(dr.get_dependency_graph(p))
+    dr.run(graph, broker=broker)
+
+    results = {}
+    failures = {}
+    for name, p in zip(names, parsers):
+        exceptions = broker.exceptions.get(p)
+        if exceptions:
+            failure = [(ex, broker.tracebacks.get(ex)) for ex in exceptions]
+            try:
+                pickle.dumps(failure)
+            except Exception:
+                log.debug("Can't send the exceptions of %s to the parent." % name)
+                continue
+            failures[name] = (failure, broker.exec_times.get(p))
+            continue
+        if p not in broker:
+            continue
+        data, errors = marshal(broker[p], inherit=True)
+        if data and not errors:
+            results[name] = (data, broker.exec_times.get(p))
+    return results, failures
+
+
+def run_sharded(components, broker, pool, demand=None, refs=None):
+    """
+    Evaluates the parsers of the graph in ``pool`` and then the rest of the
+    graph in this process. Datasources only the parsers from the workers
+    depend on aren't evaluated or added to the broker. The observers of the
+    parsers that failed in a worker are fired once their exceptions are
+    recorded, before the rest of the graph is evaluated.
+
+    Args:
+        components (ExecutionPlan): the plan to evaluate.
+        broker (Broker): broker seeded with the execution context.
+        pool (ProcessPoolExecutor): pool of worker processes.
+        demand (_Demand): only parsers it wants are sent to workers, and it's
+            used for the rest of the evaluation.
+        refs (_Refcounts): releases values during the rest of the evaluation.
+
+    Returns:
+        Broker: the broker after evaluation.
+    """
+    workers = getattr(pool, "_max_workers", 1) or 1
+    shards = _get_shards(components, broker, workers * SHARDS_PER_WORKER, demand)
+
+    futures = []
+    for shard in shards:
+        graph = {}
+        for p in shard:
+            graph.update(_get_subgraph(p, components))
+        modules = sorted(set(m for m in (dr.get_module_name(c) for c in graph) if m))
+        names = [dr.get_name(p) for p in shard]
+        futures.append(pool.submit(_run_shard, modules, names, _get_seed(graph, broker)))
+
+    by_name = _get_names()
+    exec_times = {}
+    failed = set()
+    for f in futures:
+        try:
+            results, failures = f.result()
+        except Exception as ex:
+            log.warning("Shard failed and will be evaluated locally: %r" % ex)
+            continue
+        for name, (failure, exec_time) in failures.items():
+            comp = by_name[name]
+            for ex, tb in failure:
+                broker.add_exception(comp, ex, tb)
+            broker.exec_times[comp] = exec_time or 0.0
+            broker.fire_observers(comp)
+            failed.add(components.ids[comp])
+            if demand is not None:
+                demand.finished(components.ids[comp], broker)
+        for name, (data, exec_time) in results.items():
+            comp = by_name[name]
+            start = time.time()
+            try:
+                value = unmarshal(data, inherit=True)
+            except Exception as ex:
+                log.debug("Couldn't deserialize %s: %r" % (name, ex))
+                continue
+            if comp not in broker:
+                broker[comp] = value
+                exec_times[comp] = (exec_time or 0.0) + (time.time() - start)
+
+    done = set(components.ids[c] for c in exec_times)
+    remaining = _Remaining(components, done, demand, failed)
+    broker = dr._run_serial(components, broker, demand=remaining, refs=refs)
+    broker.exec_times.update(exec_times)
+    return broker
@@ -1,22 +1,29 @@
+import inspect
+import io
 import itertools
 import logging
 import os
 import re
+import shutil
 import signal
 import six
+import threading
 import traceback
+import weakref
 import codecs
+import functools
 
 from collections import defaultdict
 from glob import glob
 from subprocess import call
+from tempfile import TemporaryFile, mkstemp
 
 from insights.core import blacklist, dr
 from insights.core.filters import _add_filter, get_filters
 from insights.core.context import ExecutionContext, FSRoots, HostContext
 from insights.core.plugins import component, datasource, ContentException, is_datasource
-from insights.util import fs, streams, which
-from insights.util.subproc import Pipeline
+from insights.util import dirglob, fs, mmaplines, pathcache, streams, textfilter, which
+from insights.util.subproc import CalledProcessError, Pipeline
 from insights.core.serde import deserializer, serializer
 import shlex
 
@@ -39,6 +46,17 @@ A minimal set of environment variables for use in subprocess calls
 if "LANG" in os.environ:
     SAFE_ENV["LANG"] = os.environ["LANG"]
 
+BATCH_SIZE = 100
+"""
+The most elements a batched :class:`foreach_execute` passes to one command.
+"""
+
+OUTPUT_MEMORY_SIZE = 1024 * 1024
+"""
+Output of commands that run ahead of their providers, like in a command pool,
+is kept in memory up to this many bytes and in a temporary file otherwise.
+"""
+
 
 def enc(s):
     escape_encoding = "string_escape" if six.PY2 else "unicode_escape"
@@ -82,6 +100,14 @@ def mangle_command(command, name_max=255):
     return mangledname
 
 
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
 class ContentProvider(object):
     def __init__(self):
         self.cmd = None
@@ -90,16 +116,73 @@ class ContentProvider(object):
         self.root = None
         self.relative_path = None
         self.loaded = False
+        self.fingerprint = None
         self._content = None
         self._exception = None
 
     def load(self):
         raise NotImplementedError()
 
+    def _get_file(self, root=None):
+        return os.path.join(root or self.root, self.relative_path.lstrip("/"))
+
+    def get_fingerprint(self, root=None):
+        """
+        Returns a ``(mtime, size)`` tuple for the file behind the provider or
+        ``None`` if it can't be determined. ``root`` overrides the provider's
+        root, which is useful when an archive has been extracted again
+        somewhere else.
+        """
+        if not self.relative_path:
+            return None
+        return _stat(self._get_file(root))
+
+    def _add_digest(self):
+        # The content is hashed when it's first read, so files nothing read
+        # aren't. Their dependents didn't use the content either.
+        fingerprint = self.fingerprint
+        if fingerprint and len(fingerprint) == 2:
+            try:
+                self.fingerprint = tuple(fingerprint) + (fs.sha256(self._get_file()),)
+            except (IOError, OSError):
+                self.fingerprint = None
+
+    def is_changed(self, root=None):
+        """
+        Returns ``True`` unless the file behind the provider still matches the
+        fingerprint taken when the provider was created. Providers without a
+        fingerprint, like those for command output or created by a context
+        without ``fingerprints``, are always changed. If the content was read,
+        a file with the same mtime and size is hashed to be sure it wasn't
+        rewritten in place. Providers loaded from a
+        :class:`insights.core.serde.Hydration` need the ``root`` the files
+        are in now.
+        """
+        if not self.fingerprint or not self.relative_path:
+            return True
+        current = self.get_fingerprint(root)
+        if current is None or tuple(self.fingerprint[:2]) != current:
+            return True
+        if len(self.fingerprint) > 2:
+            try:
+                return fs.sha256(self._get_file(root)) != self.fingerprint[2]
+            except (IOError, OSError):
+                return True
+        return False
+
+    def unload(self):
+        """
+        Drops loaded content if it can be loaded again later. Returns ``True``
+        if it did. Content that came from running a command or from a
+        datasource function can't be loaded again, so it's kept.
+        """
+        return False
+
     def stream(self):
         """
         Returns a generator of lines instead of a list of lines.
         """
+        self._add_digest()
         st = self._stream()
         for l in next(st):
             yield l.rstrip("\n")
@@ -117,6 +200,7 @@ class ContentProvider(object):
             raise self._exception
 
         if self._content is None:
+            self._add_digest()
             try:
                 self._content = self.load()
             except Exception as ex:
@@ -172,24 +256,48 @@ class FileProvider(ContentProvider):
 
         self.ds = ds
         self.ctx = ctx
+        self.archive = getattr(ctx, "archive", None)
         self.validate()
+        if getattr(ctx, "fingerprints", False):
+            self.fingerprint = self.get_fingerprint()
 
     def validate(self):
         if not blacklist.allow_file("/" + self.relative_path):
             log.warning("WARNING: Skipping file %s", "/" + self.relative_path)
             raise dr.SkipComponent()
 
-        if not os.path.exists(self.path):
+        paths = getattr(self.ctx, "path_cache", None) or pathcache.UNCACHED
+        if not paths.exists(self.path):
             raise ContentException("%s does not exist." % self.path)
 
-        resolved = os.path.realpath(self.path)
-        if not resolved.startswith(os.path.realpath(self.root)):
+        resolved = paths.realpath(self.path)
+        if not resolved.startswith(paths.realpath(self.root)):
             msg = "Relative path points outside the root: %s -> %s."
             raise Exception(msg % (self.path, resolved))
 
-        if not os.access(self.path, os.R_OK):
+        if not paths.access(self.path, os.R_OK):
             raise ContentException("Cannot access %s" % self.path)
 
+    def unload(self):
+        self._content = None
+        self.loaded = False
+        return True
+
+    def _read(self):
+        """ Returns the content of the file as bytes. """
+        if self.archive is not None:
+            return self.archive.read(self.path)
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def _open_text(self):
+        """ Opens the file for reading text with undecodable bytes escaped. """
+        if self.archive is not None:
+            return io.TextIOWrapper(self.archive.open(self.path), encoding="utf-8", errors="surrogateescape")
+        if six.PY3:
+            return open(self.path, "r", encoding="utf-8", errors="surrogateescape")
+        return codecs.open(self.path, "r", encoding="utf-8", errors="surrogateescape")
+
     def __repr__(self):
         return '%s("%r")' % (self.__class__.__name__, self.path)
 
@@ -202,23 +310,61 @@ class RawFileProvider(FileProvider):
 
     def load(self):
         self.loaded = True
-        with open(self.path, 'rb') as f:
-            return f.read()
+        return self._read()
 
     def write(self, dst):
         fs.ensure_path(os.path.dirname(dst))
+        if self.archive is not None:
+            with open(dst, "wb") as f:
+                f.write(self._read())
+            return
         call([which("cp", env=SAFE_ENV), self.path, dst], env=SAFE_ENV)
 
 
+class _SharedReads(object):
+    """
+    The text file providers of each context by path, so the first of them to
+    load can read the file for the others too.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._providers = weakref.WeakKeyDictionary()
+
+    def add(self, provider):
+        with self._lock:
+            paths = self._providers.setdefault(provider.ctx, {})
+            paths.setdefault(provider.path, weakref.WeakSet()).add(provider)
+
+    def get_unloaded(self, provider):
+        """ Returns the other unloaded providers of the same class and file. """
+        with self._lock:
+            providers = self._providers.get(provider.ctx, {}).get(provider.path, ())
+            return [p for p in providers if p is not provider and not p.loaded and
+                    p.__class__ is provider.__class__]
+
+
+_shared_reads = _SharedReads()
+
+
 class TextFileProvider(FileProvider):
     """
     Class used in datasources that returns the contents of a file a list of
     lines. Each line is filtered if filters are defined for the datasource.
+
+    When several datasources of a context resolve to the same file, the first
+    of their providers to load reads and filters it for all of them.
     """
+    def __init__(self, relative_path, root="/", ds=None, ctx=None):
+        super(TextFileProvider, self).__init__(relative_path, root=root, ds=ds, ctx=ctx)
+        if ctx is not None:
+            _shared_reads.add(self)
 
     def create_args(self):
+        return self._create_args(get_filters(self.ds) if self.ds else None)
+
+    def _create_args(self, filters, keywords=True):
         args = []
-        filters = "\n".join(get_filters(self.ds)) if self.ds else None
+        filters = "\n".join(sorted(filters)) if filters else None
         if filters:
             args.append(["grep", "-F", filters, self.path])
 
@@ -229,7 +375,7 @@ class TextFileProvider(FileProvider):
                 grep.append(self.path)
             args.append(grep)
 
-        keywords = blacklist.get_disallowed_keywords()
+        keywords = blacklist.get_disallowed_keywords() if keywords else None
         if keywords:
             sed = ["sed"]
             for kw in keywords:
@@ -239,19 +385,113 @@ class TextFileProvider(FileProvider):
             args.append(sed)
         return args
 
+    def _filter(self, args):
+        """
+        Returns ``(rc, output)`` of filtering the file with the pipeline
+        ``args`` in process or ``None`` if it has to run. Files in archives
+        are always filtered in process.
+        """
+        if self.archive is None:
+            return textfilter.filter_file(args, self.path)
+        stages = [args[0][:-1]] + args[1:]
+        return textfilter.filter_output(stages, self._read(), SAFE_ENV)
+
+    def _is_large(self):
+        if mmaplines.THRESHOLD is None or self.archive is not None:
+            return False
+        try:
+            return os.path.getsize(self.path) >= mmaplines.THRESHOLD
+        except OSError:
+            return False
+
+    def _load_mapped(self, args):
+        """
+        Returns the content as :class:`insights.util.mmaplines.MappedLines`
+        or ``None`` if it would be split into lines differently. Filtered
+        content is written to a temporary file that's mapped instead. So are
+        files of a running host, since one truncated while it's mapped, like
+        a log rotated with copytruncate, would kill the process with SIGBUS.
+        """
+        if not args:
+            if self.ctx is not None and not isinstance(self.ctx, HostContext):
+                return mmaplines.map_file(self.path)
+            with TemporaryFile() as tmp:
+                with open(self.path, "rb") as f:
+                    shutil.copyfileobj(f, tmp)
+                return mmaplines.map_lines(tmp)
+
+        with TemporaryFile() as tmp:
+            rc = Pipeline(*args, env=SAFE_ENV).write(tmp, keep_rc=True)
+            lines = mmaplines.map_lines(tmp, errors="ignore", newlines=mmaplines.SPLITLINES)
+            if lines is None:
+                tmp.seek(0)
+                lines = tmp.read().decode("utf-8", "ignore").splitlines()
+        self.rc = rc
+        return lines
+
     def load(self):
         self.loaded = True
         args = self.create_args()
+        if self._is_large():
+            lines = self._load_mapped(args)
+            if lines is not None:
+                return lines
+        else:
+            lines = self._load_shared(args)
+            if lines is not None:
+                return lines
         if args:
+            result = self._filter(args)
+            if result is not None:
+                self.rc, out = result
+                return out.decode("utf-8", "ignore").splitlines()
             rc, out = self.ctx.shell_out(args, keep_rc=True, env=SAFE_ENV)
             self.rc = rc
             return out
-        if six.PY3:
-            with open(self.path, "r", encoding="utf-8", errors="surrogateescape") as f:
-                return [l.rstrip("\n") for l in f]
-        else:
-            with codecs.open(self.path, "r", encoding="utf-8", errors="surrogateescape") as f:
-                return [l.rstrip("\n") for l in f]
+        with self._open_text() as f:
+            return [l.rstrip("\n") for l in f]
+
+    def _load_shared(self, args):
+        """
+        Loads this provider and the unloaded, filtered providers of the same
+        file in one read. The file is filtered once by the union of their
+        filters and the blacklist's patterns, and the pipeline of each
+        provider then runs on what's left, which gives each the same lines as
+        filtering the file. Providers without filters read the whole file and
+        aren't loaded this way, so they keep streaming and unloading it on
+        their own. Returns ``None`` if no other provider needs the file or it
+        can't be filtered in process.
+        """
+        if not args or self.ctx is None or not (get_filters(self.ds) if self.ds else None):
+            return None
+        group = [(self, args)]
+        filters = set(get_filters(self.ds))
+        for p in _shared_reads.get_unloaded(self):
+            f = get_filters(p.ds) if p.ds else None
+            p_args = p.create_args() if f else None
+            if p_args:
+                group.append((p, p_args))
+                filters.update(f)
+        if len(group) == 1:
+            return None
+
+        common = self._create_args(filters, keywords=False)
+        result = self._filter(common) if common else None
+        if result is None:
+            return None
+        data = result[1]
+
+        for p, p_args in group:
+            stages = [p_args[0][:-1]] + p_args[1:]
+            p.rc, out = textfilter.filter_output(stages, data, SAFE_ENV)
+            lines = out.decode("utf-8", "ignore").splitlines()
+            if p is self:
+                content = lines
+            else:
+                p._add_digest()
+                p._content = lines
+                p.loaded = True
+        return content
 
     def _stream(self):
         """
@@ -264,16 +504,15 @@ class TextFileProvider(FileProvider):
                 yield self._content
             else:
                 args = self.create_args()
-                if args:
+                result = self._filter(args) if args and (six.PY3 or self.archive is not None) else None
+                if result is not None:
+                    yield io.TextIOWrapper(io.BytesIO(result[1]), encoding="utf-8", errors="ignore")
+                elif args:
                     with streams.connect(*args, env=SAFE_ENV) as s:
                         yield s
                 else:
-                    if six.PY3:
-                        with open(self.path, "r", encoding="utf-8", errors="surrogateescape") as f:
-                            yield f
-                    else:
-                        with codecs.open(self.path, "r", encoding="utf-8", errors="surrogateescape") as f:
-                            yield f
+                    with self._open_text() as f:
+                        yield f
         except StopIteration:
             raise
         except Exception as ex:
@@ -283,9 +522,22 @@ class TextFileProvider(FileProvider):
     def write(self, dst):
         fs.ensure_path(os.path.dirname(dst))
         args = self.create_args()
-        if args:
+        result = self._filter(args) if args else None
+        if result is not None:
+            rc, out = result
+            already_exists = os.path.exists(dst)
+            with open(dst, "wb") as f:
+                f.write(out)
+            if rc:
+                if not already_exists:
+                    os.remove(dst)
+                raise CalledProcessError(rc, args[0], "")
+        elif args:
             p = Pipeline(*args, env=SAFE_ENV)
             p.write(dst)
+        elif self.archive is not None:
+            with open(dst, "wb") as f:
+                f.write(self._read())
         else:
             call([which("cp", env=SAFE_ENV), self.path, dst], env=SAFE_ENV)
 
@@ -299,11 +551,31 @@ class SerializedRawOutputProvider(RawFileProvider):
     pass
 
 
+_TAKES_ENCODING = {}
+
+
+def _takes_encoding(ctx):
+    """
+    Returns ``True`` if the ``check_output`` of the context accepts an
+    ``encoding``. Contexts that override it with the older signature don't,
+    and their commands are filtered with the pipeline instead.
+    """
+    cls = type(ctx)
+    if cls not in _TAKES_ENCODING:
+        try:
+            spec = (getattr(inspect, "getfullargspec", None) or inspect.getargspec)(cls.check_output)
+            varkw = getattr(spec, "varkw", getattr(spec, "keywords", None))
+            _TAKES_ENCODING[cls] = "encoding" in spec.args or varkw is not None
+        except TypeError:
+            _TAKES_ENCODING[cls] = False
+    return _TAKES_ENCODING[cls]
+
+
 class CommandOutputProvider(ContentProvider):
     """
     Class used in datasources to return output from commands.
     """
-    def __init__(self, cmd, ctx, args=None, split=True, keep_rc=False, ds=None, timeout=None, inherit_env=None, signum=None):
+    def __init__(self, cmd, ctx, args=None, split=True, keep_rc=False, ds=None, timeout=None, inherit_env=None, signum=None, priority=0, output=None, cache=None):
         super(CommandOutputProvider, self).__init__()
         self.cmd = cmd
         self.root = "insights_commands"
@@ -316,12 +588,34 @@ class CommandOutputProvider(ContentProvider):
         self.timeout = timeout
         self.inherit_env = inherit_env or []
         self.signum = signum or signal.SIGKILL
+        self.priority = priority
+        self.cache = cache
 
         self._content = None
+        self._future = None
         self.rc = None
 
         self.validate()
 
+        pool = getattr(ctx, "command_pool", None)
+        if output is None and cache:
+            output = self._from_cache(getattr(ctx, "command_cache", None), pool)
+        if output is not None:
+            self._future = output
+        elif pool is not None:
+            self._future = pool.submit(self._execute, priority=priority)
+
+    @property
+    def pending(self):
+        """ ``True`` while the command is running in a command pool. """
+        return self._future is not None and not self._future.done()
+
+    def unload(self):
+        if self._future is None or self.pending:
+            return False
+        self._content = None
+        return True
+
     def validate(self):
         if not blacklist.allow_command(self.cmd):
             log.warning("WARNING: Skipping command %s", self.cmd)
@@ -360,6 +654,12 @@ class CommandOutputProvider(ContentProvider):
     def load(self):
         command = self.create_args()
 
+        if self._future is not None:
+            return self._finish_load(command, *self._get_output())
+
+        if len(command) > 1 and textfilter.ENABLED and _takes_encoding(self.ctx):
+            return self._load_filtered(command)
+
         raw = self.ctx.shell_out(command, split=self.split, keep_rc=self.keep_rc,
                 timeout=self.timeout, env=self.create_env(), signum=self.signum)
         if self.keep_rc:
@@ -368,6 +668,78 @@ class CommandOutputProvider(ContentProvider):
             output = raw
         return output
 
+    def _load_filtered(self, command):
+        """
+        Runs only the command and filters its output with
+        :mod:`insights.util.textfilter`. Like the pipeline, the return code is
+        the last filter's.
+        """
+        env = self.create_env()
+        _, raw = self.ctx.check_output(command[:1], timeout=self.timeout, keep_rc=True,
+                env=env, signum=self.signum, encoding=None)
+        rc, out = textfilter.filter_output(command[1:], raw, env)
+        return self._finish_load(command, rc, out)
+
+    def _finish_load(self, command, rc, out):
+        if not self.keep_rc and rc:
+            raise CalledProcessError(rc, command[0], out)
+        output = out.decode("utf-8", "ignore")
+        if self.split:
+            output = output.splitlines()
+        if self.keep_rc:
+            self.rc = rc
+        return output
+
+    def _run(self, f):
+        """
+        Writes the filtered output of the command to the file object ``f``.
+        Returns the return code of the pipeline.
+        """
+        args = self.create_args()
+        timeout = self.timeout or self.ctx.timeout
+        env = self.create_env()
+        if len(args) > 1 and textfilter.ENABLED:
+            with TemporaryFile() as tmp:
+                Pipeline(args[0], timeout=timeout, signum=self.signum, env=env).write(tmp, keep_rc=True)
+                return textfilter.filter_to_file(args[1:], tmp, f, env)
+        return Pipeline(*args, timeout=timeout, signum=self.signum, env=env).write(f, keep_rc=True)
+
+    def _execute(self):
+        """ Runs the command in a command pool. Returns its rc and :class:`_CommandOutput`. """
+        return _CommandOutput.capture(self._run)
+
+    def _from_cache(self, cache, pool):
+        """
+        Returns a stand-in for the future of the command's output that reads
+        it from ``cache`` if the output there is still valid or that stores
+        it there once the command has run. Returns ``None`` if the output
+        can't be cached.
+        """
+        key = cache.get_key(self.create_args(), self.create_env(), self.cache) if cache else None
+        if key is None:
+            return None
+
+        path = cache.get(key, self.cache.get("ttl"))
+        if path is not None:
+            log.debug("Using cached output of %s", self.cmd)
+            return _CachedOutput(path)
+
+        def execute():
+            rc, output = self._execute()
+            if rc == 0:
+                with output.open() as f:
+                    cache.put(key, f)
+            return rc, output
+
+        if pool is not None:
+            return pool.submit(execute, priority=self.priority)
+        return _Finished(execute)
+
+    def _get_output(self):
+        """ Waits for the command in the command pool and returns its (rc, output). """
+        rc, output = self._future.result()
+        return rc, output.read()
+
     def _stream(self):
         """
         Returns a generator of lines instead of a list of lines.
@@ -377,6 +749,8 @@ class CommandOutputProvider(ContentProvider):
         try:
             if self._content:
                 yield self._content
+            elif self._future is not None:
+                yield self._get_output()[1].decode("utf-8", "ignore").splitlines()
             else:
                 args = self.create_args()
                 with self.ctx.connect(*args, env=self.create_env(), timeout=self.timeout) as s:
@@ -390,15 +764,144 @@ class CommandOutputProvider(ContentProvider):
     def write(self, dst):
         args = self.create_args()
         fs.ensure_path(os.path.dirname(dst))
-        if args:
+        if self._future is None and (len(args) == 1 or not textfilter.ENABLED):
             timeout = self.timeout or self.ctx.timeout
             p = Pipeline(*args, timeout=timeout, signum=self.signum, env=self.create_env())
             return p.write(dst, keep_rc=self.keep_rc)
 
+        already_exists = os.path.exists(dst)
+        with open(dst, "wb") as f:
+            if self._future is not None:
+                rc, output = self._future.result()
+                output.copy_to(f)
+            else:
+                rc = self._run(f)
+        if self.keep_rc:
+            return rc
+        if rc:
+            if not already_exists:
+                os.remove(dst)
+            raise CalledProcessError(rc, args[0], "")
+
     def __repr__(self):
         return 'CommandOutputProvider("%r")' % self.cmd
 
 
+class _CommandOutput(object):
+    """
+    The output of a command that ran ahead of its provider. Output up to
+    :data:`OUTPUT_MEMORY_SIZE` bytes is kept in memory and larger output in a
+    temporary file that's only opened to read it, so waiting providers don't
+    hold file descriptors. The file is removed with the object unless
+    ``owned`` is ``False``.
+    """
+    def __init__(self, data=None, path=None, owned=True):
+        self.data = data
+        self.path = path
+        self.owned = owned
+
+    @classmethod
+    def capture(cls, run):
+        """
+        Calls ``run`` with a temporary file to write the output to. Returns
+        the ``(rc, output)`` of the command ``run`` returns the rc of.
+        """
+        fd, path = mkstemp(prefix="insights-output-")
+        try:
+            with os.fdopen(fd, "w+b") as f:
+                rc = run(f)
+                f.flush()
+                data = None
+                if os.fstat(f.fileno()).st_size <= OUTPUT_MEMORY_SIZE:
+                    f.seek(0)
+                    data = f.read()
+        except BaseException:
+            os.remove(path)
+            raise
+        if data is None:
+            return rc, cls(path=path)
+        os.remove(path)
+        return rc, cls(data=data)
+
+    def open(self):
+        """ Returns a binary file object of the output. """
+        if self.data is not None:
+            return io.BytesIO(self.data)
+        return open(self.path, "rb")
+
+    def read(self):
+        if self.data is not None:
+            return self.data
+        with self.open() as f:
+            return f.read()
+
+    def copy_to(self, f):
+        with self.open() as src:
+            shutil.copyfileobj(src, f)
+
+    def __del__(self):
+        if self.owned and self.path:
+            try:
+                os.remove(self.path)
+            except Exception:
+                pass
+
+
+class _Finished(object):
+    """ The outcome of a function that was called right away, used like a future. """
+    def __init__(self, func):
+        self._value = self._exception = None
+        try:
+            self._value = func()
+        except Exception as ex:
+            self._exception = ex
+
+    def done(self):
+        return True
+
+    def result(self):
+        if self._exception is not None:
+            raise self._exception
+        return self._value
+
+
+class _CachedOutput(object):
+    """
+    Stands in for the future of a :class:`CommandOutputProvider` whose output
+    was stored by an earlier collection. Only successful output is stored.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._output = _CommandOutput(path=path, owned=False)
+
+    def done(self):
+        return True
+
+    def result(self):
+        return 0, self._output
+
+
+class _BatchOutput(object):
+    """
+    Stands in for the future of a :class:`CommandOutputProvider` whose command
+    runs as part of a batch. It's bound to the batch's future once the batch
+    is submitted.
+    """
+    def __init__(self):
+        self._future = None
+        self._index = None
+
+    def bind(self, future, index):
+        self._future = future
+        self._index = index
+
+    def done(self):
+        return self._future.done()
+
+    def result(self):
+        return self._future.result()[self._index]
+
+
 class RegistryPoint(object):
     # Marker class for declaring that an element of a `SpecSet` subclass
     # is a registry point against which further subclasses can register
@@ -569,6 +1072,17 @@ class simple_file(object):
         return self.kind(ctx.locate_path(self.path), root=ctx.root, ds=self, ctx=ctx)
 
 
+def _iglob(ctx, pattern):
+    """ Globs with the directory listings cached by the context. """
+    return dirglob.iglob(pattern, getattr(ctx, "dir_cache", None))
+
+
+def _is_dir(ctx, path, is_dir):
+    if is_dir is not None:
+        return is_dir
+    return (getattr(ctx, "dir_cache", None) or dirglob.DirCache).isdir(path)
+
+
 class glob_file(object):
     """
     Creates a datasource that reads all files matching the glob pattern(s).
@@ -604,17 +1118,21 @@ class glob_file(object):
         results = []
         for pattern in self.patterns:
             pattern = ctx.locate_path(pattern)
-            for path in sorted(glob(os.path.join(root, pattern.lstrip('/')))):
-                if self.ignore_func(path) or os.path.isdir(path):
+            # the glob stops at the limit, so only what's kept is sorted.
+            found = []
+            for path, is_dir in _iglob(ctx, os.path.join(root, pattern.lstrip('/'))):
+                if self.ignore_func(path) or _is_dir(ctx, path, is_dir):
                     continue
                 try:
-                    results.append(self.kind(path[len(root):], root=root, ds=self, ctx=ctx))
+                    found.append((path, self.kind(path[len(root):], root=root, ds=self, ctx=ctx)))
                 except:
                     log.debug(traceback.format_exc())
+                if len(results) + len(found) > self.max_files:
+                    raise ContentException("Number of files returned [at least {0}] is over the {1} file limit, please refine "
+                                           "the specs file pattern to narrow down results".format(len(results) + len(found), self.max_files))
+            found.sort(key=lambda f: f[0])
+            results.extend(provider for _, provider in found)
         if results:
-            if len(results) > self.max_files:
-                raise ContentException("Number of files returned [{0}] is over the {1} file limit, please refine "
-                                       "the specs file pattern to narrow down results".format(len(results), self.max_files))
             return results
         raise ContentException("[%s] didn't match." % ', '.join(self.patterns))
 
@@ -698,7 +1216,11 @@ class listdir(object):
         ctx = _get_context(self.context, broker)
         p = os.path.join(ctx.root, self.path.lstrip('/'))
         p = ctx.locate_path(p)
-        result = sorted(os.listdir(p)) if os.path.isdir(p) else sorted(glob(p))
+        archive = getattr(ctx, "archive", None)
+        if archive is not None:
+            result = sorted(n for n, _ in archive.listdir(p)) if archive.isdir(p) else sorted(dirglob.glob(p, archive))
+        else:
+            result = sorted(os.listdir(p)) if os.path.isdir(p) else sorted(glob(p))
 
         if result:
             return [os.path.basename(r) for r in result if not self.ignore_func(r)]
@@ -727,13 +1249,17 @@ class simple_command(object):
             CalledProcessError is raised. If None, timeout is infinite.
         inherit_env (list): The list of environment variables to inherit from the
             calling process when the command is invoked.
+        priority (int): commands with higher priorities start first when they
+            run in a :class:`insights.core.command_pool.CommandPool`.
+        cache (dict): when the output of the command may be reused from an
+            earlier collection. See :mod:`insights.core.command_cache`.
 
     Returns:
         function: A datasource that returns the output of a command that takes
             no arguments
     """
 
-    def __init__(self, cmd, context=HostContext, deps=[], split=True, keep_rc=False, timeout=None, inherit_env=[], signum=None, **kwargs):
+    def __init__(self, cmd, context=HostContext, deps=[], split=True, keep_rc=False, timeout=None, inherit_env=[], signum=None, priority=0, cache=None, **kwargs):
         self.cmd = cmd
         self.context = context
         self.split = split
@@ -742,13 +1268,16 @@ class simple_command(object):
         self.timeout = timeout
         self.inherit_env = inherit_env
         self.signum = signum
+        self.priority = priority
+        self.cache = cache
         self.__name__ = self.__class__.__name__
         datasource(self.context, *deps, raw=self.raw, **kwargs)(self)
 
     def __call__(self, broker):
         ctx = broker[self.context]
         return CommandOutputProvider(self.cmd, ctx, split=self.split,
-                keep_rc=self.keep_rc, ds=self, timeout=self.timeout, inherit_env=self.inherit_env, signum=self.signum)
+                keep_rc=self.keep_rc, ds=self, timeout=self.timeout, inherit_env=self.inherit_env, signum=self.signum,
+                priority=self.priority, cache=self.cache)
 
 
 class command_with_args(object):
@@ -772,13 +1301,17 @@ class command_with_args(object):
             CalledProcessError is raised. If None, timeout is infinite.
         inherit_env (list): The list of environment variables to inherit from the
             calling process when the command is invoked.
+        priority (int): commands with higher priorities start first when they
+            run in a :class:`insights.core.command_pool.CommandPool`.
+        cache (dict): when the output of the command may be reused from an
+            earlier collection. See :mod:`insights.core.command_cache`.
 
     Returns:
         function: A datasource that returns the output of a command that takes
             specified arguments passed by the provider.
     """
 
-    def __init__(self, cmd, provider, context=HostContext, deps=None, split=True, keep_rc=False, timeout=None, inherit_env=None, signum=None, **kwargs):
+    def __init__(self, cmd, provider, context=HostContext, deps=None, split=True, keep_rc=False, timeout=None, inherit_env=None, signum=None, priority=0, cache=None, **kwargs):
         deps = deps if deps is not None else []
         self.cmd = cmd
         self.provider = provider
@@ -789,6 +1322,8 @@ class command_with_args(object):
         self.timeout = timeout
         self.inherit_env = inherit_env if inherit_env is not None else []
         self.signum = signum
+        self.priority = priority
+        self.cache = cache
         self.__name__ = self.__class__.__name__
         datasource(self.provider, self.context, *deps, raw=self.raw, **kwargs)(self)
 
@@ -800,7 +1335,8 @@ class command_with_args(object):
         try:
             self.cmd = self.cmd % source
             return CommandOutputProvider(self.cmd, ctx, split=self.split,
-                    keep_rc=self.keep_rc, ds=self, timeout=self.timeout, inherit_env=self.inherit_env, signum=self.signum)
+                    keep_rc=self.keep_rc, ds=self, timeout=self.timeout, inherit_env=self.inherit_env, signum=self.signum,
+                    priority=self.priority, cache=self.cache)
         except:
             log.debug(traceback.format_exc())
         raise ContentException("No results found for [%s]" % self.cmd)
@@ -832,6 +1368,19 @@ class foreach_execute(object):
             CalledProcessError is raised. If None, timeout is infinite.
         inherit_env (list): The list of environment variables to inherit from the
             calling process when the command is invoked.
+        priority (int): commands with higher priorities start first when they
+            run in a :class:`insights.core.command_pool.CommandPool`.
+        cache (dict): when the output of the command may be reused from an
+            earlier collection. See :mod:`insights.core.command_cache`.
+        batch (function): runs the command once for up to :data:`BATCH_SIZE`
+            elements at a time, with the elements as its last arguments, when
+            the template ends with its only ``%s``. The function is called with
+            the elements and the lines of output as bytes and returns a list
+            with the lines of each element, or ``None`` if it can't tell them
+            apart. See :func:`one_line_per_argument`. If it returns ``None`` or
+            the command fails, the elements are run one at a time. Either way,
+            each element gets its own provider with the same content as
+            without batching.
 
 
     Returns:
@@ -839,7 +1388,7 @@ class foreach_execute(object):
             created by substituting each element of provider into the cmd template.
     """
 
-    def __init__(self, provider, cmd, context=HostContext, deps=[], split=True, keep_rc=False, timeout=None, inherit_env=[], signum=None, **kwargs):
+    def __init__(self, provider, cmd, context=HostContext, deps=[], split=True, keep_rc=False, timeout=None, inherit_env=[], signum=None, priority=0, cache=None, batch=None, **kwargs):
         self.provider = provider
         self.cmd = cmd
         self.context = context
@@ -849,30 +1398,91 @@ class foreach_execute(object):
         self.timeout = timeout
         self.inherit_env = inherit_env
         self.signum = signum
+        self.priority = priority
+        self.cache = cache
+        self.batch = batch
         self.__name__ = self.__class__.__name__
         datasource(self.provider, self.context, *deps, multi_output=True, raw=self.raw, **kwargs)(self)
 
+    def _get_batch_prefix(self):
+        if self.batch is None or self.cmd.count("%s") != 1 or not self.cmd.rstrip().endswith("%s"):
+            return None
+        return shlex.split(self.cmd % "")
+
     def __call__(self, broker):
         result = []
+        batched = []
         source = broker[self.provider]
         ctx = broker[self.context]
         if isinstance(source, ContentProvider):
             source = source.content
         if not isinstance(source, (list, set)):
             source = [source]
+        prefix = self._get_batch_prefix()
         for e in source:
             try:
                 the_cmd = self.cmd % e
+                output = None
+                if prefix is not None and shlex.split(the_cmd) == prefix + [e]:
+                    output = _BatchOutput()
                 cop = CommandOutputProvider(the_cmd, ctx, args=e,
                         split=self.split, keep_rc=self.keep_rc, ds=self,
-                        timeout=self.timeout, inherit_env=self.inherit_env, signum=self.signum)
+                        timeout=self.timeout, inherit_env=self.inherit_env, signum=self.signum,
+                        priority=self.priority, output=output, cache=self.cache)
                 result.append(cop)
+                if output is not None:
+                    batched.append(cop)
             except:
                 log.debug(traceback.format_exc())
+
+        pool = getattr(ctx, "command_pool", None)
+        for i in range(0, len(batched), BATCH_SIZE):
+            chunk = batched[i:i + BATCH_SIZE]
+            job = functools.partial(self._run_batch, prefix, chunk)
+            future = pool.submit(job, priority=self.priority) if pool is not None else _Finished(job)
+            for n, cop in enumerate(chunk):
+                cop._future.bind(future, n)
+
         if result:
             return result
         raise ContentException("No results found for [%s]" % self.cmd)
 
+    def _run_batch(self, prefix, providers):
+        """
+        Runs the command once for all of the providers and returns the
+        ``(rc, file)`` output of each, or runs them one at a time if the
+        output can't be split between them.
+        """
+        first = providers[0]
+        env = first.create_env()
+        timeout = self.timeout or first.ctx.timeout
+        cmd = prefix + [p.args for p in providers]
+        rc, raw = Pipeline(cmd, timeout=timeout, signum=first.signum, env=env)(keep_rc=True)
+
+        parts = self.batch([p.args for p in providers], raw.splitlines()) if rc == 0 else None
+        if parts is None or len(parts) != len(providers):
+            log.debug("Running %s one at a time.", self.cmd)
+            return [p._execute() for p in providers]
+
+        outputs = []
+        for p, lines in zip(providers, parts):
+            data = b"".join(l + b"\n" for l in lines)
+            stages = p.create_args()[1:]
+            rc, data = textfilter.filter_output(stages, data, env) if stages else (0, data)
+            outputs.append((rc, _CommandOutput(data=data)))
+        return outputs
+
+
+def one_line_per_argument(elements, lines):
+    """
+    Batch function for :class:`foreach_execute` that gives each element one
+    line of output, in order. Commands like ``md5sum`` or ``rpm -qf`` print one
+    line for each argument when they succeed.
+    """
+    if len(lines) != len(elements):
+        return None
+    return [[l] for l in lines]
+
 
 class foreach_collect(object):
     """
@@ -913,8 +1523,8 @@ class foreach_collect(object):
             source = [source]
         for e in source:
             pattern = ctx.locate_path(self.path % e)
-            for p in glob(os.path.join(root, pattern.lstrip('/'))):
-                if self.ignore_func(p) or os.path.isdir(p):
+            for p, is_dir in _iglob(ctx, os.path.join(root, pattern.lstrip('/'))):
+                if self.ignore_func(p) or _is_dir(ctx, p, is_dir):
                     continue
                 try:
                     result.append(self.kind(p[len(root):], root=root, ds=self, ctx=ctx))
@@ -942,6 +1552,28 @@ class first_of(object):
                 return broker[c]
 
 
+class _FindScan(object):
+    """ The lines matched by each :class:`find` in one scan of a provider. """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.results = None
+
+
+class _FindInvocation(dr.ComponentType):
+    def invoke(self, broker):
+        return self.component(broker.get(self.deps[0]), broker)
+
+
+class _find_component(component, _FindInvocation):
+    """
+    The type of :class:`find` components. They're invoked with the broker
+    too, so a find can tell which other finds of its spec the run evaluates.
+    Errors are handled by :meth:`PluginType.invoke` like those of any other
+    component, and a find is only skipped when nothing matched.
+    """
+    pass
+
+
 class find(object):
     """
     Helper class for extracting specific lines from a datasource for direct
@@ -955,10 +1587,17 @@ class find(object):
         def report(starts):
             return make_info("SERVICE_STARTS", num_starts=len(starts))
 
+    The content of each provider is streamed instead of loaded, and the
+    first ``find`` of a spec to see a provider scans it for the patterns of
+    every enabled ``find`` of that spec the same run evaluates. The others
+    get their lines from that scan, which is dropped once they all have.
+
     Args:
         spec (datasource): some datasource, ideally filterable.
         pattern (string / list): a string or list of strings to match (no
             patterns supported)
+        max_matches (int): keep at most this many lines for each path,
+            command, or spec name. All of them are kept if ``None``.
 
     Returns:
         A dict where each key is a command, path, or spec name, and each value
@@ -968,27 +1607,94 @@ class find(object):
     Raises:
         dr.SkipComponent if no paths have matching lines.
     """
+    _finders = defaultdict(list)
+    _scans = weakref.WeakKeyDictionary()
+    _lock = threading.Lock()
 
-    def __init__(self, spec, pattern):
+    def __init__(self, spec, pattern, max_matches=None):
         if getattr(spec, "raw", False):
             name = dr.get_name(spec)
             raise ValueError("{}: Cannot filter raw files.".format(name))
 
         self.spec = spec
         self.pattern = pattern if isinstance(pattern, list) else [pattern]
+        self.max_matches = max_matches
+        self.regex = "|".join(re.escape(p) for p in self.pattern) or "(?!)"
+        self._search = re.compile(self.regex).search
         self.__name__ = self.__class__.__name__
         self.__module__ = self.__class__.__module__
 
         if getattr(spec, "filterable", False):
             _add_filter(spec, pattern)
 
-        component(spec)(self)
+        _find_component(spec)(self)
+        self._finders[spec].append(self)
+
+    def _is_full(self, lines):
+        return self.max_matches is not None and len(lines) >= self.max_matches
 
-    def __call__(self, ds):
-        # /usr/bin/grep level filtering is applied behind .content or
-        # .stream(), but we still need to ensure we get only what *this* find
-        # instance wants. This can be inefficient on files where many lines
-        # match.
+    @staticmethod
+    def _scan(d, finders):
+        """
+        Returns a dict of the lines of ``d`` each of ``finders`` matches,
+        found in one pass over its content.
+        """
+        results = dict((f, []) for f in finders)
+        active = [f for f in finders if not f._is_full(results[f])]
+        if not active:
+            return results
+        search = re.compile("|".join(f.regex for f in active)).search
+        stream = d.stream()
+        try:
+            for line in stream:
+                if not search(line):
+                    continue
+                full = False
+                for f in active:
+                    if f._search(line):
+                        lines = results[f]
+                        lines.append(line)
+                        full = full or f._is_full(lines)
+                if full:
+                    active = [f for f in active if not f._is_full(results[f])]
+                    if not active:
+                        break
+                    search = re.compile("|".join(f.regex for f in active)).search
+        finally:
+            stream.close()
+        return results
+
+    def _get_finders(self, broker):
+        """
+        Returns the finds of the spec that the run evaluating ``broker``
+        still has to, starting with this one.
+        """
+        plan = getattr(broker, "plan", None)
+        if plan is None:
+            return [self]
+        return [self] + [f for f in self._finders[self.spec]
+                         if f is not self and f in plan.ids and f not in broker and dr.is_enabled(f)]
+
+    def _get_lines(self, d, broker=None):
+        with self._lock:
+            scan = self._scans.get(d)
+            if scan is None:
+                scan = self._scans[d] = _FindScan()
+        with scan.lock:
+            if scan.results is None:
+                scan.results = self._scan(d, self._get_finders(broker))
+            lines = scan.results.pop(self, None)
+            if not scan.results:
+                with self._lock:
+                    if self._scans.get(d) is scan:
+                        del self._scans[d]
+        if lines is None:
+            lines = self._scan(d, [self])[self]
+        return lines
+
+    def __call__(self, ds, broker=None):
+        # /usr/bin/grep level filtering is applied behind .stream(), but we
+        # still need to ensure we get only what *this* find instance wants.
         results = {}
         ds = ds if isinstance(ds, list) else [ds]
         for d in ds:
@@ -998,11 +1704,7 @@ class find(object):
                 origin = d.cmd
             else:
                 origin = dr.get_name(self.spec)
-            stream = d.content if d.loaded else d.stream()
-            lines = []
-            for line in stream:
-                if any(p in line for p in self.pattern):
-                    lines.append(line)
+            lines = self._get_lines(d, broker)
             if lines:
                 results[origin] = lines
         if not results:
@@ -1010,6 +1712,63 @@ class find(object):
         return dict(results)
 
 
+def get_changed(broker, root=None):
+    """
+    Returns the datasources in ``broker`` whose content may be different if
+    they were evaluated again. Pass the result and the broker as ``changed``
+    and ``previous`` to :func:`insights.core.dr.run` to reuse everything else.
+
+    A datasource is unchanged only if it produced a single provider and the
+    file behind it still matches the provider's fingerprint, so commands and
+    datasources that produce lists or other values are always changed.
+
+    Args:
+        broker (Broker): the broker from the previous evaluation.
+        root (str): where the files are now if it isn't where they were, like
+            when an archive is extracted again.
+    """
+    changed = set()
+    for comp, value in broker.items():
+        if is_datasource(comp) and (not isinstance(value, ContentProvider) or value.is_changed(root)):
+            changed.add(comp)
+    return changed
+
+
+def get_archive_paths(context, components):
+    """
+    Returns glob patterns, relative to the root of a ``context``, of the files
+    the datasources in ``components`` may read in it. Returns ``None`` if one
+    of them is a function that depends on the context itself, since what it
+    reads can't be known. Environment variables in paths match anything.
+
+    Args:
+        context (type): the class of the context.
+        components (iterable): the components to consider. Those that aren't
+            datasources or don't run in the context are skipped.
+    """
+    paths = set()
+    for comp in components:
+        if not is_datasource(comp):
+            continue
+        if isinstance(comp, (simple_file, first_file, glob_file, listdir, foreach_collect)):
+            contexts = comp.context if isinstance(comp.context, (list, tuple)) else [comp.context]
+            if not any(issubclass(context, c) for c in contexts):
+                continue
+            if isinstance(comp, simple_file):
+                paths.add(comp.path)
+            elif isinstance(comp, first_file):
+                paths.update(comp.paths)
+            elif isinstance(comp, glob_file):
+                paths.update(comp.patterns)
+            elif isinstance(comp, listdir):
+                paths.update([comp.path, comp.path.rstrip("/") + "/*"])
+            else:
+                paths.add(comp.path.replace("%s", "*"))
+        elif any(isinstance(d, type) and issubclass(context, d) for d in dr.get_dependencies(comp)):
+            return None
+    return set(re.sub(r"\$(\w+|\{\w+\})", "*", p).lstrip("/") for p in paths)
+
+
 @serializer(CommandOutputProvider)
 def serialize_command_output(obj, root):
     rel = os.path.join("insights_commands", mangle_command(obj.cmd))
@@ -1032,6 +1791,7 @@ def deserialize_command_output(_type, data, root):
     res.rc = data["rc"]
     res.cmd = data["cmd"]
     res.args = data["args"]
+    res.fingerprint = data.get("fingerprint")
     return res
 
 
@@ -1042,6 +1802,7 @@ def serialize_text_file_provider(obj, root):
     return {
         "relative_path": obj.relative_path,
         "rc": rc,
+        "fingerprint": obj.fingerprint,
     }
 
 
@@ -1050,6 +1811,7 @@ def deserialize_text_provider(_type, data, root):
     rel = data["relative_path"]
     res = SerializedOutputProvider(rel, root)
     res.rc = data["rc"]
+    res.fingerprint = data.get("fingerprint")
     return res
 
 
@@ -1060,6 +1822,7 @@ def serialize_raw_file_provider(obj, root):
     return {
         "relative_path": obj.relative_path,
         "rc": rc,
+        "fingerprint": obj.fingerprint,
     }
 
 
@@ -1068,6 +1831,7 @@ def deserialize_raw_file_provider(_type, data, root):
     rel = data["relative_path"]
     res = SerializedRawOutputProvider(rel, root)
     res.rc = data["rc"]
+    res.fingerprint = data.get("fingerprint")
     return res
 
 
@@ -1081,4 +1845,6 @@ def serialize_datasource_provider(obj, root):
 
 @deserializer(DatasourceProvider)
 def deserialize_datasource_provider(_type, data, root):
-    return SerializedOutputProvider(data["relative_path"], root)
+    res = SerializedOutputProvider(data["relative_path"], root)
+    res.fingerprint = data.get("fingerprint")
+    return res
@@ -2,7 +2,9 @@
 Custom datasource for package_provides
 """
 import logging
+import os
 import signal
+import threading
 
 from insights.combiners.ps import Ps
 from insights.core.context import HostContext
@@ -16,19 +18,94 @@ from . import get_running_commands, DEFAULT_SHELL_TIMEOUT
 
 logger = logging.getLogger(__name__)
 
+INDEX_MIN_COMMANDS = 10
+""" int: commands are looked up in the :class:`PackageIndex` when there are at least this many. """
 
-def get_package(ctx, file_path):
+INDEX_TIMEOUT = 60
+""" int: timeout in seconds for the ``rpm -qa`` command that builds the :class:`PackageIndex` """
+
+INDEX_COMMAND = "/usr/bin/rpm -qa --qf '[%{FILENAMES}\\t%{NAME}-%{VERSION}-%{RELEASE}.%{ARCH}\\n]'"
+
+
+class PackageIndex(object):
+    """
+    Maps the files installed by RPM to the packages that own them, like
+    ``rpm -qf``. The index is built from a single ``rpm -qa`` the first time
+    it's used and shared by everything that uses it afterward.
+
+    Arguments:
+        ctx: The current execution context
+    """
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self._packages = None
+        self._built = False
+        self._lock = threading.Lock()
+
+    def _build(self):
+        rc, lines = self.ctx.shell_out(INDEX_COMMAND, timeout=INDEX_TIMEOUT, keep_rc=True,
+                                       signum=signal.SIGTERM)
+        if rc != 0:
+            logger.debug("Couldn't list the files of installed packages: rc=%s", rc)
+            return None
+
+        packages = {}
+        names = {}
+        for line in lines:
+            path, _, pkg = line.rpartition("\t")
+            if path and path not in packages:
+                packages[path] = names.setdefault(pkg, pkg)
+        return packages
+
+    @property
+    def packages(self):
+        """
+        dict: file paths to the name of the first package that owns them, or
+        ``None`` if the files of the installed packages couldn't be listed.
+        """
+        with self._lock:
+            if not self._built:
+                self._packages = self._build()
+                self._built = True
+        return self._packages
+
+    def get_package(self, file_path):
+        """
+        Returns the package that owns ``file_path`` after symlinks are
+        resolved, or ``None`` if it doesn't exist or isn't owned by a package.
+        """
+        resolved = os.path.realpath(file_path)
+        if not os.path.exists(resolved):
+            return None
+        return (self.packages or {}).get(resolved)
+
+
+@datasource(HostContext)
+def package_index(broker):
+    """
+    Returns a :class:`PackageIndex` for datasources that need to know which
+    packages own many files. Nothing runs until it's used.
+    """
+    return PackageIndex(broker[HostContext])
+
+
+def get_package(ctx, file_path, index=None):
     """
     Get the RPM package that owns the specified filename with path
 
     Arguments:
         ctx: The current execution context
         file_path(str): The full path and filename for RPM query
+        index(PackageIndex): Look the file up in this index instead of
+            running ``readlink`` and ``rpm -qf``, unless it couldn't be built
 
     Returns:
         str: The name of the RPM package that provides the ``file``
         or None if file is not associated with an RPM.
     """
+    if index is not None and index.packages is not None:
+        return index.get_package(file_path)
+
     rc, resolved = ctx.shell_out(
         "/usr/bin/readlink -e {0}".format(file_path),
         timeout=DEFAULT_SHELL_TIMEOUT,
@@ -45,7 +122,7 @@ def get_package(ctx, file_path):
             return pkg[0]
 
 
-@datasource(Ps, HostContext)
+@datasource(Ps, HostContext, optional=[package_index])
 def cmd_and_pkg(broker):
     """
     Collect a list of running commands and the associated RPM package providing those commands.
@@ -57,6 +134,9 @@ def cmd_and_pkg(broker):
     to the spec ``ps_auxww``.  A filter must also be added to ``package_provides_command`` so
     this datasource will look for the command in Ps.
 
+    When there are at least :data:`INDEX_MIN_COMMANDS` commands, their packages are looked up
+    in the :class:`PackageIndex` instead of running ``readlink`` and ``rpm -qf`` for each.
+
     Arguments:
         broker: the broker object for the current session
 
@@ -71,8 +151,11 @@ def cmd_and_pkg(broker):
 
     if commands:
         pkg_cmd = list()
-        for cmd in get_running_commands(broker[Ps], broker[HostContext], list(commands)):
-            pkg = get_package(broker[HostContext], cmd)
+        ctx = broker[HostContext]
+        running = get_running_commands(broker[Ps], ctx, list(commands))
+        index = broker.get(package_index) if len(running) >= INDEX_MIN_COMMANDS else None
+        for cmd in running:
+            pkg = get_package(ctx, cmd, index)
             if pkg is not None:
                 pkg_cmd.append("{0} {1}".format(cmd, pkg))
         if pkg_cmd:
@@ -15,7 +15,7 @@ from insights.core.context import HostContext
 from insights.core.spec_factory import RawFileProvider
 from insights.core.spec_factory import simple_file, simple_command, glob_file
 from insights.core.spec_factory import first_of, command_with_args
-from insights.core.spec_factory import foreach_collect, foreach_execute
+from insights.core.spec_factory import foreach_collect, foreach_execute, one_line_per_argument
 from insights.core.spec_factory import first_file, listdir
 from insights.components.cloud_provider import IsAzure, IsGCP
 from insights.components.ceph import IsCephMonitor
@@ -60,6 +60,11 @@ def _make_rpm_formatter(fmt=None):
 
 format_rpm = _make_rpm_formatter()
 
+# when the output of rarely changing commands may be reused from an earlier
+# collection. See insights.core.command_cache.
+DAILY = {"ttl": 24 * 60 * 60}
+MODULES = {"ttl": 24 * 60 * 60, "paths": ["/lib/modules"], "kernel": True}
+
 
 class DefaultSpecs(Specs):
     abrt_ccpp_conf = simple_file("/etc/abrt/plugins/CCpp.conf")
@@ -162,7 +167,7 @@ class DefaultSpecs(Specs):
     dm_mod_use_blk_mq = simple_file("/sys/module/dm_mod/parameters/use_blk_mq")
     dmesg = simple_command("/bin/dmesg")
     dmesg_log = simple_file("/var/log/dmesg")
-    dmidecode = simple_command("/usr/sbin/dmidecode")
+    dmidecode = simple_command("/usr/sbin/dmidecode", cache=DAILY)
     dmsetup_info = simple_command("/usr/sbin/dmsetup info -C")
     dmsetup_status = simple_command("/usr/sbin/dmsetup status")
     dnf_conf = simple_file("/etc/dnf/dnf.conf")
@@ -354,14 +359,14 @@ class DefaultSpecs(Specs):
     ls_var_www = simple_command("/bin/ls -la /dev/null /var/www")  # https://github.com/RedHatInsights/insights-core/issues/827
     lsblk = simple_command("/bin/lsblk")
     lsblk_pairs = simple_command("/bin/lsblk -P -o NAME,KNAME,MAJ:MIN,FSTYPE,MOUNTPOINT,LABEL,UUID,RA,RO,RM,MODEL,SIZE,STATE,OWNER,GROUP,MODE,ALIGNMENT,MIN-IO,OPT-IO,PHY-SEC,LOG-SEC,ROTA,SCHED,RQ-SIZE,TYPE,DISC-ALN,DISC-GRAN,DISC-MAX,DISC-ZERO")
-    lscpu = simple_command("/usr/bin/lscpu")
+    lscpu = simple_command("/usr/bin/lscpu", cache=DAILY)
     lsmod = simple_command("/sbin/lsmod")
     lsof = first_of([
         simple_command("/usr/bin/lsof"),
         simple_command("/usr/sbin/lsof")
     ])
-    lspci = simple_command("/sbin/lspci -k")
-    lspci_vmmkn = simple_command("/sbin/lspci -vmmkn")
+    lspci = simple_command("/sbin/lspci -k", cache=DAILY)
+    lspci_vmmkn = simple_command("/sbin/lspci -vmmkn", cache=DAILY)
     lsscsi = simple_command("/usr/bin/lsscsi")
     lsvmbus = simple_command("/usr/sbin/lsvmbus -vv")
     lvm_conf = simple_file("/etc/lvm/lvm.conf")
@@ -375,16 +380,16 @@ class DefaultSpecs(Specs):
     machine_id = first_file(["etc/insights-client/machine-id", "etc/redhat-access-insights/machine-id", "etc/redhat_access_proactive/machine-id"])
     mariadb_log = simple_file("/var/log/mariadb/mariadb.log")
     max_uid = simple_command("/bin/awk -F':' '{ if($3 > max) max = $3 } END { print max }' /etc/passwd")
-    md5chk_files = foreach_execute(md5chk.files, "/usr/bin/md5sum %s", keep_rc=True)
+    md5chk_files = foreach_execute(md5chk.files, "/usr/bin/md5sum %s", keep_rc=True, batch=one_line_per_argument)
     mdstat = simple_file("/proc/mdstat")
     meminfo = first_file(["/proc/meminfo", "/meminfo"])
     messages = simple_file("/var/log/messages")
-    modinfo_i40e = simple_command("/sbin/modinfo i40e")
-    modinfo_igb = simple_command("/sbin/modinfo igb")
-    modinfo_ixgbe = simple_command("/sbin/modinfo ixgbe")
-    modinfo_filtered_modules = command_with_args('modinfo %s', kernel_module_list.kernel_module_filters)
-    modinfo_veth = simple_command("/sbin/modinfo veth")
-    modinfo_vmxnet3 = simple_command("/sbin/modinfo vmxnet3")
+    modinfo_i40e = simple_command("/sbin/modinfo i40e", cache=MODULES)
+    modinfo_igb = simple_command("/sbin/modinfo igb", cache=MODULES)
+    modinfo_ixgbe = simple_command("/sbin/modinfo ixgbe", cache=MODULES)
+    modinfo_filtered_modules = command_with_args('modinfo %s', kernel_module_list.kernel_module_filters, cache=MODULES)
+    modinfo_veth = simple_command("/sbin/modinfo veth", cache=MODULES)
+    modinfo_vmxnet3 = simple_command("/sbin/modinfo vmxnet3", cache=MODULES)
     modprobe = glob_file(["/etc/modprobe.conf", "/etc/modprobe.d/*.conf"])
     mokutil_sbstate = simple_command("/bin/mokutil --sb-state")
     mongod_conf = glob_file([
@@ -43,8 +43,8 @@ def _intercept_add_filter(func):
 
 def _intercept_find(func):
     @wraps(func)
-    def inner(ds, pattern):
-        ret = find(ds, pattern)
+    def inner(ds, pattern, *args, **kwargs):
+        ret = find(ds, pattern, *args, **kwargs)
         calling_module = inspect.stack()[1][0].f_globals.get("__name__")
         ADDED_FILTERS[calling_module].add(ds)
         return ret
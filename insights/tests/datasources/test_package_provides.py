@@ -6,7 +6,8 @@ from insights.core import filters
 from insights.core.dr import SkipComponent
 from insights.parsers.ps import PsEoCmd
 from insights.specs import Specs
-from insights.specs.datasources.package_provides import get_package, cmd_and_pkg
+from insights.specs.datasources import package_provides
+from insights.specs.datasources.package_provides import get_package, cmd_and_pkg, package_index, PackageIndex
 from insights.core.spec_factory import DatasourceProvider
 from insights.tests import context_wrap
 
@@ -151,3 +152,65 @@ def test_cmd_and_pkg_not_found():
 
     with pytest.raises(SkipComponent):
         cmd_and_pkg(broker)
+
+
+class IndexContext(FakeContext):
+    def __init__(self, lines, rc=0):
+        super(IndexContext, self).__init__()
+        self.lines = lines
+        self.rc = rc
+        self.calls = 0
+
+    def shell_out(self, cmd, split=True, timeout=None, keep_rc=False, env=None, signum=None):
+        if "-qa" in cmd:
+            self.calls += 1
+            return (self.rc, self.lines)
+        if "readlink" in cmd or "rpm" in cmd:
+            raise AssertionError("%s shouldn't run" % cmd)
+        return super(IndexContext, self).shell_out(cmd, split, timeout, keep_rc, env, signum)
+
+
+def test_package_index(tmpdir):
+    tool = tmpdir.join("tool")
+    tool.write("")
+    link = tmpdir.join("link")
+    link.mksymlinkto(tool)
+    ctx = IndexContext(["{0}\t{1}".format(tool, HTTPD_PKG), "{0}\tother-1-1.noarch".format(tool)])
+    index = PackageIndex(ctx)
+    assert ctx.calls == 0
+
+    assert get_package(ctx, str(tool), index) == HTTPD_PKG
+    assert get_package(ctx, str(link), index) == HTTPD_PKG
+    assert get_package(ctx, str(tmpdir.join("missing")), index) is None
+    assert ctx.calls == 1
+
+
+def test_package_index_fallback():
+    ctx = FakeContext()
+    ctx_fail = IndexContext([], rc=1)
+    index = PackageIndex(ctx_fail)
+    assert get_package(ctx, JAVA_PATH_1, index) == JAVA_PKG_2
+    assert ctx_fail.calls == 1
+
+
+class FakeIndex(PackageIndex):
+    def get_package(self, file_path):
+        return self.packages.get(JAVA_PATH_2 if file_path == JAVA_PATH_1 else file_path)
+
+
+def test_cmd_and_pkg_index(monkeypatch):
+    filters.add_filter(Specs.package_provides_command, ['httpd', 'java'])
+    monkeypatch.setattr(package_provides, "INDEX_MIN_COMMANDS", 1)
+    ctx = IndexContext(["{0}\t{1}".format(JAVA_PATH_2, JAVA_PKG_2), "{0}\t{1}".format(HTTPD_PATH, HTTPD_PKG)])
+    try:
+        pseo = PsEoCmd(context_wrap(PS_EO_CMD))
+        broker = dr.Broker()
+        broker[HostContext] = ctx
+        broker[Ps] = Ps(None, None, None, None, None, None, pseo)
+        broker[package_index] = FakeIndex(ctx)
+
+        result = cmd_and_pkg(broker)
+        assert sorted(result.content) == sorted(EXPECTED.content)
+        assert ctx.calls == 1
+    finally:
+        del filters.FILTERS[Specs.package_provides_command]
@@ -0,0 +1,140 @@
+import io
+import os
+import pickle
+import tarfile
+import zipfile
+
+import pytest
+
+from insights import run
+from insights.core import archivefs, filters
+from insights.core.archivefs import ArchiveFS
+from insights.core.archives import InvalidArchive
+from insights.core.context import HostArchiveContext
+from insights.core.hydration import create_archive_context
+from insights.core.plugins import datasource
+from insights.core.spec_factory import RegistryPoint, SpecSet, TextFileProvider, glob_file, listdir, simple_file
+
+FILES = {
+    "host/insights_commands/hostname_-f": b"host.example.com\n",
+    "host/etc/hosts": b"127.0.0.1 localhost\n::1 localhost6\n",
+    "host/etc/sysconfig/network": b"NETWORKING=yes\nHOSTNAME=host\n",
+}
+LINKS = {
+    "host/etc/hosts.link": "hosts",
+    "host/sysconfig": "etc/sysconfig",
+    "host/etc/outside": "/etc/passwd",
+}
+
+
+def _tar(path, mode):
+    with tarfile.open(path, mode) as tar:
+        for name, data in FILES.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        for name, target in LINKS.items():
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.SYMTYPE
+            info.linkname = target
+            tar.addfile(info)
+
+
+def _zip(path, mode):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in FILES.items():
+            zf.writestr(name, data)
+        for name, target in LINKS.items():
+            info = zipfile.ZipInfo(name)
+            info.external_attr = 0o120777 << 16
+            zf.writestr(info, target)
+
+
+@pytest.fixture(params=[("host.tar", "w", _tar), ("host.tar.gz", "w:gz", _tar), ("host.zip", "w", _zip)])
+def archive(request, tmpdir):
+    name, mode, make = request.param
+    path = str(tmpdir.join(name))
+    make(path, mode)
+    return path
+
+
+def test_index(archive):
+    with ArchiveFS(archive, cache_size=40) as fs:
+        root = os.path.abspath(archive) + "/host"
+        assert fs.files() == sorted(root + n[4:] for n in FILES)
+        assert fs.exists(root + "/etc/hosts.link")
+        assert fs.realpath(root + "/etc/hosts.link") == root + "/etc/hosts"
+        assert fs.realpath(root + "/sysconfig/network") == root + "/etc/sysconfig/network"
+        assert fs.realpath(root + "/etc/outside") == "/etc/passwd"
+        assert not fs.exists(root + "/etc/outside")
+        assert fs.lexists(root + "/etc/outside")
+        assert fs.isdir(root + "/sysconfig") and not fs.isdir(root + "/etc/hosts")
+        assert sorted(fs.listdir(root)) == [("etc", True), ("insights_commands", True), ("sysconfig", True)]
+
+        assert fs.read(root + "/sysconfig/network") == FILES["host/etc/sysconfig/network"]
+        assert fs.getsize(root + "/etc/hosts") == len(FILES["host/etc/hosts"])
+        assert fs.read(root + "/etc/hosts.link") == FILES["host/etc/hosts"]
+        assert list(fs._cache) == [root + "/etc/hosts"]
+        with pytest.raises(IOError):
+            fs.read(root + "/etc/missing")
+
+
+def test_pickle(archive):
+    root = os.path.abspath(archive) + "/host"
+    with ArchiveFS(archive) as fs:
+        copy = pickle.loads(pickle.dumps(fs))
+        shared = copy.source
+        with copy:
+            assert copy._tmp is None
+            assert copy.files() == fs.files()
+            assert copy.read(root + "/etc/hosts") == FILES["host/etc/hosts"]
+        with pickle.loads(pickle.dumps(fs)) as again:
+            assert again.source == shared
+    assert os.path.exists(shared) == (shared == archive)
+
+
+def test_not_an_archive(tmpdir):
+    path = tmpdir.join("plain")
+    path.write("not an archive")
+    with pytest.raises(InvalidArchive):
+        ArchiveFS(str(path))
+    assert create_archive_context(str(path)) is None
+
+
+class Specs(SpecSet):
+    hosts = RegistryPoint(filterable=True)
+    network = RegistryPoint()
+    etc = RegistryPoint()
+
+
+class ArchiveSpecs(Specs):
+    context = HostArchiveContext
+    hosts = simple_file("/etc/hosts.link", context=context)
+    network = glob_file("/sysconfig/netw*", context=context)
+    etc = listdir("/etc", context=context)
+
+
+filters.add_filter(Specs.hosts, "localhost6")
+
+
+@datasource(Specs.hosts, Specs.network, Specs.etc)
+def everything(broker):
+    return (broker[Specs.hosts].content, broker[Specs.network][0].content, broker[Specs.etc])
+
+
+def test_run(archive):
+    ctx = create_archive_context(archive)
+    assert isinstance(ctx, HostArchiveContext)
+    assert ctx.root == os.path.abspath(archive) + "/host"
+    assert TextFileProvider("/etc/hosts", ctx.root, ctx=ctx).content == ["127.0.0.1 localhost", "::1 localhost6"]
+    with pytest.raises(Exception):
+        TextFileProvider("/etc/outside", ctx.root, ctx=ctx)
+    ctx.archive.close()
+
+    expected = (["::1 localhost6"], ["NETWORKING=yes", "HOSTNAME=host"], ["hosts", "hosts.link", "outside", "sysconfig"])
+    assert run(everything, root=archive)[everything] == expected
+    try:
+        archivefs.ENABLED = False
+        assert run(everything, root=archive)[everything] == expected
+    finally:
+        archivefs.ENABLED = True
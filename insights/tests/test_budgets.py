@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+
+from insights import apply_configs, dr
+from insights.core import Parser
+from insights.core.plugins import datasource, parser
+from insights.core.spec_factory import DatasourceProvider
+
+
+class bstage(dr.ComponentType):
+    pass
+
+
+@bstage(isolated=True)
+def bslow():
+    time.sleep(3)
+
+
+@bstage()
+def bsleepy():
+    time.sleep(0.3)
+    return "sleepy"
+
+
+@bstage()
+def bfast():
+    return "fast"
+
+
+@bstage(bslow)
+def bneeds_slow(s):
+    return s
+
+
+@bstage(bfast, optional=[bslow])
+def bsurvives(f, s):
+    return f
+
+
+@datasource()
+def bdata(broker):
+    return DatasourceProvider("some content", "/bdata")
+
+
+@parser(bdata, isolated=True)
+class SlowParser(Parser):
+    def parse_content(self, content):
+        time.sleep(3)
+
+
+@parser(bdata, isolated=True)
+class FastParser(Parser):
+    def parse_content(self, content):
+        self.pid = os.getpid()
+        self.content = content
+
+
+UNSERIALIZABLE = []
+
+
+@parser(bdata, isolated=True)
+class UnserializableParser(Parser):
+    def parse_content(self, content):
+        UNSERIALIZABLE.append(os.getpid())
+        self.lines = (l for l in content)
+
+
+def _graph(*components):
+    graph = {}
+    for c in components:
+        graph.update(dr.get_dependency_graph(c))
+    return graph
+
+
+def _timed_out(broker, component):
+    return [e for e in broker.exceptions.get(component, []) if isinstance(e, dr.ComponentTimeout)]
+
+
+def test_budget_lookup():
+    try:
+        dr.set_budget(bstage, 5)
+        dr.set_budget(bfast, 1)
+        assert dr.get_budget(bslow) == 5
+        assert dr.get_budget(bfast) == 1
+        assert dr.get_budget(FastParser) is None
+        dr.set_budget(bfast, None)
+        assert dr.get_budget(bfast) == 5
+    finally:
+        dr.BUDGETS.clear()
+
+
+def test_budget_serial():
+    dr.set_budget(bslow, 0.2)
+    try:
+        start = time.time()
+        broker = dr.run(_graph(bneeds_slow, bsurvives))
+        assert time.time() - start < 2
+    finally:
+        dr.BUDGETS.clear()
+    assert _timed_out(broker, bslow)
+    assert bneeds_slow in broker.missing_requirements
+    assert broker[bsurvives] == "fast"
+
+
+def test_budget_isolated_parser():
+    dr.set_budget(parser, 0.5)
+    try:
+        start = time.time()
+        broker = dr.run(_graph(SlowParser, FastParser))
+        assert time.time() - start < 2
+    finally:
+        dr.BUDGETS.clear()
+    assert _timed_out(broker, SlowParser)
+    assert broker[FastParser].content == ["some content"]
+    assert broker[FastParser].pid != os.getpid()
+
+
+def test_budget_isolated_unserializable():
+    del UNSERIALIZABLE[:]
+    dr.set_budget(parser, 5)
+    try:
+        broker = dr.run(_graph(UnserializableParser))
+    finally:
+        dr.BUDGETS.clear()
+    # evaluated again in this process when the result can't be sent back
+    assert list(broker[UnserializableParser].lines) == ["some content"]
+    assert UNSERIALIZABLE == [os.getpid()]
+    assert UnserializableParser not in broker.exceptions
+
+
+@parser(bdata)
+class PlainParser(Parser):
+    def parse_content(self, content):
+        self.pid = os.getpid()
+        time.sleep(0.3)
+
+
+def test_budget_not_isolated(monkeypatch):
+    warnings = []
+    monkeypatch.setattr(dr.log, "warning", lambda msg, *args: warnings.append(msg % args if args else msg))
+    dr.set_budget(parser, 0.1)
+    dr.set_budget(bsleepy, 0.1)
+    try:
+        broker = dr.run(_graph(PlainParser, bsleepy))
+    finally:
+        dr.BUDGETS.clear()
+    assert broker[PlainParser].pid == os.getpid()
+    assert broker[bsleepy] == "sleepy"
+    assert not broker.exceptions
+    assert len([w for w in warnings if "took longer than its budget" in w]) == 2
+
+
+def test_budget_not_isolated_with_threads():
+    stop = threading.Event()
+    t = threading.Thread(target=stop.wait)
+    t.start()
+    dr.set_budget(parser, 5)
+    try:
+        broker = dr.run(_graph(FastParser))
+    finally:
+        dr.BUDGETS.clear()
+        stop.set()
+        t.join()
+    assert broker[FastParser].pid == os.getpid()
+
+
+def test_budget_with_pool():
+    from concurrent.futures import ThreadPoolExecutor
+
+    dr.set_budget(bslow, 0.2)
+    try:
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            broker = dr.run(_graph(bneeds_slow, bsurvives), pool=pool)
+            assert time.time() - start < 2
+    finally:
+        dr.BUDGETS.clear()
+    assert _timed_out(broker, bslow)
+    assert bneeds_slow in broker.missing_requirements
+    assert broker[bsurvives] == "fast"
+
+
+def test_budget_configs():
+    config = {
+        "budgets": {"insights.core.plugins.parser": 3},
+        "configs": [{"name": dr.get_name(bslow), "budget": 1}],
+    }
+    try:
+        apply_configs(config)
+        assert dr.get_budget(bslow) == 1
+        assert dr.get_budget(FastParser) == 3
+    finally:
+        dr.BUDGETS.clear()
@@ -0,0 +1,87 @@
+import os
+import time
+
+import pytest
+
+from insights.core.command_cache import CommandCache
+from insights.core.command_pool import CommandPool
+from insights.core.context import HostContext
+from insights.core.spec_factory import CommandOutputProvider
+from insights.util.subproc import CalledProcessError
+
+
+def _provider(cache, policy, cmd="/bin/echo hello", pool=None, **kwargs):
+    ctx = HostContext()
+    ctx.command_cache = cache
+    ctx.command_pool = pool
+    return CommandOutputProvider(cmd, ctx, cache=policy, **kwargs)
+
+
+def _fail(self):
+    raise AssertionError("%s ran" % self.cmd)
+
+
+@pytest.mark.parametrize("pool", [None, CommandPool()])
+def test_reuse(tmpdir, monkeypatch, pool):
+    cache = CommandCache(str(tmpdir.join("cache")))
+    assert _provider(cache, {"ttl": 60}, pool=pool).content == ["hello"]
+
+    monkeypatch.setattr(CommandOutputProvider, "_execute", _fail)
+    provider = _provider(cache, {"ttl": 60}, pool=pool)
+    assert provider.content == ["hello"]
+    dst = str(tmpdir.join("out"))
+    provider.write(dst)
+    with open(dst) as f:
+        assert f.read() == "hello\n"
+
+    with pytest.raises(AssertionError):
+        _provider(cache, {"ttl": 60}, "/bin/echo other", pool=pool).content
+    assert _provider(cache, {})._future is None
+    assert _provider(None, {"ttl": 60})._future is None
+
+
+def test_invalidation(tmpdir):
+    cache = CommandCache(str(tmpdir.join("cache")))
+    dep = tmpdir.join("dep")
+    dep.write("a")
+    policy = {"ttl": 60, "paths": [str(dep)]}
+    _provider(cache, policy).content
+
+    key = cache.get_key([["/bin/echo", "hello"]], _provider(None, None).create_env(), policy)
+    assert cache.get(key, 60)
+    dep.write("ab")
+    assert cache.get_key([["/bin/echo", "hello"]], _provider(None, None).create_env(), policy) != key
+
+    path = cache.get(key)
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert cache.get(key, 60) is None
+
+    cache.max_age = 60
+    cache.prune()
+    assert not os.path.exists(path)
+
+
+def test_kernel_policy(tmpdir, monkeypatch):
+    cache = CommandCache(str(tmpdir.join("cache")))
+    args = [["/sbin/modinfo", "veth"]]
+    key = cache.get_key(args, {}, {"ttl": 60, "kernel": True})
+    assert key != cache.get_key(args, {}, {"ttl": 60})
+
+    uname = tuple(os.uname())
+    monkeypatch.setattr(os, "uname", lambda: uname[:2] + ("0.0.0-other",) + uname[3:])
+    assert cache.get_key(args, {}, {"ttl": 60, "kernel": True}) != key
+
+
+def test_failures_not_stored(tmpdir, monkeypatch):
+    cache = CommandCache(str(tmpdir.join("cache")))
+    provider = _provider(cache, {"ttl": 60}, "/bin/false")
+    with pytest.raises(CalledProcessError):
+        provider.content
+
+    provider = _provider(cache, {"ttl": 60}, "/bin/false", keep_rc=True)
+    assert provider.content == []
+    assert provider.rc == 1
+    monkeypatch.setattr(CommandOutputProvider, "_execute", _fail)
+    with pytest.raises(AssertionError):
+        _provider(cache, {"ttl": 60}, "/bin/false", keep_rc=True).content
@@ -0,0 +1,136 @@
+import gc
+import os
+import threading
+from tempfile import mkdtemp
+
+import pytest
+
+from insights.core import dr, spec_factory
+from insights.core.command_pool import CommandPool
+from insights.core.context import HostContext
+from insights.core.plugins import datasource
+from insights.core.serde import Hydration
+from insights.core.spec_factory import CommandOutputProvider
+from insights.util import fs
+from insights.util.subproc import CalledProcessError
+
+
+def test_priority_order():
+    started = threading.Event()
+    release = threading.Event()
+    order = []
+
+    def blocker():
+        started.set()
+        release.wait()
+
+    with CommandPool(max_workers=1) as pool:
+        pool.submit(blocker)
+        started.wait()
+        futures = [pool.submit(lambda p=p: order.append(p), priority=p) for p in (0, 10, 5)]
+        release.set()
+        for f in futures:
+            f.result()
+    assert order == [10, 5, 0]
+
+
+def test_exception():
+    def boom():
+        raise ValueError("boom")
+
+    with CommandPool() as pool:
+        future = pool.submit(boom)
+        with pytest.raises(ValueError):
+            future.result()
+
+
+class EchoProvider(CommandOutputProvider):
+    def create_args(self):
+        return [["/bin/echo", "a\nb\nab"], ["grep", "-F", self.args or "a"]]
+
+
+def _provider(cmd, pool=None, **kwargs):
+    ctx = HostContext()
+    ctx.command_pool = pool
+    return EchoProvider(cmd, ctx, **kwargs)
+
+
+def test_provider():
+    tmp = mkdtemp()
+    try:
+        with CommandPool() as pool:
+            provider = _provider("/bin/echo", pool, keep_rc=True)
+            expected = _provider("/bin/echo", keep_rc=True)
+            assert provider.content == expected.content == ["a", "ab"]
+            assert provider.rc == expected.rc == 0
+            assert list(provider.stream()) == ["a", "ab"]
+            assert not provider.pending
+            assert provider.unload()
+            assert provider.content == ["a", "ab"]
+
+            provider.write(os.path.join(tmp, "pool"))
+            expected.write(os.path.join(tmp, "serial"))
+            with open(os.path.join(tmp, "pool")) as a, open(os.path.join(tmp, "serial")) as b:
+                assert a.read() == b.read()
+
+            provider = _provider("/bin/echo", pool, args="c")
+            with pytest.raises(CalledProcessError):
+                provider.content
+            dst = os.path.join(tmp, "missing")
+            with pytest.raises(CalledProcessError):
+                provider.write(dst)
+            assert not os.path.exists(dst)
+    finally:
+        fs.remove(tmp)
+
+
+@datasource()
+def slow_command(broker):
+    return broker["provider"]
+
+
+def test_deferred_persist():
+    tmp = mkdtemp()
+    release = threading.Event()
+    try:
+        with CommandPool() as pool:
+            provider = _provider("/bin/echo", pool)
+            provider._future = pool.submit(lambda e=provider._execute: release.wait() and e())
+
+            h = Hydration(tmp)
+            broker = dr.Broker()
+            broker[slow_command] = provider
+            persister = h.make_persister(set([slow_command]))
+            persister(slow_command, broker)
+            assert h.deferred == [(slow_command, broker)]
+            assert not os.path.exists(h.meta_data)
+
+            release.set()
+            h.flush()
+            assert h.deferred == []
+            assert os.listdir(h.meta_data)
+    finally:
+        fs.remove(tmp)
+
+
+def _open_fds():
+    return len(os.listdir("/proc/self/fd"))
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+def test_providers_hold_no_files(monkeypatch):
+    with CommandPool() as pool:
+        before = _open_fds()
+        providers = [_provider("/bin/echo", pool) for _ in range(50)]
+        for p in providers:
+            p._future.result()
+        assert _open_fds() <= before + pool.max_workers
+
+    monkeypatch.setattr(spec_factory, "OUTPUT_MEMORY_SIZE", 0)
+    rc, output = _provider("/bin/echo")._execute()
+    assert output.data is None
+    assert output.read() == b"a\nab\n"
+    path = output.path
+    del output
+    gc.collect()
+    assert not os.path.exists(path)
@@ -0,0 +1,98 @@
+from insights import dr
+from insights.core.context import HostContext
+
+
+class cstage(dr.ComponentType):
+    pass
+
+
+@cstage()
+def cone():
+    return 1
+
+
+@cstage()
+def ctwo():
+    return 2
+
+
+@cstage()
+def cboom():
+    raise Exception("boom")
+
+
+@cstage(cone, [ctwo, cboom], HostContext)
+def cadd(a, b, c, ctx):
+    return a + b
+
+
+@cstage(cboom)
+def cnever(b):
+    return b
+
+
+def test_ids_are_dense():
+    ids = [dr.COMPONENT_IDS[c] for c in (cone, ctwo, cboom, cadd)]
+    assert all(dr.COMPONENTS_BY_ID[i] is c for i, c in zip(ids, (cone, ctwo, cboom, cadd)))
+
+
+def test_mapping_api():
+    broker = dr.CompactBroker()
+    broker[cone] = 1
+    broker["not a component"] = "x"
+    assert cone in broker
+    assert ctwo not in broker
+    assert broker[cone] == 1
+    assert broker.get(ctwo, 5) == 5
+    assert set(broker.keys()) == set([cone, "not a component"])
+    assert dict(broker.items())[cone] == 1
+    assert broker.present == 1 << dr.COMPONENT_IDS[cone]
+
+    try:
+        broker[cone] = 2
+        assert False, "components can only be set once"
+    except KeyError:
+        pass
+
+    del broker[cone]
+    assert cone not in broker
+    assert broker.present == 0
+    assert len(broker.instances) == 1
+
+    assert broker.exceptions.get(cone) is None
+    assert cone not in broker.exceptions
+    broker.exceptions[cone].append("ex")
+    assert broker.exceptions[cone] == ["ex"]
+
+
+def test_run():
+    graph = dr.get_dependency_graph(cadd)
+    graph.update(dr.get_dependency_graph(cnever))
+
+    broker = dr.CompactBroker()
+    broker[HostContext] = HostContext()
+    broker = dr.run(graph, broker=broker)
+    expected = dr.Broker()
+    expected[HostContext] = broker[HostContext]
+    expected = dr.run(graph, broker=expected)
+
+    assert broker[cadd] == expected[cadd] == 3
+    assert set(broker.instances) == set(expected.instances)
+    assert set(broker.exceptions) == set(expected.exceptions) == set([cboom])
+    assert broker.missing_requirements[cnever] == expected.missing_requirements[cnever]
+    assert set(broker.exec_times) == set(expected.exec_times)
+
+    seeded = dr.CompactBroker(broker)
+    assert seeded[cadd] == 3
+    assert isinstance(dr.Broker(broker).instances, dict)
+
+
+def test_missing_dependencies():
+    delegate = dr.get_delegate(cadd)
+    broker = dr.CompactBroker()
+    broker[cone] = 1
+    assert delegate.get_missing_dependencies(broker) == ([HostContext], [[ctwo, cboom]])
+
+    broker[HostContext] = HostContext()
+    broker[ctwo] = 2
+    assert delegate.get_missing_dependencies(broker) is None
@@ -0,0 +1,65 @@
+import glob
+import os
+import pickle
+
+import pytest
+
+from insights.core.context import HostContext
+from insights.core.plugins import ContentException
+from insights.core.spec_factory import glob_file
+from insights.core import dr
+from insights.util import dirglob
+
+PATTERNS = [
+    "*", "*/*", "*/*.conf", "a/*", "a/.*", "a/*/", "*/b*/*", "a/b?/c.conf",
+    "a/[bc]*", "a/missing/*", "missing", "a/b1/c.conf", "a/", "link/*", "*/*/*.conf",
+    "a/**/*.conf",
+]
+
+
+@pytest.fixture
+def tree(tmpdir):
+    for path in ["a/b1/c.conf", "a/b2/d.conf", "a/.hidden", "a/e.conf", "f/g.txt", "f/h.conf"]:
+        tmpdir.join(path).ensure()
+    tmpdir.join("link").mksymlinkto(tmpdir.join("a"))
+    tmpdir.join("a", "broken").mksymlinkto(tmpdir.join("nothing"))
+    return str(tmpdir)
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_same_as_glob(tree, pattern):
+    pattern = os.path.join(tree, pattern)
+    cache = dirglob.DirCache()
+    expected = sorted(glob.glob(pattern))
+    assert sorted(dirglob.glob(pattern, cache)) == expected
+    assert sorted(dirglob.glob(pattern, cache)) == expected
+    for path, is_dir in dirglob.iglob(pattern, cache):
+        assert is_dir is None or is_dir == os.path.isdir(path)
+
+
+def test_cache(tree, monkeypatch):
+    cache = dirglob.DirCache()
+    dirglob.glob(os.path.join(tree, "a/*"), cache)
+
+    def fail(path):
+        raise AssertionError("%s listed again" % path)
+
+    monkeypatch.setattr(dirglob, "_scan", fail)
+    assert len(dirglob.glob(os.path.join(tree, "a/*.conf"), cache)) == 1
+    assert pickle.loads(pickle.dumps(cache))._entries == {}
+
+
+def test_glob_file_cutoff(tree, monkeypatch):
+    created = []
+    ds = glob_file(os.path.join(tree, "*/*"), max_files=2)
+    monkeypatch.setattr(ds, "kind", lambda *args, **kwargs: created.append(args) or args)
+
+    broker = dr.Broker()
+    broker[HostContext] = HostContext(root="/")
+    with pytest.raises(ContentException) as ex:
+        ds(broker)
+    assert "[at least 3] is over the 2 file limit" in str(ex.value)
+    assert len(created) == 3
+
+    ds.max_files = 10
+    assert ds(broker) == sorted(ds(broker), key=lambda args: args[0])
@@ -2,6 +2,9 @@ import os
 import sys
 from insights import run, make_fail, make_pass
 from insights.core import dr
+from insights.core.context import HostArchiveContext
+from insights.core.plugins import component
+from insights.core.spec_factory import RegistryPoint, SpecSet, simple_file
 from insights.plugins import always_fires, never_fires
 from insights.specs import Specs
 from mock import patch
@@ -166,3 +169,327 @@ def test_bare_files(tmpdir):
         with open(os.path.join(tmpdir.strpath, 'bare', 'sample.log'), 'rb') as fh:
             data_b = fh.read()
         assert broker[report_raw] == make_fail('RA_SPEC', data=data_b)
+
+
+class pstage(dr.ComponentType):
+    pass
+
+
+@pstage()
+def pleaf1():
+    return 1
+
+
+@pstage()
+def pleaf2():
+    return 2
+
+
+@pstage()
+def pboom():
+    raise Exception("boom")
+
+
+@pstage(pleaf1, pleaf2)
+def padd(a, b):
+    return a + b
+
+
+@pstage(pboom)
+def pafter_boom(b):
+    return b
+
+
+@pstage(padd, optional=[pafter_boom])
+def ptop(a, b):
+    return a * 10
+
+
+def test_run_with_pool():
+    from concurrent.futures import ThreadPoolExecutor
+
+    fired = []
+    broker = dr.Broker()
+    broker.add_observer(lambda c, b: fired.append(c), pstage)
+
+    graph = dr.get_dependency_graph(ptop)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        broker = dr.run(graph, broker=broker, pool=pool)
+
+    assert broker[padd] == 3
+    assert broker[ptop] == 30
+    assert pboom in broker.exceptions
+    assert pafter_boom in broker.missing_requirements
+    assert pafter_boom not in broker
+    assert sorted(fired, key=dr.get_name) == sorted(graph, key=dr.get_name)
+    assert set(broker.exec_times) == set(graph)
+    assert fired.index(padd) > max(fired.index(pleaf1), fired.index(pleaf2))
+
+
+def test_compile_plan():
+    plan = dr.compile_plan(ptop)
+    assert plan is dr.compile_plan(ptop)
+    assert dr.compile_plan(plan) is plan
+    assert set(plan) == set(dr.get_dependency_graph(ptop))
+    assert plan.order.index(padd) > plan.order.index(pleaf1)
+
+    i = plan.ids[padd]
+    assert plan.dependencies[i] == (1 << plan.ids[pleaf1]) | (1 << plan.ids[pleaf2])
+    assert i in plan.dependents[plan.ids[pleaf1]]
+    assert plan.delegates[i] is dr.get_delegate(padd)
+
+    try:
+        plan.order = ()
+        assert False, "plans should be immutable"
+    except AttributeError:
+        pass
+
+    first = dr.run(plan)
+    second = dr.run(plan, broker=dr.Broker())
+    assert first[ptop] == second[ptop] == 30
+    assert pafter_boom in second.missing_requirements
+
+
+def test_compile_plan_incremental():
+    broker = dr.Broker()
+    broker["dep1"] = 1
+    broker["dep2"] = 2
+    broker["common"] = 3
+
+    graph = dr.get_dependency_graph(stage1)
+    graph.update(dr.get_dependency_graph(stage2))
+    graph.update(dr.get_dependency_graph(stage3))
+    graph.update(dr.get_dependency_graph(stage4))
+
+    plan = dr.compile_plan(graph)
+    brokers = list(dr.run_incremental(plan, broker))
+    assert len(brokers) == 3
+    assert plan.get_subplans() is plan.get_subplans()
+
+
+class dstage(dr.ComponentType):
+    pass
+
+
+CALLED = []
+
+
+def _called(name, value=None):
+    CALLED.append(name)
+    return value if value is not None else name
+
+
+@dstage()
+def dfails():
+    CALLED.append("dfails")
+    raise Exception("nope")
+
+
+@dstage()
+def dexpensive_leaf():
+    return _called("dexpensive_leaf")
+
+
+@dstage(dexpensive_leaf)
+def dexpensive(leaf):
+    return _called("dexpensive")
+
+
+@dstage(dfails)
+def dneeds_fails(f):
+    return _called("dneeds_fails")
+
+
+@dstage(dneeds_fails, dexpensive)
+def dtarget(a, b):
+    return _called("dtarget")
+
+
+@dstage()
+def dunrelated():
+    return _called("dunrelated")
+
+
+@dstage(dunrelated)
+def dother_rule(u):
+    return _called("dother_rule")
+
+
+def test_run_demand():
+    graph = dr.get_dependency_graph(dtarget)
+    graph.update(dr.get_dependency_graph(dother_rule))
+
+    del CALLED[:]
+    broker = dr.run(graph, targets=[dtarget])
+    assert "dfails" in CALLED
+    # the expensive branch may run before dfails fails but never after.
+    assert CALLED[CALLED.index("dfails") + 1:] == []
+    assert "dunrelated" not in CALLED
+    assert dneeds_fails not in broker.exec_times
+    assert dtarget in broker.missing_requirements
+    assert dunrelated not in broker.exec_times
+
+    dr.set_enabled(dfails, False)
+    try:
+        del CALLED[:]
+        broker = dr.run(graph, targets=[dtarget])
+        assert CALLED == []
+        assert dtarget in broker.missing_requirements
+    finally:
+        dr.set_enabled(dfails, True)
+
+    del CALLED[:]
+    broker = dr.run(graph)
+    assert "dexpensive" in CALLED
+    assert "dunrelated" in CALLED
+
+
+def test_run_demand_disabled_and_auto_targets():
+    graph = dr.get_dependency_graph(dother_rule)
+    graph.update(dr.get_dependency_graph(dexpensive))
+    assert dr.get_demand(graph, dr.Broker()) == set([dunrelated, dother_rule, dexpensive_leaf, dexpensive])
+
+    dr.set_enabled(dother_rule, False)
+    try:
+        del CALLED[:]
+        broker = dr.run(graph, targets=True)
+        assert "dunrelated" not in CALLED
+        assert broker[dexpensive] == "dexpensive"
+    finally:
+        dr.set_enabled(dother_rule, True)
+
+
+def test_run_demand_ignores_type_observers():
+    graph = dr.get_dependency_graph(dother_rule)
+    graph.update(dr.get_dependency_graph(dexpensive))
+    broker = dr.Broker()
+    fired = []
+    broker.add_observer(lambda c, b: fired.append(c), dstage)
+    assert dr.get_demand(graph, broker, targets=[dexpensive]) == set([dexpensive_leaf, dexpensive])
+
+    del CALLED[:]
+    broker = dr.run(graph, broker=broker, targets=[dexpensive])
+    assert "dunrelated" not in CALLED
+    assert fired == [dexpensive_leaf, dexpensive]
+
+
+def test_run_demand_with_pool():
+    from concurrent.futures import ThreadPoolExecutor
+
+    graph = dr.get_dependency_graph(dtarget)
+    del CALLED[:]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        broker = dr.run(graph, pool=pool, targets=[dtarget])
+    assert dtarget in broker.missing_requirements
+    assert "dneeds_fails" not in CALLED
+
+
+class IncSpecs(SpecSet):
+    first = RegistryPoint()
+    second = RegistryPoint()
+
+
+class DefaultIncSpecs(IncSpecs):
+    first = simple_file("first", context=HostArchiveContext)
+    second = simple_file("second", context=HostArchiveContext)
+
+
+@component(IncSpecs.first)
+def ifirst(f):
+    return _called("ifirst", f.content)
+
+
+@component(IncSpecs.second)
+def isecond(s):
+    return _called("isecond", s.content)
+
+
+@component(ifirst, isecond)
+def iboth(f, s):
+    return _called("iboth", f + s)
+
+
+def _inc_broker(root):
+    broker = dr.Broker()
+    broker[HostArchiveContext] = HostArchiveContext(str(root))
+    return broker
+
+
+def test_run_reuses_previous(tmpdir):
+    tmpdir.join("first").write("one\n")
+    tmpdir.join("second").write("two\n")
+    graph = dr.get_dependency_graph(iboth)
+
+    plain = dr.run(graph, broker=_inc_broker(tmpdir))
+    assert plain[IncSpecs.first].fingerprint is None
+
+    del CALLED[:]
+    first = dr.run(graph, broker=_inc_broker(tmpdir), fingerprints=True)
+    assert first[iboth] == ["one", "two"]
+    assert sorted(CALLED) == ["iboth", "ifirst", "isecond"]
+
+    del CALLED[:]
+    second = dr.run(graph, broker=_inc_broker(tmpdir), previous=first)
+    assert CALLED == []
+    assert second[iboth] is first[iboth]
+
+    tmpdir.join("second").write("three\n")
+    del CALLED[:]
+    third = dr.run(graph, broker=_inc_broker(tmpdir), previous=second)
+    assert sorted(CALLED) == ["iboth", "isecond"]
+    assert third[iboth] == ["one", "three"]
+    assert third[ifirst] is first[ifirst]
+
+    del CALLED[:]
+    dr.run(graph, broker=_inc_broker(tmpdir), previous=third, changed=[IncSpecs.first])
+    assert sorted(CALLED) == ["iboth", "ifirst"]
+
+
+def test_run_reuse_with_pool(tmpdir):
+    from concurrent.futures import ThreadPoolExecutor
+
+    tmpdir.join("first").write("one\n")
+    graph = dr.get_dependency_graph(iboth)
+    first = dr.run(graph, broker=_inc_broker(tmpdir), fingerprints=True)
+    assert iboth not in first
+
+    # a datasource that didn't exist before shows up
+    tmpdir.join("second").write("two\n")
+    del CALLED[:]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        second = dr.run(graph, broker=_inc_broker(tmpdir), pool=pool, previous=first)
+    assert sorted(CALLED) == ["iboth", "isecond"]
+    assert second[iboth] == ["one", "two"]
+
+
+def test_run_release(tmpdir):
+    tmpdir.join("first").write("one\n")
+    tmpdir.join("second").write("two\n")
+    graph = dr.get_dependency_graph(iboth)
+
+    broker = dr.run(graph, broker=_inc_broker(tmpdir), release=True)
+    assert broker[iboth] == ["one", "two"]
+    assert HostArchiveContext in broker
+    assert ifirst not in broker and isecond not in broker
+    provider = broker[IncSpecs.first]
+    assert provider is broker[DefaultIncSpecs.first]
+    assert provider._content is None
+    assert provider.content == ["one"]
+
+    def observer(c, b):
+        pass
+
+    observer.pins = set([ifirst])
+    broker = _inc_broker(tmpdir)
+    broker.add_observer(observer)
+    broker = dr.run(graph, broker=broker, release=True)
+    assert broker[ifirst] == ["one"]
+    assert isecond not in broker
+
+    broker = dr.run(graph, broker=_inc_broker(tmpdir), targets=[iboth, isecond], release=True)
+    assert broker[isecond] == ["two"]
+    assert ifirst not in broker
+
+    broker = dr.run(graph, broker=_inc_broker(tmpdir))
+    assert broker[ifirst] == ["one"]
+    assert broker[IncSpecs.first]._content == ["one"]
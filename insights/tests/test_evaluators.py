@@ -257,3 +257,17 @@ def test_insights_evaluator_show_links():
 
     rule_response = result["reports"][0]
     assert "kcs" in rule_response["links"]
+
+
+def test_insights_evaluator_process_plan():
+    plan = dr.compile_plan(components)
+    for incremental in (False, True):
+        broker = dr.Broker()
+        broker[Specs.hostname] = context_wrap("www.example.com")
+        broker[Specs.machine_id] = context_wrap("12345")
+        broker[Specs.redhat_release] = context_wrap("Red Hat Enterprise Linux Server release 7.4 (Maipo)")
+        e = InsightsEvaluator(broker, incremental=incremental)
+        e.process(plan)
+        result = e.get_response()
+        assert result["system"]["hostname"] == "www.example.com"
+        assert len(result["reports"]) == 2
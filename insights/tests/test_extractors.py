@@ -5,8 +5,15 @@ import tempfile
 import zipfile
 from contextlib import closing
 
-from insights.core.hydration import get_all_files
+import pytest
+
+from insights.core.context import HostArchiveContext, SerializedArchiveContext
+import insights
+from insights.core import archives
+from insights.core.hydration import get_all_files, get_archive_context, get_include_patterns
 from insights.core.archives import extract
+from insights.core.plugins import datasource
+from insights.core.spec_factory import RegistryPoint, SpecSet, glob_file, simple_file
 
 
 def test_with_zip():
@@ -44,3 +51,78 @@ def test_with_zip():
         os.unlink("/tmp/test.zip")
 
     subprocess.call(shlex.split("rm -rf %s" % tmp_dir))
+
+
+HOST_FILES = ["insights_commands/hostname_-f", "insights_commands/uptime", "etc/hosts",
+              "etc/sysconfig/network", "var/log/messages"]
+
+
+class Specs(SpecSet):
+    hostname = RegistryPoint()
+    network = RegistryPoint()
+
+
+class ArchiveSpecs(Specs):
+    hostname = simple_file("insights_commands/hostname_-f", context=HostArchiveContext)
+    network = glob_file("sysconfig/net*", context=HostArchiveContext)
+
+
+def _host_archive(tmpdir, name):
+    host = tmpdir.mkdir("src").mkdir("host")
+    for f in HOST_FILES:
+        host.join(f).write(f + "\n", ensure=True)
+    os.symlink("etc/sysconfig", str(host.join("sysconfig")))
+    path = str(tmpdir.join(name))
+    if name.endswith(".zip"):
+        subprocess.check_call(["zip", "-q", "-r", "-y", path, "host"], cwd=str(tmpdir.join("src")))
+    else:
+        subprocess.check_call(["tar", "czf", path, "-C", str(tmpdir.join("src")), "host"])
+    return path
+
+
+def _extracted(ex):
+    return sorted(os.path.relpath(f, ex.tmp_dir) for f in get_all_files(ex.tmp_dir))
+
+
+@pytest.mark.parametrize("name", ["host.tar.gz", "host.zip"])
+def test_include(tmpdir, name):
+    path = _host_archive(tmpdir, name)
+    with extract(path, include=["host/etc/*", "host/missing"]) as ex:
+        assert _extracted(ex) == ["host/etc/hosts", "host/etc/sysconfig/network"]
+
+    include = get_include_patterns(path, [ArchiveSpecs.hostname, ArchiveSpecs.network])
+    assert include == ["host/etc/sysconfig/network", "host/insights_commands/hostname_-f", "host/sysconfig"]
+    with extract(path, include=include) as ex:
+        assert _extracted(ex) == ["host/etc/sysconfig/network", "host/insights_commands/hostname_-f"]
+        assert os.path.islink(os.path.join(ex.tmp_dir, "host", "sysconfig"))
+
+    include = get_include_patterns(path, [ArchiveSpecs.network])
+    assert "host/insights_commands/hostname_-f" in include
+
+
+def test_include_everything(tmpdir):
+    path = _host_archive(tmpdir, "host.tar.gz")
+
+    @datasource(HostArchiveContext)
+    def reads_anything(broker):
+        return broker[HostArchiveContext].root
+
+    assert get_include_patterns(path, [ArchiveSpecs.network, reads_anything]) is None
+    assert get_include_patterns(path, [ArchiveSpecs.network], context=SerializedArchiveContext) is None
+    assert get_include_patterns(str(tmpdir.join("src", "host", "etc", "hosts")), [ArchiveSpecs.network]) is None
+
+
+def test_cluster_archive_not_listed(tmpdir, monkeypatch):
+    host = _host_archive(tmpdir, "host.tar.gz")
+    cluster = tmpdir.mkdir("cluster")
+    os.rename(host, str(cluster.join("host.tar.gz")))
+    path = str(tmpdir.join("cluster.tar"))
+    subprocess.check_call(["tar", "cf", path, "-C", str(cluster), "host.tar.gz"])
+    assert get_archive_context(path) == (None, True)
+
+    def list_members(*args, **kwargs):
+        raise AssertionError("listed %s" % path)
+
+    monkeypatch.setattr(archives, "list_members", list_members)
+    monkeypatch.setattr(insights, "process_dir", lambda broker, root, *args, **kwargs: sorted(os.listdir(root)))
+    assert insights._run(insights.dr.Broker(), {}, root=path) == ["host.tar.gz"]
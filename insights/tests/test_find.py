@@ -2,6 +2,7 @@ import operator
 
 from functools import reduce
 from insights import datasource, dr, rule, make_info
+from insights.core.plugins import ContentException
 from insights.core.spec_factory import DatasourceProvider, find, RegistryPoint, SpecSet
 
 
@@ -36,3 +37,91 @@ def test_find():
     results = broker[report]
     assert "num_all_foos" in results
     assert "num_direct_foos" in results
+
+
+class Logs(SpecSet):
+    log = RegistryPoint(filterable=True)
+
+
+class CountingProvider(DatasourceProvider):
+    streams = 0
+
+    def stream(self):
+        CountingProvider.streams += 1
+        return super(CountingProvider, self).stream()
+
+
+class MyLogs(Logs):
+
+    @datasource()
+    def log(broker):
+        return CountingProvider("a 1\nb 2\na 3\nc 4\na b 5", "log")
+
+
+errors = find(Logs.log, "a")
+warnings = find(Logs.log, ["b", "c"])
+first_errors = find(Logs.log, "a", max_matches=2)
+nothing = find(Logs.log, "z")
+
+
+def test_find_shared_scan():
+    CountingProvider.streams = 0
+    broker = dr.run([errors, warnings, first_errors])
+    assert broker[errors] == {"/log": ["a 1", "a 3", "a b 5"]}
+    assert broker[warnings] == {"/log": ["b 2", "c 4", "a b 5"]}
+    assert broker[first_errors] == {"/log": ["a 1", "a 3"]}
+    assert CountingProvider.streams == 1
+
+
+def test_find_scans_only_evaluated_finds(monkeypatch):
+    scanned = []
+    finder = type(errors)
+    orig = finder._scan
+
+    def _scan(d, finders):
+        scanned.append(set(finders))
+        return orig(d, finders)
+
+    monkeypatch.setattr(finder, "_scan", staticmethod(_scan))
+    dr.set_enabled(first_errors, False)
+    try:
+        broker = dr.run([errors, warnings, first_errors])
+    finally:
+        dr.set_enabled(first_errors, True)
+    assert scanned == [set([errors, warnings])]
+    assert first_errors not in broker
+    assert broker[MyLogs.log] not in finder._scans
+
+    del scanned[:]
+    broker = dr.run([errors])
+    assert scanned == [set([errors])]
+    assert broker[MyLogs.log] not in finder._scans
+
+
+class Broken(SpecSet):
+    log = RegistryPoint(filterable=True)
+
+
+class BrokenProvider(DatasourceProvider):
+    def stream(self):
+        raise ContentException("Can't read log")
+
+
+class MyBroken(Broken):
+
+    @datasource()
+    def log(broker):
+        return BrokenProvider("a", "log")
+
+
+broken_errors = find(Broken.log, "a")
+
+
+def test_find_records_errors():
+    broker = dr.run([nothing])
+    assert nothing not in broker
+    assert nothing not in broker.exceptions
+
+    broker = dr.run([broken_errors])
+    assert broken_errors not in broker
+    assert [type(ex) for ex in broker.exceptions[broken_errors]] == [ContentException]
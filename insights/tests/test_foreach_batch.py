@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from insights.core import dr
+from insights.core.command_pool import CommandPool
+from insights.core.context import HostContext
+from insights.core.plugins import datasource
+from insights.core.serde import Hydration
+from insights.core.spec_factory import (CommandOutputProvider, foreach_execute,
+                                        one_line_per_argument)
+
+here = os.path.abspath(os.path.dirname(__file__))
+FILES = [os.path.join(here, f) for f in ("__init__.py", "test_specs.py", "test_serde.py")]
+
+
+@datasource(HostContext)
+def files(broker):
+    return broker["files"]
+
+
+md5 = foreach_execute(files, "/usr/bin/md5sum %s", keep_rc=True)
+md5_batch = foreach_execute(files, "/usr/bin/md5sum %s", keep_rc=True, batch=one_line_per_argument)
+
+
+def _run(paths, pool=None):
+    ctx = HostContext()
+    ctx.command_pool = pool
+    broker = dr.Broker()
+    broker[HostContext] = ctx
+    broker["files"] = paths
+    return dr.run([md5, md5_batch], broker=broker)
+
+
+def _outputs(broker, comp):
+    return [(p.cmd, p.relative_path, p.content, p.rc) for p in broker[comp]]
+
+
+def test_batch(monkeypatch):
+    def fail(self):
+        raise AssertionError("%s ran by itself" % self.cmd)
+
+    broker = _run(FILES)
+    expected = _outputs(broker, md5)
+    monkeypatch.setattr(CommandOutputProvider, "_execute", fail)
+    broker = _run(FILES)
+    assert _outputs(broker, md5_batch) == expected
+
+    with CommandPool() as pool:
+        broker = _run(FILES, pool)
+        assert _outputs(broker, md5_batch) == expected
+        assert all(p._future.result()[1].path is None for p in broker[md5_batch])
+
+
+def test_fallback(tmpdir):
+    paths = FILES + [str(tmpdir.join("missing"))]
+    broker = _run(paths)
+    expected = _outputs(broker, md5)
+    assert expected[-1][-1] == 1
+    assert _outputs(broker, md5_batch) == expected
+
+
+@pytest.mark.parametrize("comp", [md5, md5_batch])
+def test_serialized_layout(tmpdir, comp):
+    broker = _run(FILES)
+    h = Hydration(str(tmpdir))
+    h.dehydrate(comp, broker)
+    for cmd, rel, content, rc in _outputs(broker, comp):
+        with open(os.path.join(h.data, rel)) as f:
+            assert f.read().splitlines() == content
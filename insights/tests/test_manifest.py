@@ -0,0 +1,71 @@
+import json
+import os
+import sys
+
+from insights import dr
+from insights.core.spec_factory import RegistryPoint, SpecSet, simple_file
+
+
+class mstage(dr.ComponentType):
+    pass
+
+
+class MSpecs(SpecSet):
+    thing = RegistryPoint()
+
+
+@mstage(MSpecs.thing)
+def mparse(thing):
+    return thing
+
+
+@mstage(mparse)
+def mreport(p):
+    return p
+
+
+def test_generate_manifest():
+    manifest = dr.generate_manifest([mparse, mreport, MSpecs.thing])["components"]
+    entry = manifest[dr.get_name(mreport)]
+    assert entry["module"] == __name__
+    assert entry["group"] == "single"
+    assert entry["type"] == dr.get_name(mstage)
+    assert entry["dependencies"] == [dr.get_name(mparse)]
+    assert manifest[dr.get_name(MSpecs.thing)]["dependencies"] == []
+
+
+def test_load_from_manifest(tmpdir):
+    manifest = dr.generate_manifest([mparse, mreport, MSpecs.thing])
+    # pretend an implementation of the registry point lives in a module that
+    # nothing has imported yet.
+    impl = "colorsys.DefaultMSpecs.thing"
+    manifest["components"][dr.get_name(MSpecs.thing)]["dependencies"].append(impl)
+    manifest["components"][impl] = {"type": None, "module": "colorsys", "group": "single", "dependencies": []}
+    manifest["nvr"] = "test"
+
+    path = os.path.join(str(tmpdir), "manifest.json")
+    with open(path, "w") as f:
+        json.dump(manifest, f)
+
+    old = dict(dr.MANIFEST)
+    try:
+        assert dr.load_manifest(path)["nvr"] == "test"
+        assert dr.get_manifest_modules([mreport]) == set([__name__, "colorsys"])
+        assert dr.get_manifest_modules([dr.get_name(mparse)]) == set([__name__, "colorsys"])
+
+        sys.modules.pop("colorsys", None)
+        assert dr.load_from_manifest(mreport) == 1
+        assert "colorsys" in sys.modules
+        assert dr.load_from_manifest(mreport) == 0
+    finally:
+        dr.MANIFEST.clear()
+        dr.MANIFEST.update(old)
+
+
+def test_manifest_falls_back_to_live_dependencies():
+    class DefaultMSpecs(MSpecs):
+        thing = simple_file("/etc/thing")
+
+    assert dr.MANIFEST.get(dr.get_name(mreport)) is None
+    assert dr.get_manifest_modules([mreport]) == set()
+    assert DefaultMSpecs.thing in dr.get_dependency_graph(mreport)
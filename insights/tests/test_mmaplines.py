@@ -0,0 +1,128 @@
+import io
+import pickle
+
+import pytest
+
+from insights.core import LogFileOutput
+from insights.core.context import HostArchiveContext, HostContext
+from insights.core.spec_factory import TextFileProvider
+from insights.tests import context_wrap
+from insights.util import mmaplines
+from insights.util.mmaplines import MappedLines, map_file
+
+CONTENT = [
+    b"",
+    b"\n",
+    b"one",
+    b"one\n",
+    b"one\ntwo\n\nthree",
+    b"one\ntwo\n\nthree\n\n",
+    b"caf\xc3\xa9\n\xff\xfe bad bytes\nlast\n",
+]
+
+SLICES = [
+    slice(None), slice(1, None), slice(None, -1), slice(None, None, -1),
+    slice(1, 3), slice(None, None, 2), slice(-2, None, -1), slice(5, 1, -2),
+]
+
+
+def _mapped(tmpdir, data):
+    path = tmpdir.join("data")
+    path.write_binary(data)
+    with io.open(str(path), encoding="utf-8", errors=mmaplines._ERRORS) as f:
+        expected = [l.rstrip("\n") for l in f]
+    return map_file(str(path)), expected
+
+
+@pytest.mark.parametrize("data", CONTENT)
+def test_same_as_list(tmpdir, data):
+    lines, expected = _mapped(tmpdir, data)
+    assert list(lines) == expected
+    assert len(lines) == len(expected)
+    assert bool(lines) == bool(expected)
+    assert lines == expected
+    assert list(reversed(lines)) == expected[::-1]
+    for i in range(-len(expected), len(expected)):
+        assert lines[i] == expected[i]
+    for s in SLICES:
+        assert list(lines[s]) == expected[s]
+        assert len(lines[s]) == len(expected[s])
+        assert list(lines[s][::-1]) == expected[s][::-1]
+        assert list(lines[s][1:]) == expected[s][1:]
+    with pytest.raises(IndexError):
+        lines[len(expected)]
+
+
+def test_find(tmpdir):
+    lines, expected = _mapped(tmpdir, b"one two\ntwo\nthree\ntwo two two")
+    assert list(lines.find("two")) == ["one two", "two", "two two two"]
+    assert list(lines[1:].find("two")) == ["two", "two two two"]
+    assert list(lines.find("four")) == []
+    assert list(lines.find("two\nthree")) == []
+    assert "two" in lines
+    assert "tw" not in lines
+    assert lines.index("three") == 2
+    assert lines.count("two") == 1
+
+
+def test_pickle(tmpdir):
+    lines, expected = _mapped(tmpdir, b"one\ntwo\nthree\n")
+    assert pickle.loads(pickle.dumps(lines)) == expected
+    assert pickle.loads(pickle.dumps(lines[::-1])) == expected[::-1]
+
+
+def test_newlines(tmpdir):
+    path = tmpdir.join("data")
+    path.write_binary(b"one\r\ntwo\n")
+    assert map_file(str(path)) is None
+
+
+class FakeLog(LogFileOutput):
+    pass
+
+
+FakeLog.token_scan("has_error", "error")
+FakeLog.keep_scan("last_error", "error", num=1, reverse=True)
+
+
+def test_provider(tmpdir):
+    path = tmpdir.join("messages")
+    path.write_binary(b"info: one\nerror: two\ninfo: three\nerror: four\n")
+    mmaplines.THRESHOLD = 0
+    try:
+        provider = TextFileProvider(str(path), ctx=HostContext())
+        assert isinstance(provider.content, MappedLines)
+        assert list(provider.stream()) == provider.content
+
+        log = FakeLog(context_wrap(provider.content, path=str(path)))
+        assert log.has_error
+        assert log.last_error == [{"raw_message": "error: four"}]
+        assert "info: three" in log
+
+        provider = TextFileProvider(str(path), ctx=HostContext())
+        provider.create_args = lambda: [["grep", "-F", "error", str(path)]]
+        assert isinstance(provider.content, MappedLines)
+        assert provider.content == ["error: two", "error: four"]
+        assert provider.rc == 0
+    finally:
+        mmaplines.THRESHOLD = None
+
+    provider = TextFileProvider(str(path), ctx=HostContext())
+    assert isinstance(provider.content, list)
+
+
+def test_provider_live_file_is_copied(tmpdir):
+    path = tmpdir.join("messages")
+    path.write_binary(b"info: one\nerror: two\n")
+    mmaplines.THRESHOLD = 0
+    try:
+        live = TextFileProvider(str(path), ctx=HostContext()).content
+        archived = TextFileProvider("messages", root=str(tmpdir), ctx=HostArchiveContext(root=str(tmpdir))).content
+    finally:
+        mmaplines.THRESHOLD = None
+    assert live.path is None
+    assert archived.path == str(path)
+
+    # truncating the original must not affect the copy
+    path.write_binary(b"")
+    assert live == ["info: one", "error: two"]
@@ -0,0 +1,46 @@
+import pytest
+
+from insights.util.packfile import PackReader, PackWriter
+
+
+def test_round_trip(tmpdir):
+    path = str(tmpdir.join("test.pack"))
+    with PackWriter(path) as w:
+        w.add("a", b"one" * 100)
+        w.add("b", b"")
+        w.add("a", b"three")
+
+    with PackReader(path) as r:
+        assert sorted(r.names()) == ["a", "b"]
+        assert "a" in r and "c" not in r
+        assert r.read("b") == b""
+        assert r.read("a") == b"three"
+        with pytest.raises(KeyError):
+            r.read("c")
+
+
+def test_unfinished(tmpdir):
+    path = str(tmpdir.join("test.pack"))
+    w = PackWriter(path)
+    w.add("a", b"one")
+    w.add("b", b"two")
+    w._f.flush()
+    with open(path, "rb") as f:
+        data = f.read()
+
+    with PackReader(path) as r:
+        assert r.read("a") == b"one"
+        assert len(r) == 2
+
+    with open(path, "wb") as f:
+        f.write(data[:-2])
+    with PackReader(path) as r:
+        assert r.names() == ["a"]
+    w.close()
+
+
+def test_not_a_pack(tmpdir):
+    path = tmpdir.join("test.pack")
+    path.write("nope")
+    with pytest.raises(ValueError):
+        PackReader(str(path))
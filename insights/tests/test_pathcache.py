@@ -0,0 +1,61 @@
+import os
+import pickle
+
+from insights.core.context import ExecutionContext, HostArchiveContext
+from insights.core.spec_factory import ContentException, TextFileProvider
+from insights.util.pathcache import PathCache
+
+import pytest
+
+
+def _tree(tmpdir):
+    root = tmpdir.mkdir("root")
+    root.mkdir("etc").join("hosts").write("localhost\n")
+    os.symlink("hosts", str(root.join("etc", "link")))
+    os.symlink(str(tmpdir.join("secret")), str(root.join("etc", "outside")))
+    tmpdir.join("secret").write("secret\n")
+    link = tmpdir.join("link")
+    os.symlink(str(root), str(link))
+    return str(link), [os.path.join(str(link), "etc", "hosts")]
+
+
+def test_known_files_need_no_calls(tmpdir, monkeypatch):
+    root, files = _tree(tmpdir)
+    cache = PathCache(root, files)
+    real_root = os.path.realpath(root)
+
+    def fail(path):
+        raise AssertionError(path)
+
+    cache.realpath(root)
+    monkeypatch.setattr(os.path, "exists", fail)
+    monkeypatch.setattr(os.path, "realpath", fail)
+    assert cache.exists(files[0])
+    assert cache.realpath(files[0]) == os.path.join(real_root, "etc", "hosts")
+
+
+def test_matches_os(tmpdir):
+    root, files = _tree(tmpdir)
+    cache = PathCache(root, files)
+    for name in ("hosts", "link", "outside", "missing"):
+        path = os.path.join(root, "etc", name)
+        assert cache.exists(path) == os.path.exists(path)
+        assert cache.realpath(path) == os.path.realpath(path)
+        assert cache.access(path) == os.access(path, os.R_OK)
+
+    clone = pickle.loads(pickle.dumps(cache))
+    assert clone._realpath == {}
+    assert clone.exists(files[0])
+
+
+def test_validate(tmpdir):
+    root, files = _tree(tmpdir)
+    ctx = HostArchiveContext(root=root, all_files=files)
+    assert isinstance(ctx.path_cache, PathCache)
+    assert TextFileProvider("/etc/hosts", root, ctx=ctx).content == ["localhost"]
+    assert TextFileProvider("/etc/link", root, ctx=ctx).content == ["localhost"]
+    with pytest.raises(ContentException):
+        TextFileProvider("/etc/missing", root, ctx=ctx)
+    with pytest.raises(Exception):
+        TextFileProvider("/etc/outside", root, ctx=ctx)
+    assert ExecutionContext().path_cache.exists("/")
@@ -0,0 +1,93 @@
+import json
+
+from six import StringIO
+
+from insights.core import dr, Parser
+from insights.core.plugins import datasource, parser
+from insights.core.profiler import Profiler, get_output_size
+from insights.core.spec_factory import DatasourceProvider
+
+
+class pstage(dr.ComponentType):
+    pass
+
+
+@datasource()
+def pdata(broker):
+    return DatasourceProvider("first line\nsecond line", "/pdata")
+
+
+@parser(pdata)
+class PParser(Parser):
+    def parse_content(self, content):
+        self.lines = list(content)
+
+
+@pstage(PParser)
+def pcount(p):
+    return len(p.lines)
+
+
+@pstage(pcount)
+def pfails(c):
+    raise Exception("boom")
+
+
+def _run(profiler):
+    graph = dr.get_dependency_graph(pfails)
+    return dr.run(graph, profiler=profiler)
+
+
+def test_records():
+    profiler = Profiler(memory=True, labels={"context": "test"})
+    try:
+        broker = _run(profiler)
+    finally:
+        profiler.close()
+    assert broker.profiler is profiler
+
+    records = dict((r["name"], r) for r in profiler.records)
+    p = records[dr.get_name(PParser)]
+    assert p["type"] == dr.get_name(parser)
+    assert p["outcome"] == "value"
+    assert p["input_lines"] == 2
+    assert p["input_bytes"] == len("first line\nsecond line\n")
+    assert p["output_bytes"] > 0
+    assert p["memory"] is not None
+    assert p["wall"] >= 0 and p["cpu"] >= 0
+
+    assert records[dr.get_name(pfails)]["outcome"] == "error"
+    assert records[dr.get_name(pfails)]["output_bytes"] is None
+    assert records[dr.get_name(pcount)]["input_lines"] is None
+    assert profiler.top(1, key="wall")[0]["wall"] == max(r["wall"] for r in profiler.records)
+
+
+def test_exports():
+    profiler = Profiler(sizes=False, labels={"context": "test"})
+    _run(profiler)
+
+    stream = StringIO()
+    profiler.dump_json(stream)
+    doc = json.loads(stream.getvalue())
+    assert doc["labels"] == {"context": "test"}
+    assert len(doc["components"]) == 4
+    assert all(r["input_bytes"] is None for r in doc["components"])
+
+    stream = StringIO()
+    profiler.dump_chrome_trace(stream)
+    trace = json.loads(stream.getvalue())
+    events = dict((e["name"], e) for e in trace["traceEvents"])
+    assert events[dr.get_name(pcount)]["ph"] == "X"
+    assert events[dr.get_name(pcount)]["cat"] == dr.get_name(pstage)
+    assert trace["otherData"] == {"context": "test"}
+
+
+def test_output_size():
+    assert get_output_size(None) == 0
+    small = get_output_size([1])
+    assert get_output_size([1, [2, 3], {"a": "b"}]) > small
+
+
+def test_run_without_profiler():
+    broker = _run(None)
+    assert broker.profiler is None
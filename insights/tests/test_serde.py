@@ -1,7 +1,10 @@
 import os
 
+import pytest
+
 from tempfile import mkdtemp
 from insights import dr
+from insights.core import serde
 from insights.core.plugins import component
 from insights.core.serde import (serializer,
                                  deserializer,
@@ -215,3 +218,157 @@ def test_round_trip():
         pass
         if os.path.exists(tmp_path):
             fs.remove(tmp_path)
+
+
+@component()
+def other_thing():
+    return Foo()
+
+
+def test_round_trip_packed():
+    tmp_path = mkdtemp()
+    try:
+        h = Hydration(tmp_path, packed=True)
+
+        broker = dr.Broker()
+        broker[thing] = Foo()
+        broker[other_thing] = Foo()
+        broker.exec_times[thing] = 0.5
+        h.dehydrate(thing, broker)
+        h.dehydrate(other_thing, broker)
+        h.close()
+        assert os.path.exists(h.pack)
+        assert not os.path.exists(h.meta_data)
+
+        broker = Hydration(tmp_path).hydrate()
+        assert thing in broker and other_thing in broker
+        assert broker.exec_times[thing] >= 0.5
+        assert broker[thing].a == 1
+
+        broker = Hydration(tmp_path).hydrate(components=[other_thing])
+        assert thing not in broker
+        assert broker[other_thing].b == 2
+    finally:
+        if os.path.exists(tmp_path):
+            fs.remove(tmp_path)
+
+
+class Bar(object):
+    loads = 0
+
+    def __init__(self, ok=True):
+        self.ok = ok
+
+
+@serializer(Bar)
+def serialize_bar(obj, root=None):
+    return {"ok": obj.ok}
+
+
+@deserializer(Bar)
+def deserialize_bar(_type, data, root=None):
+    Bar.loads += 1
+    if not data["ok"]:
+        raise Exception("broken")
+    return Bar()
+
+
+@component()
+def good_bar():
+    return Bar()
+
+
+@component()
+def bad_bar():
+    return Bar(ok=False)
+
+
+@component(good_bar)
+def uses_good(bar):
+    return bar
+
+
+@component(bad_bar)
+def uses_bad(bar):
+    return bar
+
+
+def test_lazy_hydrate():
+    tmp_path = mkdtemp()
+    try:
+        h = Hydration(tmp_path)
+        broker = dr.Broker()
+        broker[good_bar] = Bar()
+        broker[bad_bar] = Bar(ok=False)
+        broker.exec_times[good_bar] = broker.exec_times[bad_bar] = 0.1
+        h.dehydrate(good_bar, broker)
+        h.dehydrate(bad_bar, broker)
+
+        Bar.loads = 0
+        broker = h.hydrate(lazy=True)
+        assert good_bar in broker and bad_bar in broker
+        assert Bar.loads == 0
+
+        broker = dr.run([uses_good, uses_bad], broker=broker)
+        assert Bar.loads == 2
+        assert isinstance(broker[uses_good], Bar)
+        assert broker[uses_good] is broker[good_bar]
+        assert bad_bar not in broker
+        assert uses_bad in broker.missing_requirements
+    finally:
+        if os.path.exists(tmp_path):
+            fs.remove(tmp_path)
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_round_trip_with_pool(packed):
+    concurrent = pytest.importorskip("concurrent.futures")
+    tmp_path = mkdtemp()
+    try:
+        h = Hydration(tmp_path, packed=packed)
+        broker = dr.Broker()
+        broker[thing] = Foo()
+        broker[other_thing] = Foo()
+        broker.exec_times[thing] = broker.exec_times[other_thing] = 0.5
+        h.dehydrate(thing, broker)
+        h.dehydrate(other_thing, broker)
+        h.close()
+
+        with concurrent.ThreadPoolExecutor(max_workers=2) as pool:
+            broker = Hydration(tmp_path, pool=pool).hydrate()
+        assert broker[thing].a == 1
+        assert broker[other_thing].b == 2
+    finally:
+        if os.path.exists(tmp_path):
+            fs.remove(tmp_path)
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_round_trip_msgpack(packed):
+    pytest.importorskip("msgpack")
+    tmp_path = mkdtemp()
+    try:
+        h = Hydration(tmp_path, packed=packed, encoding="msgpack")
+        broker = dr.Broker()
+        broker[thing] = Foo()
+        broker.exec_times[thing] = 0.5
+        h.dehydrate(thing, broker)
+        h.close()
+        if not packed:
+            assert os.listdir(h.meta_data) == [dr.get_name(thing) + ".msgpack"]
+
+        broker = Hydration(tmp_path).hydrate()
+        assert broker[thing].a == 1
+        assert broker.exec_times[thing] >= 0.5
+    finally:
+        if os.path.exists(tmp_path):
+            fs.remove(tmp_path)
+
+
+def test_msgpack_fallback(monkeypatch):
+    monkeypatch.setattr(serde, "msgpack", None)
+    assert Hydration(encoding="msgpack").ser_name == "json"
+    with pytest.raises(ValueError):
+        Hydration(encoding="yaml")
+    with pytest.raises(ValueError):
+        serde._decode(b"\x81\xa4name\xa3foo")
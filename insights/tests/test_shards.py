@@ -0,0 +1,169 @@
+import os
+import pytest
+
+from concurrent.futures import ProcessPoolExecutor
+
+from insights import dr, parser, rule, make_pass
+from insights.core import Parser
+from insights.core.context import HostArchiveContext
+from insights.core.plugins import datasource
+from insights.core.serde import marshal, unmarshal
+from insights.core.shards import _get_seed, _get_shards
+from insights.core.spec_factory import DatasourceProvider, simple_file
+
+shard_file = simple_file("/etc/shard_test", context=HostArchiveContext)
+
+
+@datasource(HostArchiveContext)
+def missing_file(broker):
+    raise dr.SkipComponent()
+
+
+@parser(shard_file)
+class ShardParser(Parser):
+    def parse_content(self, content):
+        self.words = [l.split() for l in content]
+
+
+@parser(missing_file)
+class MissingParser(Parser):
+    def parse_content(self, content):
+        self.data = content
+
+
+@datasource(HostArchiveContext)
+def counted(broker):
+    root = broker[HostArchiveContext].root
+    with open(os.path.join(root, "calls"), "a") as f:
+        f.write("%s\n" % os.getpid())
+    return DatasourceProvider("a b", relative_path="counted")
+
+
+@parser(counted)
+class FirstCounted(Parser):
+    def parse_content(self, content):
+        self.data = content
+
+
+@parser(counted)
+class SecondCounted(Parser):
+    def parse_content(self, content):
+        self.data = content
+
+
+@parser(shard_file)
+class FailingParser(Parser):
+    def parse_content(self, content):
+        with open(os.environ["SHARD_TEST_FAILED"], "a") as f:
+            f.write("%s\n" % os.getpid())
+        raise ValueError(os.getpid())
+
+
+@rule(ShardParser, optional=[MissingParser])
+def report(sp, mp):
+    return make_pass("SHARDS", words=sp.words)
+
+
+@rule(FirstCounted, SecondCounted)
+def counted_report(first, second):
+    return make_pass("COUNTED", data=first.data + second.data)
+
+
+def test_parser_serde_round_trip():
+    p = ShardParser.__new__(ShardParser)
+    p.words = [["a", "b"]]
+    p.file_path = "/etc/shard_test"
+    data, errors = marshal(p)
+    assert errors
+
+    data, errors = marshal(p, inherit=True)
+    assert not errors
+    assert data["type"] == dr.get_name(ShardParser)
+
+    with pytest.raises(Exception):
+        unmarshal(data)
+    result = unmarshal(data, inherit=True)
+    assert isinstance(result, ShardParser)
+    assert result.words == [["a", "b"]]
+
+
+def test_run_with_process_pool(tmpdir):
+    d = tmpdir / "etc"
+    d.mkdir()
+    (d / "shard_test").write("one two\nthree four\n")
+
+    fired = []
+    broker = dr.Broker()
+    broker[HostArchiveContext] = HostArchiveContext(root=tmpdir.strpath)
+    broker.add_observer(lambda c, b: fired.append(c))
+
+    graph = dr.get_dependency_graph(report)
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        broker = dr.run(graph, broker=broker, pool=pool)
+
+    assert isinstance(broker[ShardParser], ShardParser)
+    assert broker[ShardParser].words == [["one", "two"], ["three", "four"]]
+    assert MissingParser in broker.missing_requirements
+    assert broker[report] == make_pass("SHARDS", words=[["one", "two"], ["three", "four"]])
+    assert fired.count(ShardParser) == 1
+    assert ShardParser in broker.exec_times
+
+
+def test_shared_datasource_evaluated_once(tmpdir):
+    broker = dr.Broker()
+    broker[HostArchiveContext] = HostArchiveContext(root=tmpdir.strpath)
+
+    graph = dr.get_dependency_graph(counted_report)
+    graph.update(dr.get_dependency_graph(report))
+    plan = dr.compile_plan(graph)
+    shards = _get_shards(plan, broker, 4)
+    assert len(shards) == 3
+    assert set([FirstCounted, SecondCounted]) in [set(s) for s in shards]
+
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        broker = dr.run(graph, broker=broker, pool=pool)
+
+    assert broker[counted_report] == make_pass("COUNTED", data=["a b", "a b"])
+    assert len((tmpdir / "calls").readlines()) == 1
+    assert counted not in broker
+
+
+def test_seed_loads_only_graph_values():
+    loaded = []
+
+    def load(name):
+        loaded.append(name)
+        return name
+
+    broker = dr.Broker()
+    broker.set_lazy(shard_file, lambda: load("shard_file"))
+    broker.set_lazy(counted, lambda: load("counted"))
+    seed = _get_seed(dr.get_dependency_graph(ShardParser), broker)
+    assert seed == [(dr.get_name(shard_file), "shard_file")]
+    assert loaded == ["shard_file"]
+    assert isinstance(broker.instances[counted], dr.Lazy)
+
+
+def test_failed_parser_not_evaluated_again(tmpdir, monkeypatch):
+    monkeypatch.setenv("SHARD_TEST_FAILED", str(tmpdir / "failed"))
+    d = tmpdir / "etc"
+    d.mkdir()
+    (d / "shard_test").write("one two\n")
+
+    fired = []
+    broker = dr.Broker()
+    broker[HostArchiveContext] = HostArchiveContext(root=tmpdir.strpath)
+    broker.add_observer(lambda c, b: fired.append(c))
+
+    graph = dr.get_dependency_graph(FailingParser)
+    graph.update(dr.get_dependency_graph(report))
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        broker = dr.run(graph, broker=broker, pool=pool)
+
+    assert FailingParser not in broker
+    assert len((tmpdir / "failed").readlines()) == 1
+    [ex] = broker.exceptions[FailingParser]
+    assert isinstance(ex, ValueError) and ex.args[0] != os.getpid()
+    assert "parse_content" in broker.tracebacks[ex]
+    assert fired.count(FailingParser) == 1
+    assert broker[report] == make_pass("SHARDS", words=[["one", "two"]])
@@ -0,0 +1,41 @@
+from insights.core import filters
+from insights.core.context import HostContext
+from insights.core.spec_factory import RegistryPoint, SpecSet, TextFileProvider
+from insights.util import textfilter
+
+DATA = b"kernel: one\nsshd: two\nkernel: sshd three\ncron: four\n"
+
+
+class Specs(SpecSet):
+    kernel = RegistryPoint(filterable=True)
+    sshd = RegistryPoint(filterable=True)
+    everything = RegistryPoint()
+
+
+filters.add_filter(Specs.kernel, "kernel")
+filters.add_filter(Specs.sshd, ["sshd", "cron"])
+
+
+def _providers(path, ctx):
+    return [TextFileProvider(path, ctx=ctx, ds=ds) for ds in (Specs.kernel, Specs.sshd, Specs.everything)]
+
+
+def test_shared_read(tmpdir, monkeypatch):
+    path = tmpdir.join("messages")
+    path.write_binary(DATA)
+    expected = [p.content for p in _providers(str(path), None)]
+    assert expected[0] == ["kernel: one", "kernel: sshd three"]
+
+    reads = []
+    filter_file = textfilter.filter_file
+    monkeypatch.setattr(textfilter, "filter_file", lambda *a: reads.append(a) or filter_file(*a))
+    ctx = HostContext()
+    providers = _providers(str(path), ctx)
+    assert providers[1].content == expected[1]
+    assert providers[0].loaded
+    # unfiltered providers read the file on their own
+    assert not providers[2].loaded
+    assert [p.content for p in providers] == expected
+    assert len(reads) == 1
+    assert reads[0][0][0][:2] == ["grep", "-F"]
+    assert set(reads[0][0][0][2].split("\n")) == set(["kernel", "sshd", "cron"])
@@ -48,3 +48,53 @@ def test_raw_file():
     finally:
         if tmp_path and os.path.exists(tmp_path):
             fs.remove(tmp_path)
+
+
+class _Context(object):
+    fingerprints = True
+
+
+def test_fingerprint():
+    assert TextFileProvider(relative_path, root).fingerprint is None
+
+    before = TextFileProvider(relative_path, root, ctx=_Context())
+    assert len(before.fingerprint) == 2
+    assert not before.is_changed()
+    assert before.is_changed(root="/does/not/exist")
+
+    broker = dr.Broker()
+    broker[thing] = before
+
+    tmp_path = mkdtemp()
+    try:
+        hydra = Hydration(tmp_path)
+        hydra.dehydrate(thing, broker)
+        with open(os.path.join(tmp_path, "meta_data", dr.get_name(thing) + ".json")) as f:
+            assert root not in f.read()
+        after = hydra.hydrate()[thing]
+        assert tuple(after.fingerprint) == before.fingerprint
+        assert not after.is_changed(root=root)
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            fs.remove(tmp_path)
+
+
+def test_fingerprint_digest(tmpdir):
+    path = tmpdir.join("file")
+    path.write("one\n")
+    provider = TextFileProvider("file", tmpdir.strpath, ctx=_Context())
+    assert len(provider.fingerprint) == 2
+    assert provider.content == ["one"]
+    assert len(provider.fingerprint) == 3
+    assert not provider.is_changed()
+
+    # same size and mtime, different content
+    mtime = path.mtime()
+    path.write("two\n")
+    path.setmtime(mtime)
+    assert provider.is_changed()
+
+    unread = TextFileProvider("file", tmpdir.strpath, ctx=_Context())
+    path.write("six\n")
+    path.setmtime(mtime)
+    assert not unread.is_changed()
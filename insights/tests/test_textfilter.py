@@ -0,0 +1,115 @@
+import os
+import tempfile
+
+import pytest
+
+from insights.core.context import HostContext
+from insights.core.spec_factory import SAFE_ENV, CommandOutputProvider, TextFileProvider
+from insights.util import textfilter
+from insights.util.subproc import Pipeline
+
+CONTENT = [
+    b"",
+    b"no newline at the end",
+    b"first line\nsecond line\n",
+    b"one\ntwo\nthree\nfour",
+    b"password=secret\nhost=example.com\nuser=root\n\n\nlast password\n",
+    b"caf\xc3\xa9 \xff bytes\nplain\n",
+]
+
+STAGES = [
+    [["grep", "-F", "line"]],
+    [["grep", "-F", "password\nuser"]],
+    [["grep", "-F", "nothing matches"]],
+    [["grep", "-v", "-F", "password"]],
+    [["grep", "-v", "-F", "e"]],
+    [["sed", "-e", "s/example.com/keyword/g", "-e", "s/r..t/keyword/g"]],
+    [["grep", "-F", "o"], ["grep", "-v", "-F", "two"], ["sed", "-e", "s/o/keyword/g"]],
+    [["grep", "-F", "caf\xe9\nplain"]],
+]
+
+
+def _pipeline(stages, data):
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(data)
+        f.flush()
+        args = [list(stages[0]) + [f.name]] + stages[1:]
+        return Pipeline(*args, env=SAFE_ENV)(keep_rc=True)
+
+
+@pytest.mark.parametrize("stages", STAGES)
+@pytest.mark.parametrize("data", CONTENT)
+def test_same_as_pipeline(stages, data):
+    f = textfilter.get_filter(stages)
+    assert f is not None
+    assert f(data) == _pipeline(stages, data)
+
+
+def test_fallback():
+    assert textfilter.get_filter([["grep", "-F", "a\n\nb"]]) is None
+    assert textfilter.get_filter([["sed", "-e", "s/a.*b/keyword/g"]]) is None
+    assert textfilter.get_filter([["grep", "-E", "a|b"]]) is None
+
+    stages = [["grep", "-F", "a"]]
+    assert textfilter.get_filter(stages)(b"a\0b\n") is None
+
+    rc, out = textfilter.filter_output(stages, b"a\0b\nc\n", SAFE_ENV)
+    assert rc == 0
+    assert b"binary file" in out.lower()
+
+
+def test_disabled():
+    textfilter.ENABLED = False
+    try:
+        assert textfilter.get_filter([["grep", "-F", "a"]]) is None
+    finally:
+        textfilter.ENABLED = True
+
+
+def test_text_file_provider(tmpdir):
+    path = tmpdir.join("messages")
+    path.write_binary(b"kernel: one\nsshd: two\nkernel: three")
+    provider = TextFileProvider(str(path), ctx=HostContext())
+    args = [["grep", "-F", "kernel", str(path)]]
+    provider.create_args = lambda: args
+
+    assert provider.content == ["kernel: one", "kernel: three"]
+    assert provider.rc == 0
+    assert list(provider.stream()) == provider.content
+
+    dst = str(tmpdir.join("out"))
+    provider.write(dst)
+    with open(dst, "rb") as f:
+        assert (0, f.read()) == Pipeline(*args, env=SAFE_ENV)(keep_rc=True)
+
+
+def test_command_output_provider(tmpdir):
+    ctx = HostContext()
+    provider = CommandOutputProvider("/bin/echo -e 'a\\nb\\nab'", ctx, keep_rc=True)
+    provider.create_args = lambda: [["/bin/echo", "a\nb\nab"], ["grep", "-F", "a"]]
+    assert provider.content == ["a", "ab"]
+    assert provider.rc == 0
+
+    dst = str(tmpdir.join("out"))
+    assert provider.write(dst) == 0
+    with open(dst) as f:
+        assert f.read() == "a\nab\n"
+
+    provider = CommandOutputProvider("/bin/echo a", ctx)
+    provider.create_args = lambda: [["/bin/echo", "a"], ["grep", "-F", "b"]]
+    dst = str(tmpdir.join("missing"))
+    with pytest.raises(Exception):
+        provider.write(dst)
+    assert not os.path.exists(dst)
+
+
+class OldContext(HostContext):
+    def check_output(self, cmd, timeout=None, keep_rc=False, env=None, signum=None):
+        return super(OldContext, self).check_output(cmd, timeout=timeout, keep_rc=keep_rc, env=env, signum=signum)
+
+
+def test_command_output_provider_old_context():
+    provider = CommandOutputProvider("/bin/echo a", OldContext(), keep_rc=True)
+    provider.create_args = lambda: [["/bin/echo", "a\nb\nab"], ["grep", "-F", "a"]]
+    assert provider.content == ["a", "ab"]
+    assert provider.rc == 0
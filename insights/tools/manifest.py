@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+"""
+Write a manifest of the default plugins and any others given with ``-p`` so
+``insights-run --manifest`` can import only the modules a run needs instead
+of every module in the default packages.
+"""
+import argparse
+import json
+import sys
+
+from insights import dr, get_nvr, load_default_plugins, parse_plugins
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Generate a component manifest for fast startup.")
+    p.add_argument("-p",
+                   "--plugins",
+                   default="",
+                   help="Comma separated list of package(s) or module(s) containing plugins.")
+    p.add_argument("-o", "--output", help="File to write. Defaults to stdout.")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    load_default_plugins()
+    for p in ["insights.parsers", "insights.combiners"] + parse_plugins(args.plugins):
+        dr.load_components(p, continue_on_error=False)
+
+    manifest = dr.generate_manifest()
+    manifest["nvr"] = get_nvr()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(manifest, f, sort_keys=True)
+    else:
+        json.dump(manifest, sys.stdout, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Glob expansion that reads each directory once with ``os.scandir`` and
+remembers what it found. :func:`iglob` matches the same paths as
+:func:`glob.glob`, but a :class:`DirCache` shared by the datasources of an
+execution context lets patterns that walk the same directories reuse each
+other's listings, and whether a match is a directory comes from the listing
+instead of another ``stat``.
+"""
+import fnmatch
+import os
+import re
+import threading
+
+_MAGIC = re.compile(r"[*?[]")
+
+
+def has_magic(s):
+    return _MAGIC.search(s) is not None
+
+
+def _scan(path):
+    """ Returns a list of ``(name, is_dir)`` for the entries in ``path``. """
+    if hasattr(os, "scandir"):
+        entries = []
+        for e in os.scandir(path):
+            try:
+                is_dir = e.is_dir()
+            except OSError:
+                is_dir = False
+            entries.append((e.name, is_dir))
+        return entries
+    return [(n, os.path.isdir(os.path.join(path, n))) for n in os.listdir(path)]
+
+
+class DirCache(object):
+    """
+    Directory listings keyed by path. Listings of directories that can't be
+    read are cached as empty. :meth:`lexists` and :meth:`isdir` aren't
+    cached.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def listdir(self, path):
+        """ Returns the ``(name, is_dir)`` entries of ``path``. """
+        path = path or os.curdir
+        entries = self._entries.get(path)
+        if entries is None:
+            try:
+                entries = _scan(path)
+            except (OSError, IOError):
+                entries = []
+            with self._lock:
+                entries = self._entries.setdefault(path, entries)
+        return entries
+
+    lexists = staticmethod(os.path.lexists)
+    isdir = staticmethod(os.path.isdir)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __reduce__(self):
+        return (DirCache, ())
+
+
+def _glob1(cache, dirname, pattern, dironly):
+    entries = cache.listdir(dirname)
+    if pattern[0] != ".":
+        entries = [e for e in entries if e[0][0] != "."]
+    if dironly:
+        entries = [e for e in entries if e[1]]
+    names = set(fnmatch.filter([n for n, _ in entries], pattern))
+    return [e for e in entries if e[0] in names]
+
+
+def _glob0(cache, dirname, basename):
+    if not basename:
+        if cache.isdir(dirname):
+            return [(basename, True)]
+    elif cache.lexists(os.path.join(dirname, basename)):
+        return [(basename, None)]
+    return []
+
+
+def _iglob(cache, pattern, dironly):
+    dirname, basename = os.path.split(pattern)
+    if not has_magic(pattern):
+        if basename:
+            if cache.lexists(pattern):
+                yield pattern, None
+        elif cache.isdir(dirname):
+            yield pattern, True
+        return
+
+    if not dirname:
+        for name, is_dir in _glob1(cache, dirname, basename, dironly):
+            yield name, is_dir
+        return
+
+    if dirname != pattern and has_magic(dirname):
+        dirs = (d for d, _ in _iglob(cache, dirname, True))
+    else:
+        dirs = [dirname]
+
+    for d in dirs:
+        if has_magic(basename):
+            matches = _glob1(cache, d, basename, dironly)
+        else:
+            matches = _glob0(cache, d, basename)
+        for name, is_dir in matches:
+            yield os.path.join(d, name), is_dir
+
+
+def iglob(pattern, cache=None):
+    """
+    Yields ``(path, is_dir)`` for the paths matching ``pattern`` like
+    :func:`glob.iglob`. ``is_dir`` is ``None`` when the listing didn't say,
+    which is the case for paths without wildcards.
+
+    Args:
+        pattern (str): the glob pattern. ``**`` matches like ``*``.
+        cache (DirCache): listings to reuse. A new one is used if ``None``.
+    """
+    return _iglob(cache if cache is not None else DirCache(), pattern, False)
+
+
+def glob(pattern, cache=None):
+    """ Returns the paths matching ``pattern`` like :func:`glob.glob`. """
+    return [p for p, _ in iglob(pattern, cache)]
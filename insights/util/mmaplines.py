@@ -0,0 +1,200 @@
+"""
+A read only sequence of the lines in a file that's backed by ``mmap``. Lines
+are decoded only when they're accessed, so scanning a large log file with a
+:class:`MappedLines` takes about the same memory no matter how big the file
+is. The offsets of the lines are indexed the first time ``len()``, indexing,
+or slicing needs them. Iteration and :meth:`MappedLines.find` don't need the
+index.
+
+:class:`insights.core.spec_factory.TextFileProvider` returns
+:class:`MappedLines` as the content of files of at least :data:`THRESHOLD`
+bytes. ``insights-run --mmap-threshold BYTES`` sets it. Files of a running
+host are copied to a temporary file first, since truncating a mapped file
+kills the process. Parsers that iterate over their content, index it, or
+slice it work unchanged. Parsers that modify their content, or test for it
+with ``isinstance(content, list)``, don't.
+"""
+import mmap
+import os
+import six
+from array import array
+
+try:
+    from six.moves import collections_abc
+except ImportError:
+    import collections as collections_abc
+
+THRESHOLD = None
+"""
+int: files of at least this many bytes are loaded as :class:`MappedLines`.
+``None`` turns mapping off.
+"""
+
+NEWLINES = (b"\r",)
+""" tuple: files containing any of these aren't mapped since they're line boundaries in text mode. """
+
+SPLITLINES = NEWLINES + (b"\x0b", b"\x0c", b"\x1c", b"\x1d", b"\x1e",
+                         b"\xc2\x85", b"\xe2\x80\xa8", b"\xe2\x80\xa9")
+""" tuple: the line boundaries of ``str.splitlines`` other than ``\\n``. """
+
+_ERRORS = "surrogateescape" if six.PY3 else "replace"
+_INDEX_TYPE = "Q" if six.PY3 else "L"
+
+
+class MappedLines(collections_abc.Sequence):
+    """
+    The lines of the file ``f`` without their trailing newlines.
+
+    Args:
+        f (file): a file opened in binary mode. It can be closed afterward. A
+            :func:`tempfile.TemporaryFile` is fine since the mapping keeps
+            its data around.
+        errors (str): how to handle bytes that aren't valid utf-8.
+    """
+    def __init__(self, f, errors=_ERRORS):
+        self.errors = errors
+        self.path = getattr(f, "name", None)
+        if not isinstance(self.path, six.string_types):
+            self.path = None
+
+        f.seek(0, os.SEEK_END)
+        self._size = f.tell()
+        self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._size else b""
+        self._index = None
+        self._slice = None
+
+    def _view(self, start, stop, step):
+        view = MappedLines.__new__(MappedLines)
+        view.errors = self.errors
+        view.path = self.path
+        view._size = self._size
+        view._mm = self._mm
+        view._index = self._get_index()
+        view._slice = (start, stop, step)
+        return view
+
+    def _get_index(self):
+        if self._index is None:
+            index = array(_INDEX_TYPE, [0])
+            mm, size = self._mm, self._size
+            pos = mm.find(b"\n")
+            while pos != -1 and pos + 1 < size:
+                index.append(pos + 1)
+                pos = mm.find(b"\n", pos + 1)
+            if not size:
+                index.pop()
+            self._index = index
+        return self._index
+
+    def _range(self):
+        if self._slice is None:
+            return six.moves.range(len(self._get_index()))
+        return six.moves.range(*self._slice)
+
+    def _get_line(self, n):
+        index, mm, size = self._index, self._mm, self._size
+        start = index[n]
+        if n + 1 < len(index):
+            end = index[n + 1] - 1
+        else:
+            end = size - 1 if mm[size - 1:size] == b"\n" else size
+        return self._mm[start:end].decode("utf-8", self.errors)
+
+    def __len__(self):
+        return len(self._range())
+
+    def __bool__(self):
+        return bool(self._size) if self._slice is None else len(self) > 0
+
+    __nonzero__ = __bool__
+
+    def __getitem__(self, key):
+        r = self._range()
+        if isinstance(key, slice):
+            a, b, c = key.indices(len(r))
+            start, _, step = self._slice or (0, None, 1)
+            return self._view(start + a * step, start + b * step, step * c)
+        return self._get_line(r[key])
+
+    def __iter__(self):
+        if self._slice is not None:
+            for n in self._range():
+                yield self._get_line(n)
+            return
+
+        mm, size, errors = self._mm, self._size, self.errors
+        start = 0
+        while start < size:
+            end = mm.find(b"\n", start)
+            if end == -1:
+                end = size
+            yield mm[start:end].decode("utf-8", errors)
+            start = end + 1
+
+    def __reversed__(self):
+        return iter(self[::-1])
+
+    def __contains__(self, line):
+        return any(l == line for l in self.find(line))
+
+    def __eq__(self, other):
+        if isinstance(other, (MappedLines, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def find(self, s):
+        """
+        Yields the lines that contain ``s``. The file is searched for ``s``
+        directly, so lines without it aren't decoded.
+        """
+        if self._slice is not None or not s:
+            for line in self:
+                if s in line:
+                    yield line
+            return
+
+        needle = s.encode("utf-8", self.errors) if isinstance(s, six.text_type) else s
+        if b"\n" in needle:
+            return
+        mm, size, errors = self._mm, self._size, self.errors
+        pos = mm.find(needle)
+        while pos != -1:
+            start = mm.rfind(b"\n", 0, pos) + 1
+            end = mm.find(b"\n", pos + len(needle))
+            if end == -1:
+                end = size
+            yield mm[start:end].decode("utf-8", errors)
+            if end >= size:
+                return
+            pos = mm.find(needle, end + 1)
+
+    def __reduce__(self):
+        if self.path is None or self._slice is not None:
+            return (list, (list(self),))
+        return (map_file, (self.path, self.errors))
+
+    def __repr__(self):
+        return "<MappedLines(path=%r, bytes=%d)>" % (self.path, self._size)
+
+
+def map_lines(f, errors=_ERRORS, newlines=NEWLINES):
+    """
+    Returns :class:`MappedLines` for the file object ``f`` or ``None`` if the
+    file contains any of ``newlines``, which would split lines differently.
+    """
+    lines = MappedLines(f, errors=errors)
+    if any(lines._mm.find(n) != -1 for n in newlines):
+        return None
+    return lines
+
+
+def map_file(path, errors=_ERRORS, newlines=NEWLINES):
+    """ Returns :func:`map_lines` for the file at ``path``. """
+    with open(path, "rb") as f:
+        return map_lines(f, errors=errors, newlines=newlines)
@@ -0,0 +1,169 @@
+"""
+A file of named records that can be read in any order. Each record is
+compressed by itself, and an index of where the records are is written at the
+end of the file when it's closed, so reading a record doesn't read any of the
+others. The complete records of a file that was never closed can still be
+read. They're found from the record headers instead of the index.
+
+The layout is :data:`MAGIC`, the records, the index, and a trailer. A record
+is a header with the lengths of its name and data, the name in UTF-8, and the
+data compressed with zlib. The index is a record with an empty name whose data
+is a JSON object of record names to their data offsets and lengths. The
+trailer is the offset of the index record followed by :data:`END`. A name
+added more than once refers to its last record.
+"""
+import json
+import os
+import struct
+import threading
+import zlib
+
+MAGIC = b"INSIGHTS-PACK-1\n"
+END = b"\nINSIGHTS-PACK-END"
+
+_HEADER = struct.Struct(">HI")
+_OFFSET = struct.Struct(">Q")
+_TRAILER_SIZE = _OFFSET.size + len(END)
+
+
+class PackWriter(object):
+    """
+    Writes records to a new file at ``path``. :meth:`close` writes the index.
+
+    Args:
+        path (str): the file to create.
+        level (int): the zlib compression level of the records.
+    """
+    def __init__(self, path, level=6):
+        self.path = path
+        self.level = level
+        self._index = {}
+        self._lock = threading.Lock()
+        self._f = open(path, "wb")
+        self._f.write(MAGIC)
+
+    def _write(self, name, data):
+        name = name.encode("utf-8")
+        data = zlib.compress(data, self.level)
+        offset = self._f.tell()
+        self._f.write(_HEADER.pack(len(name), len(data)))
+        self._f.write(name)
+        self._f.write(data)
+        return offset, offset + _HEADER.size + len(name), len(data)
+
+    def add(self, name, data):
+        """ Adds a record of the bytes ``data`` named ``name``. """
+        if not name:
+            raise ValueError("Records must have a name.")
+        with self._lock:
+            _, offset, length = self._write(name, data)
+            self._index[name] = [offset, length]
+
+    def close(self):
+        """ Writes the index and closes the file. """
+        with self._lock:
+            if self._f.closed:
+                return
+            index = json.dumps(self._index).encode("utf-8")
+            offset, _, _ = self._write(u"", index)
+            self._f.write(_OFFSET.pack(offset))
+            self._f.write(END)
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class PackReader(object):
+    """
+    Reads the records of a file written by :class:`PackWriter`.
+
+    Args:
+        path (str): the file to read.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._f = open(path, "rb")
+        try:
+            if self._f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s isn't a pack file." % path)
+            self._index = self._read_index()
+            if self._index is None:
+                self._index = self._scan()
+        except Exception:
+            self._f.close()
+            raise
+
+    def _read_header(self, offset):
+        self._f.seek(offset)
+        header = self._f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return None
+        name_len, data_len = _HEADER.unpack(header)
+        name = self._f.read(name_len)
+        if len(name) < name_len:
+            return None
+        return name.decode("utf-8"), offset + _HEADER.size + name_len, data_len
+
+    def _read_index(self):
+        size = os.fstat(self._f.fileno()).st_size
+        if size < len(MAGIC) + _TRAILER_SIZE:
+            return None
+        self._f.seek(size - _TRAILER_SIZE)
+        trailer = self._f.read(_TRAILER_SIZE)
+        if not trailer.endswith(END):
+            return None
+        header = self._read_header(_OFFSET.unpack(trailer[:_OFFSET.size])[0])
+        if header is None or header[0]:
+            return None
+        _, offset, length = header
+        self._f.seek(offset)
+        return json.loads(zlib.decompress(self._f.read(length)).decode("utf-8"))
+
+    def _scan(self):
+        index = {}
+        size = os.fstat(self._f.fileno()).st_size
+        offset = len(MAGIC)
+        while True:
+            header = self._read_header(offset)
+            if header is None:
+                break
+            name, data_offset, length = header
+            if not name or data_offset + length > size:
+                break
+            index[name] = [data_offset, length]
+            offset = data_offset + length
+        return index
+
+    def names(self):
+        """ Returns the names of the records. """
+        return list(self._index)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def read(self, name):
+        """ Returns the data of the record named ``name``. """
+        offset, length = self._index[name]
+        with self._lock:
+            self._f.seek(offset)
+            data = self._f.read(length)
+        return zlib.decompress(data)
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
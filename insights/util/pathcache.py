@@ -0,0 +1,84 @@
+"""
+Caches the existence, resolved path, and readability of paths so the
+providers of many datasources can check the same paths without asking the
+file system each time. Each :class:`insights.core.context.ExecutionContext`
+has a :class:`PathCache` in its ``path_cache`` attribute.
+
+Archive contexts already know their regular files from ``all_files``. Those
+exist and, since ``all_files`` doesn't follow symlinks, resolve to the same
+path under the resolved root, so they're answered without any system calls.
+"""
+import os
+
+
+class PathCache(object):
+    """
+    Args:
+        root (str): root of the context.
+        files (list): regular files under ``root`` found without following
+            symlinks, like ``ExecutionContext.all_files``.
+    """
+    def __init__(self, root=None, files=None):
+        self.root = root.rstrip(os.sep) if root else None
+        self._file_list = files
+        self._files = None
+        self._exists = {}
+        self._realpath = {}
+        self._access = {}
+
+    def _is_known(self, path):
+        if not self._file_list:
+            return False
+        if self._files is None:
+            self._files = frozenset(self._file_list)
+        return path in self._files
+
+    def exists(self, path):
+        """ Cached :func:`os.path.exists`. """
+        if self._is_known(path):
+            return True
+        result = self._exists.get(path)
+        if result is None:
+            result = self._exists[path] = os.path.exists(path)
+        return result
+
+    def realpath(self, path):
+        """ Cached :func:`os.path.realpath`. """
+        result = self._realpath.get(path)
+        if result is None:
+            if self.root and path.startswith(self.root + os.sep) and self._is_known(path):
+                result = self.realpath(self.root) + path[len(self.root):]
+            else:
+                result = os.path.realpath(path)
+            self._realpath[path] = result
+        return result
+
+    def access(self, path, mode=os.R_OK):
+        """ Cached :func:`os.access`. """
+        key = (path, mode)
+        result = self._access.get(key)
+        if result is None:
+            result = self._access[key] = os.access(path, mode)
+        return result
+
+    def clear(self):
+        """ Forgets everything but the files it was created with. """
+        self._exists.clear()
+        self._realpath.clear()
+        self._access.clear()
+
+    def __reduce__(self):
+        return (PathCache, (self.root, self._file_list))
+
+
+class _Uncached(object):
+    """ Asks the file system every time. Used when there's no context. """
+    exists = staticmethod(os.path.exists)
+    realpath = staticmethod(os.path.realpath)
+
+    @staticmethod
+    def access(path, mode=os.R_OK):
+        return os.access(path, mode)
+
+
+UNCACHED = _Uncached()
@@ -186,7 +186,8 @@ def call(cmd,
     keep_rc: bool
         Whether to return the exit code along with the output
     encoding: str
-        unicode decoding scheme to use. Default is "utf-8"
+        unicode decoding scheme to use. Default is "utf-8". If None, the
+        output is returned as bytes.
     env: dict
         The environment in which to execute commands. Default is os.environ
 
@@ -211,6 +212,7 @@ def call(cmd,
 
     if keep_rc:
         rc, output = res
-        output = output.decode(encoding, 'ignore')
+        if encoding:
+            output = output.decode(encoding, 'ignore')
         return rc, output
-    return res.decode(encoding, "ignore")
+    return res.decode(encoding, "ignore") if encoding else res
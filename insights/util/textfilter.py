@@ -0,0 +1,252 @@
+"""
+Filters content the way :mod:`insights.core.spec_factory` does with pipelines
+of ``grep -F``, ``grep -v -F``, and ``sed -e s/<keyword>/keyword/g``, but
+without starting any processes.
+
+The output and return code are the same as the pipeline's when it runs with
+``LC_ALL=C``: lines are matched as bytes, a last line without a newline gets
+one from ``grep``, and the return code is that of the last stage. Stages or
+content that can't be handled exactly are run through the real commands
+instead: keywords that use regular expression features other than ``.``,
+content with NUL bytes, which ``grep`` treats as binary, and content larger
+than :data:`MAX_SIZE`, for which ``grep`` is faster.
+"""
+import os
+import re
+import six
+import tempfile
+from subprocess import Popen, PIPE, STDOUT
+
+ENABLED = True
+""" bool: filter in process when possible. Set to ``False`` to always use the commands. """
+
+MAX_SIZE = 16 * 1024 * 1024
+""" int: content larger than this many bytes is filtered by the commands. """
+
+_SED_EXPR = re.compile(r"^s/(.*)/keyword/g$", re.DOTALL)
+_CACHE = {}
+
+
+def _to_bytes(s):
+    if isinstance(s, six.binary_type):
+        return s
+    if hasattr(os, "fsencode"):
+        return os.fsencode(s)
+    return s.encode("utf-8")
+
+
+def _get_patterns(arg):
+    """
+    Splits a ``grep -F`` pattern argument into its patterns. Returns ``None``
+    for empty patterns since they match every line.
+    """
+    patterns = [_to_bytes(p) for p in arg.split("\n")]
+    if not all(patterns):
+        return None
+    return patterns
+
+
+def _get_keyword(expr):
+    """
+    Returns a bytes regex for the keyword in a ``s/<keyword>/keyword/g`` sed
+    expression or ``None`` if it uses anything but literal characters and
+    ``.``.
+    """
+    m = _SED_EXPR.match(expr)
+    if not m:
+        return None
+    kw = m.group(1).replace("\\/", "/")
+    if not kw or any(c in kw for c in "\\[*^$\n"):
+        return None
+    parts = [b"." if c == "." else re.escape(_to_bytes(c)) for c in kw]
+    return re.compile(b"".join(parts))
+
+
+def _search(patterns, data):
+    present = [p for p in patterns if p in data]
+    if present:
+        return re.compile(b"|".join(re.escape(p) for p in present)).search
+
+
+class _Grep(object):
+    def __init__(self, patterns, invert=False):
+        self.patterns = patterns
+        self.invert = invert
+
+    def __call__(self, data):
+        search = _search(self.patterns, data)
+        size = len(data)
+        pieces = []
+        pos = 0
+        while pos < size:
+            m = search(data, pos) if search else None
+            if not m:
+                if self.invert:
+                    pieces.append(data[pos:])
+                break
+            start = data.rfind(b"\n", pos, m.start())
+            start = pos if start == -1 else start + 1
+            end = data.find(b"\n", m.end())
+            end = size if end == -1 else end
+            pieces.append(data[start:end + 1] if not self.invert else data[pos:start])
+            pos = end + 1
+
+        out = b"".join(pieces)
+        if out and not out.endswith(b"\n"):
+            out += b"\n"
+        return (0 if out else 1), out
+
+
+class _Sed(object):
+    def __init__(self, keywords):
+        self.keywords = keywords
+
+    def __call__(self, data):
+        for kw in self.keywords:
+            data = kw.sub(b"keyword", data)
+        return 0, data
+
+
+def _compile_stage(args):
+    if len(args) == 3 and args[:2] == ["grep", "-F"]:
+        patterns = _get_patterns(args[2])
+        return _Grep(patterns) if patterns else None
+
+    if len(args) == 4 and args[:3] == ["grep", "-v", "-F"]:
+        patterns = _get_patterns(args[3])
+        return _Grep(patterns, invert=True) if patterns else None
+
+    if len(args) > 1 and len(args) % 2 and args[0] == "sed":
+        keywords = []
+        for flag, expr in zip(args[1::2], args[2::2]):
+            kw = _get_keyword(expr) if flag == "-e" else None
+            if kw is None:
+                return None
+            keywords.append(kw)
+        return _Sed(keywords)
+
+
+class TextFilter(object):
+    """
+    The compiled stages of a filter pipeline. Use :func:`get_filter` to
+    create one.
+    """
+    def __init__(self, stages):
+        self.stages = stages
+
+    def __call__(self, data):
+        """
+        Returns the ``(rc, output)`` of filtering ``data`` or ``None`` if it
+        must be filtered by the commands.
+        """
+        if len(data) > MAX_SIZE or b"\0" in data:
+            return None
+        rc = 0
+        for stage in self.stages:
+            rc, data = stage(data)
+        return rc, data
+
+
+def get_filter(stages):
+    """
+    Returns a :class:`TextFilter` equivalent to the ``grep`` and ``sed``
+    commands in ``stages`` or ``None`` if it can't be done exactly or
+    in-process filtering is disabled.
+    """
+    if not ENABLED or not stages:
+        return None
+
+    key = tuple(tuple(s) for s in stages)
+    if key not in _CACHE:
+        compiled = [_compile_stage(s) for s in stages]
+        _CACHE[key] = TextFilter(compiled) if all(compiled) else None
+    return _CACHE[key]
+
+
+def filter_file(args, path):
+    """
+    Filters the file at ``path`` the way the pipeline ``args`` from
+    ``TextFileProvider.create_args`` would.
+
+    Returns:
+        (rc, output) with output as bytes, or ``None`` if the pipeline must be
+        run instead.
+    """
+    if not args or not args[0] or args[0][-1] != path:
+        return None
+
+    stages = [args[0][:-1]] + args[1:]
+    f = get_filter(stages)
+    if f is None:
+        return None
+
+    try:
+        if os.path.getsize(path) > MAX_SIZE:
+            return None
+        with open(path, "rb") as fp:
+            data = fp.read()
+    except (IOError, OSError):
+        return None
+    return f(data)
+
+
+def _pipe(stages, stdin, stdout, env):
+    """ Runs the stages as processes connected by pipes. Returns the last rc. """
+    procs = []
+    for i, args in enumerate(stages):
+        last = i == len(stages) - 1
+        p = Popen(args, stdin=stdin, stdout=stdout if last else PIPE, stderr=STDOUT, env=env)
+        if procs:
+            procs[-1].stdout.close()
+        procs.append(p)
+        stdin = p.stdout
+    rc = procs[-1].wait()
+    for p in procs[:-1]:
+        p.wait()
+    return rc
+
+
+def filter_output(stages, data, env):
+    """
+    Filters the output of a command the way piping it into ``stages`` would.
+
+    Returns:
+        (rc, output) with output as bytes.
+    """
+    f = get_filter(stages)
+    result = f(data) if f is not None else None
+    if result is not None:
+        return result
+
+    with tempfile.TemporaryFile() as src:
+        src.write(data)
+        src.seek(0)
+        with tempfile.TemporaryFile() as dst:
+            rc = _pipe(stages, src, dst, env)
+            dst.seek(0)
+            return rc, dst.read()
+
+
+def filter_to_file(stages, src, dst, env):
+    """
+    Writes the content of the file object ``src`` filtered by ``stages`` to
+    the file object ``dst``. Content too large to filter in process is
+    streamed through the commands.
+
+    Returns:
+        int: the return code of the pipeline.
+    """
+    src.seek(0, os.SEEK_END)
+    size = src.tell()
+    src.seek(0)
+
+    f = get_filter(stages)
+    result = f(src.read()) if f is not None and size <= MAX_SIZE else None
+    if result is not None:
+        rc, out = result
+        dst.write(out)
+        return rc
+
+    src.seek(0)
+    dst.flush()
+    return _pipe(stages, src, dst, env)
@@ -17,6 +17,7 @@ entry_points = {
         'insights-cat = insights.tools.cat:main',
         'insights-dupkeycheck = insights.tools.dupkeycheck:main',
         'insights-inspect = insights.tools.insights_inspect:main',
+        'insights-manifest = insights.tools.manifest:main',
         'insights-info = insights.tools.query:main',
         'insights-ocpshell= insights.ocpshell:main',
         'mangle = insights.util.mangle:main'
@@ -100,6 +101,7 @@ linting = set([
 ])
 
 optional = set([
+    'msgpack',
     'python-cjson',
     'python-logstash',
     'python-statsd',